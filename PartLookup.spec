@@ -1,4 +1,8 @@
 # -*- mode: python ; coding: utf-8 -*-
+# Builds the folder layout: dist/PartLookup/PartLookup.exe next to its
+# libraries. A --onefile exe unpacks the whole bundle to a temporary folder
+# on every start before the window can appear; this layout starts directly.
+# Copy the whole dist/PartLookup folder, with AirDataDatabase next to the exe.
 
 
 a = Analysis(
@@ -6,11 +10,12 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['lookup_server'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # openpyxl can use these when they are installed; the lookup never does
+    excludes=['numpy', 'pandas', 'PIL', 'lxml', 'defusedxml', 'unittest', 'pydoc', 'test'],
     noarchive=False,
     optimize=0,
 )
@@ -19,16 +24,14 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='PartLookup',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    # UPX-packed libraries are decompressed on every start
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +39,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='PartLookup',
+)
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# Benchmark for the part lookup: generates synthetic DBF files and xlsx
+# workbooks shaped like the AirDataDatabase tables, then measures parse
+# time, peak memory, index build time and search latency.
+#
+#   python benchmark_lookup.py --sizes 10000 100000 1000000 --output bench.json
+#   python benchmark_lookup.py --compare bench.json
+#
+# It also times a cold start: importing the module in a fresh interpreter
+# and answering one part number in batch mode.
+import sys
+import os
+import argparse
+import json
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import offline_part_lookup as lookup
+from offline_part_lookup import DBFReader, ExcelReader, PartIndex, find_matches
+
+# Table shapes: (name, type, length, decimals)
+TABLES = {
+    'INVENT.DBF': [('PARTNO', 'C', 20, 0), ('DESCRIP', 'C', 30, 0), ('QTY', 'N', 8, 0),
+                   ('COST', 'N', 10, 2), ('LOCATION', 'C', 10, 0), ('CONDITION', 'C', 4, 0),
+                   ('VENDOR', 'C', 10, 0)],
+    'POITEM.DBF': [('PONUMBER', 'C', 8, 0), ('PARTNO', 'C', 20, 0), ('DESCRIP', 'C', 30, 0),
+                   ('QTY', 'N', 8, 0), ('COST', 'N', 10, 2), ('PODATE', 'D', 8, 0)],
+    'BUYQUOTE.DBF': [('PARTNO', 'C', 20, 0), ('VENDOR', 'C', 10, 0), ('PRICE', 'N', 10, 2),
+                     ('QTY', 'N', 8, 0), ('QUOTEDATE', 'D', 8, 0)],
+}
+EXCEL_HEADERS = ['PART NUMBER', 'DESCRIPTION', 'QTY', 'LOCATION', 'CONDITION']
+
+DESCRIPTIONS = ['WASHER FLAT', 'BOLT HEX', 'NUT SELF LOCKING', 'O-RING', 'VALVE ASSY',
+                'BEARING', 'SEAL', 'BRACKET', 'FITTING', 'CLAMP LOOP']
+CONDITIONS = ['NE', 'NS', 'OH', 'SV', 'AR']
+
+# Query kinds measured against every generated file
+QUERY_KINDS = ('exact', 'prefix', 'substring', 'no_hit')
+
+def part_number(rng):
+    # Part numbers in the shapes found in the real tables
+    shape = rng.randrange(5)
+    if shape == 0:
+        return f"MS{rng.randint(20000, 29999)}-{rng.choice('ABC')}{rng.randint(1, 99)}"
+    if shape == 1:
+        return f"AN{rng.randint(3, 960)}-{rng.randint(3, 40)}{rng.choice(['', 'A', 'C'])}"
+    if shape == 2:
+        return f"NAS{rng.randint(1000, 1999)}{rng.choice('CF')}{rng.randint(1, 999):04d}P"
+    if shape == 3:
+        return f"{rng.randint(100000, 999999)}-{rng.randint(1, 99):02d}"
+    return f"S{rng.randint(100, 999)}T{rng.randint(100, 999)}-{rng.randint(1, 200)}"
+
+def field_value(rng, name, field_type, length, decimals, part):
+    if name == 'PARTNO':
+        return part
+    if field_type == 'N':
+        if decimals:
+            return f"{rng.uniform(0, 5000):.{decimals}f}"
+        return str(rng.randint(0, 500))
+    if field_type == 'D':
+        return f"{rng.randint(1995, 2024)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+    if name == 'DESCRIP':
+        return rng.choice(DESCRIPTIONS)
+    if name == 'CONDITION':
+        return rng.choice(CONDITIONS)
+    if name == 'PONUMBER':
+        return str(rng.randint(10000, 99999))
+    return f"{name[:1]}{rng.randint(1, 999)}"
+
+def write_dbf(path, fields, count, parts, seed=0, deleted_every=50):
+    # dBase III file with count records; one record in deleted_every is
+    # marked deleted. Records are written in blocks to keep memory flat.
+    rng = random.Random(seed)
+    record_len = 1 + sum(length for _, _, length, _ in fields)
+    header_len = 32 + 32 * len(fields) + 1
+    today = time.localtime()
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<BBBBIHH20x', 3, today.tm_year - 1900, today.tm_mon, today.tm_mday,
+                            count, header_len, record_len))
+        for name, field_type, length, decimals in fields:
+            f.write(struct.pack('<11sc4xBB14x', name.encode('ascii'), field_type.encode('ascii'),
+                                length, decimals))
+        f.write(b'\r')
+
+        block = []
+        for i in range(count):
+            part = parts[rng.randrange(len(parts))]
+            record = [b'*' if deleted_every and i % deleted_every == deleted_every - 1 else b' ']
+            for name, field_type, length, decimals in fields:
+                value = field_value(rng, name, field_type, length, decimals, part).encode('ascii')[:length]
+                record.append(value.rjust(length) if field_type == 'N' else value.ljust(length))
+            block.append(b''.join(record))
+            if len(block) >= 10000:
+                f.write(b''.join(block))
+                block = []
+        f.write(b''.join(block))
+        f.write(b'\x1a')
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def write_xlsx(path, count, parts, seed=0, sheets=2):
+    # Minimal workbook written as raw SpreadsheetML with a shared string
+    # table, like the exports the application reads. Rows are split over
+    # the given number of sheets.
+    rng = random.Random(seed)
+    strings = {}
+
+    def shared(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    def row_xml(row_number, values):
+        cells = []
+        for column, value in enumerate(values):
+            ref = f"{_column_letter(column)}{row_number}"
+            if isinstance(value, int):
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}" t="s"><v>{shared(value)}</v></c>')
+        return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+    per_sheet = -(-count // sheets)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        sheet_names = []
+        for sheet in range(sheets):
+            rows = min(per_sheet, count - sheet * per_sheet)
+            if rows <= 0:
+                break
+            sheet_names.append(f"INVENTARIO {sheet + 1}")
+            with zf.open(f"xl/worksheets/sheet{sheet + 1}.xml", 'w') as out:
+                out.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                          b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+                out.write(row_xml(1, EXCEL_HEADERS).encode('utf-8'))
+                block = []
+                for row_number in range(2, rows + 2):
+                    values = [parts[rng.randrange(len(parts))], rng.choice(DESCRIPTIONS),
+                              rng.randint(0, 500), f"L{rng.randint(1, 999)}", rng.choice(CONDITIONS)]
+                    block.append(row_xml(row_number, values))
+                    if len(block) >= 10000:
+                        out.write(''.join(block).encode('utf-8'))
+                        block = []
+                out.write(''.join(block).encode('utf-8'))
+                out.write(b'</sheetData></worksheet>')
+
+        sst = ''.join(f'<si><t>{escape(value)}</t></si>' for value in strings)
+        zf.writestr('xl/sharedStrings.xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    f'count="{len(strings)}" uniqueCount="{len(strings)}">{sst}</sst>')
+
+        sheets_xml = ''.join(f'<sheet name="{name}" sheetId="{i + 1}" r:id="rId{i + 1}"/>'
+                             for i, name in enumerate(sheet_names))
+        zf.writestr('xl/workbook.xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    f'<sheets>{sheets_xml}</sheets></workbook>')
+
+        rels = ''.join(f'<Relationship Id="rId{i + 1}" '
+                       'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                       f'Target="worksheets/sheet{i + 1}.xml"/>' for i in range(len(sheet_names)))
+        rels += (f'<Relationship Id="rId{len(sheet_names) + 1}" '
+                 'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+                 'Target="sharedStrings.xml"/>')
+        zf.writestr('xl/_rels/workbook.xml.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    f'{rels}</Relationships>')
+        zf.writestr('_rels/.rels',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" '
+                    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+                    'Target="xl/workbook.xml"/></Relationships>')
+
+        overrides = ''.join(f'<Override PartName="/xl/worksheets/sheet{i + 1}.xml" '
+                            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                            for i in range(len(sheet_names)))
+        zf.writestr('[Content_Types].xml',
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/sharedStrings.xml" '
+                    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                    f'{overrides}</Types>')
+
+def measure(fn, memory=True, discard=None):
+    # (result, seconds, peak MB); the timing run is not traced, the peak
+    # comes from a second traced run. discard(result) releases the result
+    # of the timing run before the traced one.
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    peak = None
+    if memory:
+        if discard is not None:
+            discard(result)
+        del result
+        tracemalloc.start()
+        try:
+            result = fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+def make_queries(parts, rng):
+    # Query strings per kind, drawn from the part numbers in the file
+    sample = [rng.choice(parts) for _ in range(20)]
+    return {
+        'exact': sample,
+        'prefix': [part[:4] for part in sample],
+        'substring': [part[2:-2] if len(part) > 6 else part[1:] for part in sample],
+        'no_hit': [f"QZX{rng.randint(1000, 9999)}J" for _ in range(20)],
+    }
+
+# find_matches options of the query kinds that are not plain searches
+QUERY_OPTIONS = {'exact': {'exact': True}, 'prefix': {'prefix': True}}
+
+def time_queries(all_data, queries, repeat=3):
+    # Latency of a search as the window runs it: find_matches plus
+    # building the first page of result rows. Exact and prefix queries
+    # are run as exact and prefix lookups (see QUERY_OPTIONS).
+    timings = {}
+    for kind, strings in queries.items():
+        options = QUERY_OPTIONS.get(kind, {})
+        samples = []
+        matches = 0
+        for _ in range(repeat):
+            for query in strings:
+                started = time.perf_counter()
+                results, near = find_matches(all_data, query, **options)
+                for result in results:
+                    [dict(record) for record in result['matches'][:lookup.RESULT_PAGE_SIZE]]
+                samples.append((time.perf_counter() - started) * 1000)
+                matches += sum(len(result['matches']) for result in results)
+        samples.sort()
+        timings[kind] = {
+            'median_ms': round(statistics.median(samples), 3),
+            'mean_ms': round(statistics.mean(samples), 3),
+            'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+            'matches': matches // repeat,
+        }
+    return timings
+
+def time_startup(data_dir, part, runs=5):
+    # Wall time of fresh processes: the bare interpreter, importing the
+    # module, and a batch lookup of one part number (time to first search
+    # without the window). The first batch run parses the files, the
+    # others read them from the parsed cache.
+    folder = os.path.dirname(os.path.abspath(lookup.__file__))
+
+    # The runs use their own parse cache folder beside the generated data
+    # so the user's cache is left alone
+    cache = os.path.join(os.path.dirname(data_dir), 'parse-cache')
+    shutil.rmtree(cache, ignore_errors=True)
+    env = dict(os.environ, PARTLOOKUP_CACHE_DIR=cache)
+
+    def wall(cmd, stdin=None):
+        started = time.perf_counter()
+        subprocess.run(cmd, input=stdin, cwd=folder, env=env, text=True, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - started
+
+    batch = [sys.executable, 'offline_part_lookup.py', '--batch', '-', '--data-dir', data_dir]
+    cold = wall(batch, part + '\n')
+    return {
+        'python_s': round(statistics.median(wall([sys.executable, '-c', 'pass']) for _ in range(runs)), 3),
+        'import_s': round(statistics.median(wall([sys.executable, '-c', 'import offline_part_lookup'])
+                                            for _ in range(runs)), 3),
+        'first_search_cold_s': round(cold, 3),
+        'first_search_s': round(statistics.median(wall(batch, part + '\n') for _ in range(runs)), 3),
+    }
+
+def bench_file(kind, path, records, reader_class, parts, memory, rng):
+    def close(reader):
+        if isinstance(reader, DBFReader):
+            reader.close()
+
+    reader, parse_s, parse_mb = measure(lambda: reader_class(path), memory, close)
+
+    def build():
+        index = PartIndex.build(reader)
+        index.build_fuzzy()
+        return index
+
+    index, index_s, index_mb = measure(build, memory)
+    all_data = {os.path.basename(path): {
+        'fields': reader.fields, 'records': reader.records, 'reader': reader,
+        'index': index, 'type': 'Excel' if reader_class is ExcelReader else 'DBF', 'path': path,
+    }}
+    result = {
+        'kind': kind,
+        'file': os.path.basename(path),
+        'records': records,
+        'records_kept': len(reader.records),
+        'file_mb': round(os.path.getsize(path) / 2 ** 20, 2),
+        'parse_s': round(parse_s, 3),
+        'parse_peak_mb': None if parse_mb is None else round(parse_mb, 1),
+        'index_s': round(index_s, 3),
+        'index_peak_mb': None if index_mb is None else round(index_mb, 1),
+        'queries': time_queries(all_data, make_queries(parts, rng)),
+    }
+    close(reader)
+    return result
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='partlookup-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    startup = None
+    try:
+        for size in args.sizes:
+            # About one distinct part number per four records, as in the
+            # inventory tables
+            parts = sorted({part_number(rng) for _ in range(max(size // 4, 100))})
+            for table in args.tables:
+                path = os.path.join(workdir, f"{size}_{table}")
+                write_dbf(path, TABLES[table], size, parts, seed=args.seed)
+                result = bench_file('dbf', path, size, DBFReader, parts, not args.no_memory, rng)
+                results.append(result)
+                report(result)
+            if size <= args.max_xlsx:
+                path = os.path.join(workdir, f"{size}_INVENTORIO.xlsx")
+                write_xlsx(path, size, parts, seed=args.seed)
+                result = bench_file('xlsx', path, size, ExcelReader, parts, not args.no_memory, rng)
+                results.append(result)
+                report(result)
+        if not args.no_startup:
+            size = args.sizes[0]
+            parts = sorted({part_number(rng) for _ in range(max(size // 4, 100))})
+            data_dir = os.path.join(workdir, 'startup', 'AirDataDatabase')
+            os.makedirs(data_dir, exist_ok=True)
+            write_dbf(os.path.join(data_dir, 'INVENT.DBF'), TABLES['INVENT.DBF'], size, parts, seed=args.seed)
+            startup = dict(time_startup(data_dir, parts[0]), records=size)
+            report_startup(startup)
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+        'startup': startup,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, output)
+
+def report(result):
+    queries = '  '.join(f"{kind} {timing['median_ms']:.2f}ms" for kind, timing in result['queries'].items())
+    memory = ''
+    if result['parse_peak_mb'] is not None:
+        memory = f" ({result['parse_peak_mb']:.1f} MB)"
+    print(f"{result['file']:<28} parse {result['parse_s']:7.2f}s{memory}  "
+          f"index {result['index_s']:6.2f}s  {queries}")
+
+def report_startup(startup):
+    print(f"{'startup':<28} python {startup['python_s']:.2f}s  import {startup['import_s']:.2f}s  "
+          f"first search {startup['first_search_s']:.2f}s (uncached {startup['first_search_cold_s']:.2f}s, "
+          f"{startup['records']:,} records)")
+
+def compare(previous_path, current):
+    # Ratios of the current run to an earlier results file, matched by
+    # file and record count; above 1.0 is slower
+    with open(previous_path) as f:
+        data = json.load(f)
+    previous = {(result['file'], result['records']): result for result in data['results']}
+
+    print(f"\nCompared with {previous_path} (current / previous):")
+    for result in current['results']:
+        old = previous.get((result['file'], result['records']))
+        if old is None:
+            continue
+        ratios = [f"parse {result['parse_s'] / max(old['parse_s'], 1e-9):.2f}",
+                  f"index {result['index_s'] / max(old['index_s'], 1e-9):.2f}"]
+        for kind in QUERY_KINDS:
+            if kind in result['queries'] and kind in old['queries']:
+                ratio = result['queries'][kind]['median_ms'] / max(old['queries'][kind]['median_ms'], 1e-9)
+                ratios.append(f"{kind} {ratio:.2f}")
+        print(f"  {result['file']:<28} {'  '.join(ratios)}")
+    old, new = data.get('startup'), current.get('startup')
+    if old and new:
+        ratios = [f"{key[:-2].replace('_', ' ')} {new[key] / max(old[key], 1e-9):.2f}"
+                  for key in ('import_s', 'first_search_s', 'first_search_cold_s')]
+        print(f"  {'startup':<28} {'  '.join(ratios)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the part lookup on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="record counts to generate (default: 10000 100000 1000000)")
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLES), default=['INVENT.DBF'],
+                        help="DBF table shapes to generate (default: INVENT.DBF)")
+    parser.add_argument('--max-xlsx', type=int, default=100000,
+                        help="largest size also generated as a workbook (default: 100000)")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the traced runs that measure peak memory")
+    parser.add_argument('--no-startup', action='store_true',
+                        help="skip the cold start timings (they use the first size)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="keep the generated files in this folder")
+    parser.add_argument('--keep', action='store_true', help="do not delete the generated files")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="results file (default: benchmark_results.json)")
+    parser.add_argument('--compare', metavar='FILE', help="print ratios against an earlier results file")
+    run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
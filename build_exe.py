@@ -23,21 +23,28 @@ def main():
             shutil.rmtree(folder)
             print(f"Cleaned {folder} directory")
     
+    # The folder layout from PartLookup.spec starts faster; --onefile
+    # builds the single executable, which unpacks itself on every start
+    onefile = "--onefile" in sys.argv[1:]
+    
     # PyInstaller command
-    cmd = [
-        sys.executable, "-m", "PyInstaller",
-        "--onefile",  # Single executable file
-        "--windowed",  # No console window (GUI app)
-        "--name", "PartLookup",  # Executable name
-        "--icon", "NONE",  # You can add an icon file here if available
-        "--add-data", "../assets/AirDataDatabase:AirDataDatabase",  # Include data files
-        "offline_part_lookup.py"
-    ]
-    
-    # For Windows, use semicolon instead of colon in add-data
-    if sys.platform == "win32":
-        cmd[-2] = "--add-data"
-        cmd[-1] = "../assets/AirDataDatabase;AirDataDatabase"
+    if onefile:
+        cmd = [
+            sys.executable, "-m", "PyInstaller",
+            "--onefile",  # Single executable file
+            "--windowed",  # No console window (GUI app)
+            "--name", "PartLookup",  # Executable name
+            "--icon", "NONE",  # You can add an icon file here if available
+            "--add-data", "../assets/AirDataDatabase:AirDataDatabase",  # Include data files
+            "offline_part_lookup.py"
+        ]
+        
+        # For Windows, use semicolon instead of colon in add-data
+        if sys.platform == "win32":
+            cmd[-2] = "--add-data"
+            cmd[-1] = "../assets/AirDataDatabase;AirDataDatabase"
+    else:
+        cmd = [sys.executable, "-m", "PyInstaller", "--noconfirm", "PartLookup.spec"]
     
     print("Running PyInstaller...")
     print(" ".join(cmd))
@@ -45,11 +52,18 @@ def main():
     result = subprocess.run(cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
     
     if result.returncode == 0:
+        exe = f"PartLookup{'.exe' if sys.platform == 'win32' else ''}"
         print("\nBuild successful!")
-        print(f"Executable created in: dist/PartLookup{'.exe' if sys.platform == 'win32' else ''}")
-        print("\nTo distribute the application:")
-        print("1. Copy the executable from the 'dist' folder")
-        print("2. Place it in a folder with the 'AirDataDatabase' directory")
+        if onefile:
+            print(f"Executable created in: dist/{exe}")
+            print("\nTo distribute the application:")
+            print("1. Copy the executable from the 'dist' folder")
+            print("2. Place it in a folder with the 'AirDataDatabase' directory")
+        else:
+            print(f"Executable created in: dist/PartLookup/{exe}")
+            print("\nTo distribute the application:")
+            print("1. Copy the whole 'dist/PartLookup' folder")
+            print(f"2. Put the 'AirDataDatabase' directory in it, next to {exe}")
         print("3. The application will automatically find the database files")
     else:
         print("\nBuild failed!")
@@ -30,17 +30,18 @@ if exist dist rmdir /s /q dist
 REM Build the executable
 echo.
 echo Building executable...
-pyinstaller --onefile --windowed --name PartLookup --distpath ./dist offline_part_lookup.py
+REM PartLookup.spec builds a folder that starts faster than a --onefile exe
+pyinstaller --noconfirm --distpath ./dist PartLookup.spec
 
-if exist dist\PartLookup.exe (
+if exist dist\PartLookup\PartLookup.exe (
     echo.
     echo BUILD SUCCESSFUL!
     echo.
-    echo Executable created: dist\PartLookup.exe
+    echo Executable created: dist\PartLookup\PartLookup.exe
     echo.
     echo To use the application:
-    echo 1. Copy PartLookup.exe to the destination computer
-    echo 2. Place the AirDataDatabase folder in the same directory as the exe
+    echo 1. Copy the dist\PartLookup folder to the destination computer
+    echo 2. Place the AirDataDatabase folder in it, next to PartLookup.exe
     echo 3. Double-click PartLookup.exe to run
     echo.
 ) else (
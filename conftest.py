@@ -0,0 +1,10 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # Keep the parse cache out of the user's cache folder and ignore any
+    # settings of the machine running the tests
+    monkeypatch.setenv('PARTLOOKUP_CACHE_DIR', str(tmp_path / 'cache'))
+    for name in ('PARTLOOKUP_CODEPAGE', 'PARTLOOKUP_LOG', 'PARTLOOKUP_PROFILE', 'PARTLOOKUP_SCHEMA',
+                 'PARTLOOKUP_SERVER', 'PARTLOOKUP_SNAPSHOT', 'PARTLOOKUP_WORKERS'):
+        monkeypatch.delenv(name, raising=False)
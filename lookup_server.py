@@ -0,0 +1,142 @@
+# HTTP lookup server for offline_part_lookup.py --serve: loads the data
+# files once and answers part number lookups as JSON. It lives in its own
+# module so the window does not import http.server on startup.
+import sys
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import offline_part_lookup as lookup
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+class LookupHandler(BaseHTTPRequestHandler):
+    # GET /lookup?pn=AN3-4A[&exact=1&prefix=1&fold=1&near=1&alternates=1&limit=N]
+    # POST /lookup with {"pn": ["AN3-4A", ...], "exact": true, ...}
+    # GET /query?q=AN3-4A+QTY>0[&fold=1&limit=N] runs a field query
+    # GET /status lists the loaded files
+    server_version = "PartLookup/1.0"
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/status':
+            self._send_json(200, self.server.status())
+        elif url.path == '/lookup':
+            part_number = params.get('pn', '').strip().upper()
+            if not part_number:
+                self._send_json(400, {'error': "missing pn parameter"})
+                return
+            self._lookup([part_number], params, single=True)
+        elif url.path == '/query':
+            self._query(params)
+        else:
+            self._send_json(404, {'error': f"unknown path {url.path}"})
+    
+    def do_POST(self):
+        if urlparse(self.path).path != '/lookup':
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            part_numbers = body.get('pn', [])
+            if isinstance(part_numbers, str):
+                part_numbers = [part_numbers]
+            part_numbers = [str(part_number).strip().upper() for part_number in part_numbers]
+        except (ValueError, AttributeError):
+            self._send_json(400, {'error': "expected a JSON object with a pn list"})
+            return
+        self._lookup([part_number for part_number in part_numbers if part_number], body)
+    
+    def _lookup(self, part_numbers, options, single=False):
+        try:
+            limit = int(options.get('limit', lookup.SERVER_RECORD_LIMIT))
+        except (TypeError, ValueError):
+            self._send_json(400, {'error': "limit must be a number"})
+            return
+        fold, exact, near, alternates, prefix = (_flag(options.get(name, False))
+                                                 for name in ('fold', 'exact', 'near', 'alternates', 'prefix'))
+        results = [lookup.lookup_result(self.server.all_data, part_number, fold, exact, near, alternates, limit,
+                                        prefix)
+                   for part_number in part_numbers]
+        self._send_json(200, results[0] if single else {'results': results})
+    
+    def _query(self, params):
+        query = params.get('q', '').strip()
+        if not query:
+            self._send_json(400, {'error': "missing q parameter"})
+            return
+        try:
+            limit = int(params.get('limit', lookup.SERVER_RECORD_LIMIT))
+        except ValueError:
+            self._send_json(400, {'error': "limit must be a number"})
+            return
+        try:
+            result = lookup.query_result(self.server.all_data, query, _flag(params.get('fold', False)), limit)
+        except lookup.QueryError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        self._send_json(200, result)
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class LookupServer(HTTPServer):
+    # Serves lookups over data loaded once. Requests are handled by a
+    # fixed pool of threads instead of a new thread per connection; the
+    # indexes are only read, so they are shared without locking.
+    daemon_threads = True
+    
+    def __init__(self, address, all_data, threads=8):
+        super().__init__(address, LookupHandler)
+        self.all_data = all_data
+        self.started = time.time()
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+    
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request_thread, request, client_address)
+    
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+    
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+    
+    def status(self):
+        files = [{'file': filename, 'type': data['type'], 'records': len(data['records']),
+                  'stats': data.get('stats', {})}
+                 for filename, data in self.all_data.items()]
+        return {'files': files, 'records': sum(entry['records'] for entry in files),
+                'uptime': round(time.time() - self.started, 1)}
+
+def run_server(args):
+    data_dir = lookup.headless_data_dir(args)
+    if data_dir is None:
+        return 2
+    
+    server = LookupServer((args.host, args.port), lookup.load_all(data_dir, rollups=True), args.threads)
+    print(f"Serving part lookups on http://{args.host}:{server.server_address[1]}/lookup?pn=", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
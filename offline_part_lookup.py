@@ -1,26 +1,283 @@
 #!/usr/bin/env python3
-import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+import time
+# Startup clock for the time-to-first-paint and time-to-first-search
+# measurements; taken before the other imports so they are included
+STARTED = time.perf_counter()
+import argparse
+import codecs
+import contextlib
+import csv
 import struct
 import os
+import mmap
 import sys
-from datetime import datetime
+import threading
+import queue
+import datetime
+import posixpath
+import zipfile
 import json
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+from itertools import chain, islice, repeat
+from urllib.parse import urlencode
+from xml.etree.ElementTree import XMLParser, iterparse
 
-# Try to import openpyxl for Excel support
-try:
-    import openpyxl
-    EXCEL_SUPPORT = True
-except ImportError:
-    EXCEL_SUPPORT = False
-    print("Warning: openpyxl not installed. Excel files will not be read.")
+# openpyxl is only the fallback for workbooks the streaming xlsx reader
+# cannot handle, so it is imported on first use (see import_openpyxl)
+openpyxl = None
+
+class DBFRecord(Mapping):
+    # Read-only view of one record; the whole record is decoded into
+    # native values on first access, memo text only when its field is read
+    __slots__ = ('_reader', '_offset', '_values')
+
+    def __init__(self, reader, offset):
+        self._reader = reader
+        self._offset = offset
+        self._values = None
+
+    def __getitem__(self, name):
+        reader = self._reader
+        position = reader._positions[name]
+        if self._values is None:
+            self._values = reader.decode_record(self._offset)
+        if name in reader._memo_fields:
+            return reader.memo(self._values[position])
+        return self._values[position]
+
+    def __iter__(self):
+        return iter(self._reader._field_slices)
+
+    def __len__(self):
+        return len(self._reader._field_slices)
+
+    def __repr__(self):
+        return f"DBFRecord({dict(self)!r})"
+
+class DBFRecordView(Sequence):
+    # Sequence of the live (non-deleted) records of a DBFReader
+    __slots__ = ('_reader',)
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __len__(self):
+        return len(self._reader._recnos)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._reader.record(recno) for recno in self._reader._recnos[index]]
+        return self._reader.record(self._reader._recnos[index])
+
+# Memo files that go with a DBF, tried in this order; memo fields in the
+# table only hold the number of the memo's first block
+MEMO_EXTENSIONS = ('.DBT', '.FPT')
+DBT_BLOCK_SIZE = 512
+DBT4_BLOCK_START = b'\xff\xff\x08\x00'
+
+# Codepage of the table text by the language driver byte (29) of the DBF
+# header
+DBF_CODEPAGES = {
+    0x01: 'cp437', 0x02: 'cp850', 0x03: 'cp1252', 0x04: 'mac_roman', 0x08: 'cp865', 0x09: 'cp437',
+    0x0A: 'cp850', 0x0B: 'cp437', 0x0D: 'cp437', 0x0E: 'cp850', 0x0F: 'cp437', 0x10: 'cp850',
+    0x11: 'cp437', 0x12: 'cp850', 0x13: 'cp932', 0x14: 'cp850', 0x15: 'cp437', 0x16: 'cp850',
+    0x17: 'cp865', 0x18: 'cp437', 0x19: 'cp437', 0x1A: 'cp850', 0x1B: 'cp437', 0x1C: 'cp863',
+    0x1D: 'cp850', 0x1F: 'cp852', 0x22: 'cp852', 0x23: 'cp852', 0x24: 'cp860', 0x25: 'cp850',
+    0x26: 'cp866', 0x37: 'cp850', 0x40: 'cp852', 0x4D: 'cp936', 0x4E: 'cp949', 0x4F: 'cp950',
+    0x50: 'cp874', 0x57: 'cp1252', 0x58: 'cp1252', 0x59: 'cp1252', 0x64: 'cp852', 0x65: 'cp866',
+    0x66: 'cp865', 0x67: 'cp861', 0x6A: 'cp737', 0x6B: 'cp857', 0x6C: 'cp863', 0x78: 'cp950',
+    0x79: 'cp949', 0x7A: 'cp936', 0x7B: 'cp932', 0x7C: 'cp874', 0x7D: 'cp1255', 0x7E: 'cp1256',
+    0x86: 'cp737', 0x87: 'cp852', 0x88: 'cp857', 0x96: 'mac_cyrillic', 0x97: 'mac_latin2',
+    0x98: 'mac_greek', 0xC8: 'cp1250', 0xC9: 'cp1251', 0xCA: 'cp1254', 0xCB: 'cp1253', 0xCC: 'cp1257',
+}
+
+def default_codepage():
+    # Codepage of tables whose header names none, as the DOS programs
+    # writing such tables used; PARTLOOKUP_CODEPAGE overrides it
+    return os.environ.get('PARTLOOKUP_CODEPAGE', '').strip() or 'cp437'
+
+DBF_LOGICAL = {b'T': True, b't': True, b'Y': True, b'y': True,
+               b'F': False, b'f': False, b'N': False, b'n': False}
+
+def _dbf_number(raw):
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        return float(raw) if b'.' in raw or b'e' in raw or b'E' in raw else int(raw)
+    except ValueError:
+        # Overflowed values are stored as asterisks
+        return raw.decode('ascii', errors='ignore')
+
+def _dbf_date(raw):
+    raw = raw.strip()
+    if not raw.strip(b'0'):
+        return None
+    try:
+        return datetime.date(int(raw[:4]), int(raw[4:6]), int(raw[6:8]))
+    except ValueError:
+        return raw.decode('ascii', errors='ignore')
+
+def _dbf_datetime(raw):
+    # Visual FoxPro: Julian day number and milliseconds since midnight
+    day, milliseconds = struct.unpack('<ii', raw)
+    if day <= 0:
+        return None
+    return (datetime.datetime.fromordinal(day - 1721425) + datetime.timedelta(milliseconds=milliseconds))
+
+def _dbf_currency(value):
+    # Visual FoxPro currency: an integer of ten-thousandths
+    return value / 10000
+
+def dbf_field_decoder(field, decode):
+    # (struct format, converter) for one field; converter None means the
+    # unpacked value is used as is. Memo fields keep their raw block
+    # pointer, which DBFReader.memo reads.
+    field_type, length = field['type'], field['length']
+    if field_type in ('N', 'F'):
+        return f'{length}s', _dbf_number
+    if field_type == 'D' and length == 8:
+        return '8s', _dbf_date
+    if field_type == 'L' and length == 1:
+        return '1s', DBF_LOGICAL.get
+    if field_type == 'I' and length == 4:
+        return 'i', None
+    if field_type == 'Y' and length == 8:
+        return 'q', _dbf_currency
+    if field_type == 'B' and length == 8:
+        return 'd', None
+    if field_type == 'T' and length == 8:
+        return '8s', _dbf_datetime
+    if field_type == 'M':
+        return f'{length}s', None
+    return f'{length}s', lambda raw: decode(raw, 'ignore')[0].strip()
+
+def display_value(value, field=None):
+    # Text of a decoded value as shown to the user: dates as YYYY-MM-DD,
+    # logicals as Yes/No, numbers with the field's decimals, None as ''
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ', 'seconds')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and field is not None and field.get('decimals'):
+        return f"{value:.{field['decimals']}f}"
+    return str(value)
+
+# Per-file column schema: schema.json in the data folder (or the file
+# PARTLOOKUP_SCHEMA names) maps a file name to the columns to use, e.g.
+#   {"INVENT.DBF": {"key": ["PARTNO"], "display": ["PARTNO", "DESCRIP", "QTY"],
+#                   "drop": ["NOTES", "LASTUSER"]}}
+# key: part number columns (default: guessed by find_part_fields)
+# display: columns shown in results and written by batch, in that order
+#          (default: every column)
+# drop: columns left out when the file is read
+SCHEMA_FILE = 'schema.json'
+
+class FileSchema:
+    __slots__ = ('key', 'display', 'drop')
+    
+    def __init__(self, key=(), display=(), drop=()):
+        self.key = list(key)
+        self.display = list(display)
+        self.drop = frozenset(drop)
+    
+    def token(self):
+        # Stored with cached and compiled data, which are only reused while
+        # the schema stays the same
+        return json.dumps([self.key, self.display, sorted(self.drop)])
+    
+    def keep(self, names):
+        return [name for name in names if name not in self.drop]
+    
+    def display_fields(self, fields):
+        if not self.display:
+            return fields
+        by_name = {field['name']: field for field in fields}
+        return [by_name[name] for name in self.display if name in by_name]
+
+EMPTY_SCHEMA = FileSchema()
+_schemas = {}
+
+def _schema_names(entry, name):
+    value = entry.get(name, [])
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{name}' must be a list of column names")
+    return [item.strip() for item in value]
+
+def load_schemas(data_dir):
+    # {upper-cased file name: FileSchema} from the schema file, read again
+    # whenever it changes; {} when there is none
+    path = os.environ.get('PARTLOOKUP_SCHEMA', '').strip() or os.path.join(data_dir, SCHEMA_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _schemas.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    schemas = {}
+    try:
+        with open(path, encoding='utf-8-sig') as f:
+            config = json.load(f)
+        for filename, entry in config.items():
+            if not isinstance(entry, dict):
+                raise ValueError(f"the entry for {filename} must be an object")
+            schemas[filename.upper()] = FileSchema(*(_schema_names(entry, name) for name in ('key', 'display', 'drop')))
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring {path}: {str(e)}")
+        schemas = {}
+    _schemas[path] = (mtime, schemas)
+    return schemas
+
+def file_schema(filepath):
+    folder, name = os.path.split(filepath)
+    return load_schemas(folder or '.').get(name.upper(), EMPTY_SCHEMA)
 
 class DBFReader:
-    def __init__(self, filename):
+    def __init__(self, filename, state=None):
         self.filename = filename
         self.records = []
+        # Fields of the table as read (without the schema's dropped
+        # columns) and every field of the record layout
         self.fields = []
-        self.read_dbf()
+        self._layout = []
+        self.schema = file_schema(filename)
+        self.header_len = 0
+        self.record_len = 0
+        self.num_records = 0
+        self._mm = None
+        self._field_slices = {}
+        self._recnos = range(0)
+        self._flags = b''
+        self.codepage = default_codepage()
+        self._decode = None
+        self._positions = {}
+        self._record_struct = None
+        self._converters = ()
+        self._text_structs = {}
+        self._memo_fields = frozenset()
+        self._memo = None
+        self._memo_fpt = False
+        self._memo_block_size = DBT_BLOCK_SIZE
+        self.memo_filename = None
+        self._index_tags = None
+        if state is not None:
+            self.restore_state(state)
+        else:
+            self.read_dbf()
     
     def read_dbf(self):
         try:
@@ -30,136 +287,3884 @@ class DBFReader:
                 if len(header) < 32:
                     return
                 
-                num_records = struct.unpack('<I', header[4:8])[0]
-                header_len = struct.unpack('<H', header[8:10])[0]
-                record_len = struct.unpack('<H', header[10:12])[0]
+                self.num_records = struct.unpack('<I', header[4:8])[0]
+                self.header_len = struct.unpack('<H', header[8:10])[0]
+                self.record_len = struct.unpack('<H', header[10:12])[0]
+                self.codepage = DBF_CODEPAGES.get(header[29]) or default_codepage()
                 
                 # Read field descriptors
-                field_data = f.read(header_len - 32)
-                field_count = (header_len - 32 - 1) // 32
+                field_data = f.read(self.header_len - 32)
+                field_count = (self.header_len - 32 - 1) // 32
                 
                 for i in range(field_count):
                     field_info = field_data[i*32:(i+1)*32]
                     if field_info[0] == 0x0D:  # Field terminator
                         break
                     
-                    field_name = field_info[0:11].replace(b'\x00', b'').decode('ascii', errors='ignore').strip()
+                    # Names end at the first NUL; the bytes after it can be junk
+                    field_name = field_info[0:11].split(b'\x00', 1)[0].decode('ascii', errors='ignore').strip()
                     field_type = chr(field_info[11])
                     field_length = field_info[16]
                     
-                    self.fields.append({
+                    self._layout.append({
                         'name': field_name,
                         'type': field_type,
-                        'length': field_length
+                        'length': field_length,
+                        'decimals': field_info[17]
                     })
                 
-                # Skip to records
-                f.seek(header_len)
+                self._build_field_slices()
                 
-                # Read records
-                for _ in range(min(num_records, 50000)):  # Limit records for performance
-                    record_data = f.read(record_len)
-                    if not record_data or len(record_data) < record_len:
-                        break
+                # Map the record area instead of reading it; records are
+                # located by offset and decoded only when accessed
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size <= self.header_len or not self.record_len:
+                    return
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            
+            available = (file_size - self.header_len) // self.record_len
+            count = min(self.num_records, available)
+            if available < self.num_records:
+                print(f"Warning: {self.filename} header lists {self.num_records} records but only {available} are present")
+            
+            # Deletion flags of every record in one slice
+            self._flags = self._read_flags(self._mm, count)
+            self._recnos = self._live_recnos(self._flags)
+            self.records = DBFRecordView(self)
                     
-                    if record_data[0] != 0x20:  # Skip deleted records
+        except Exception as e:
+            print(f"Error reading {self.filename}: {str(e)}")
+    
+    def _read_flags(self, mm, count):
+        return mm[self.header_len:self.header_len + count * self.record_len:self.record_len]
+    
+    @staticmethod
+    def _live_recnos(flags):
+        if flags.count(b' ') == len(flags):
+            return range(len(flags))
+        return array('I', [i for i, flag in enumerate(flags) if flag == 0x20])
+    
+    def _build_field_slices(self):
+        # Dropped columns keep their place in the record layout but are
+        # never decoded
+        self.fields = [field for field in self._layout if field['name'] not in self.schema.drop]
+        offset = 1  # Skip deletion flag
+        for field in self._layout:
+            if field['name'] not in self.schema.drop:
+                self._field_slices[field['name']] = (offset, field['length'])
+            offset += field['length']
+        self._compile_decoders()
+        self._memo_fields = frozenset(field['name'] for field in self.fields if field['type'] == 'M')
+        if self._memo_fields:
+            self._open_memo()
+    
+    def _compile_decoders(self):
+        # One struct.Struct for the whole record (deletion flag skipped)
+        # and one converter per field, compiled once from the descriptors
+        try:
+            self._decode = codecs.getdecoder(self.codepage)
+        except LookupError:
+            print(f"Warning: unknown codepage {self.codepage} for {self.filename}")
+            self._decode = codecs.getdecoder('cp437')
+        formats = ['<x']
+        converters = []
+        for field in self._layout:
+            if field['name'] in self.schema.drop:
+                formats.append(f"{field['length']}x")
+                continue
+            code, convert = dbf_field_decoder(field, self._decode)
+            formats.append(code)
+            self._positions[field['name']] = len(converters)
+            converters.append(convert)
+        self._record_struct = struct.Struct(''.join(formats))
+        self._converters = converters
+        self._text_structs = {}
+    
+    def decode_record(self, offset):
+        # Native values of every field of the record at offset
+        record_struct = self._record_struct
+        try:
+            values = record_struct.unpack_from(self._mm, offset)
+        except struct.error:
+            # Last record cut short by the end of the file
+            values = record_struct.unpack(self._mm[offset:offset + record_struct.size].ljust(record_struct.size))
+        return [value if convert is None else convert(value) for convert, value in zip(self._converters, values)]
+    
+    def _text_struct(self, names):
+        # Struct unpacking the raw bytes of just the given columns, padding
+        # over the others, and the order to return them in
+        compiled = self._text_structs.get(names)
+        if compiled is None:
+            wanted = set(names)
+            formats = ['<x']
+            unpacked = []
+            for field in self._layout:
+                if field['name'] in wanted and field['name'] not in unpacked:
+                    formats.append(f"{field['length']}s")
+                    unpacked.append(field['name'])
+                else:
+                    formats.append(f"{field['length']}x")
+            order = [unpacked.index(name) for name in names]
+            compiled = self._text_structs[names] = (struct.Struct(''.join(formats)), order)
+        return compiled
+    
+    def _open_memo(self):
+        # Map the .DBT/.FPT file next to the table. Nothing is read from it
+        # until a memo field is accessed, so memos add nothing to load time.
+        old_memo = self._memo
+        self._memo = None
+        folder, name = os.path.split(self.filename)
+        stem = os.path.splitext(name)[0].upper()
+        try:
+            names = {entry.upper(): entry for entry in os.listdir(folder or '.')}
+            for extension in MEMO_EXTENSIONS:
+                if stem + extension in names:
+                    self.memo_filename = os.path.join(folder, names[stem + extension])
+                    self._memo_fpt = extension == '.FPT'
+                    break
+            else:
+                return
+            with open(self.memo_filename, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < 32:
+                    return
+                memo = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # FoxPro keeps the block size big-endian at byte 6, dBASE IV
+            # little-endian at byte 20; dBASE III always uses 512
+            if self._memo_fpt:
+                self._memo_block_size = struct.unpack('>H', memo[6:8])[0] or 64
+            else:
+                self._memo_block_size = struct.unpack('<H', memo[20:22])[0] or DBT_BLOCK_SIZE
+            self._memo = memo
+        except Exception as e:
+            print(f"Error reading memo file for {self.filename}: {str(e)}")
+        finally:
+            if old_memo is not None:
+                old_memo.close()
+    
+    def memo(self, pointer):
+        # Text of the memo a memo field's raw bytes point to: ten ASCII
+        # digits, or a little-endian integer in Visual FoxPro tables
+        memo = self._memo
+        if memo is None:
+            return ''
+        try:
+            block = struct.unpack('<I', pointer)[0] if len(pointer) == 4 else int(pointer.strip() or 0)
+        except ValueError:
+            return ''
+        start = block * self._memo_block_size
+        if block <= 0 or start + 8 > len(memo):
+            return ''
+        if self._memo_fpt:
+            # Block header: record type and length, both big-endian
+            length = struct.unpack('>I', memo[start + 4:start + 8])[0]
+            data = memo[start + 8:start + 8 + length]
+        elif memo[start:start + 4] == DBT4_BLOCK_START:
+            # dBASE IV: the length includes the 8-byte block header
+            length = struct.unpack('<I', memo[start + 4:start + 8])[0]
+            data = memo[start + 8:start + length]
+        else:
+            # dBASE III: text runs up to an end-of-file marker
+            end = memo.find(b'\x1a', start)
+            data = memo[start:end if end >= 0 else len(memo)]
+        return self._decode(data, 'ignore')[0].replace('\r\n', '\n').strip()
+    
+    def get_state(self):
+        # Parsed header and live record numbers, as stored in the parse cache
+        return {
+            'fields': self._layout,
+            'header_len': self.header_len,
+            'record_len': self.record_len,
+            'num_records': self.num_records,
+            'codepage': self.codepage,
+            'recnos': self._recnos
+        }
+    
+    def restore_state(self, state):
+        self._layout = state['fields']
+        self.header_len = state['header_len']
+        self.record_len = state['record_len']
+        self.num_records = state['num_records']
+        self.codepage = state['codepage']
+        self._recnos = state['recnos']
+        self._build_field_slices()
+        try:
+            with open(self.filename, 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size > self.header_len and self.record_len:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    available = (file_size - self.header_len) // self.record_len
+                    self._flags = self._read_flags(self._mm, min(self.num_records, available))
+                    self.records = DBFRecordView(self)
+        except Exception as e:
+            print(f"Error reading {self.filename}: {str(e)}")
+    
+    def refresh(self):
+        # Map records appended since the last load and compare the deletion
+        # flags of the records already seen. Returns (appended, deleted,
+        # recalled) record numbers, or None when the table layout changed or
+        # records disappeared and the file has to be loaded again.
+        with open(self.filename, 'rb') as f:
+            header = f.read(32)
+            if len(header) < 32:
+                return None
+            num_records, header_len, record_len = struct.unpack('<IHH', header[4:12])
+            if header_len != self.header_len or record_len != self.record_len:
+                return None
+            
+            file_size = os.fstat(f.fileno()).st_size
+            available = (file_size - header_len) // record_len if file_size > header_len and record_len else 0
+            count = min(num_records, available)
+            seen = len(self._flags)
+            if count < seen:
+                return None
+            if count == 0:
+                return [], [], []
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        flags = self._read_flags(mm, count)
+        deleted = []
+        recalled = []
+        if flags[:seen] != self._flags:
+            for recno, (before, after) in enumerate(zip(self._flags, flags)):
+                if before != after:
+                    if after == 0x20:
+                        recalled.append(recno)
+                    elif before == 0x20:
+                        deleted.append(recno)
+        appended = [seen + i for i, flag in enumerate(flags[seen:]) if flag == 0x20]
+        
+        old_mm = self._mm
+        self._mm = mm
+        if old_mm is not None:
+            old_mm.close()
+        self.num_records = num_records
+        self._flags = flags
+        # Edited and new memos are written to blocks past the old end of
+        # the memo file
+        if self._memo_fields:
+            self._open_memo()
+        # The ERP updates its index files with the table; check them again
+        self._close_index_tags()
+        
+        if deleted or recalled:
+            self._recnos = self._live_recnos(flags)
+        elif appended:
+            if isinstance(self._recnos, range) and len(self._recnos) == seen and len(appended) == count - seen:
+                self._recnos = range(count)
+            else:
+                recnos = array('I', self._recnos)
+                recnos.extend(appended)
+                self._recnos = recnos
+        self.records = DBFRecordView(self)
+        return appended, deleted, recalled
+    
+    def record(self, recno):
+        return DBFRecord(self, self.header_len + recno * self.record_len)
+    
+    def iter_records(self, start=0, stop=None, columns=None):
+        # Yield (recno, values) for live records with the requested columns
+        # as text, as the index and the part number search see them; one
+        # struct call per record cuts out just those columns
+        if self._mm is None:
+            return
+        names = tuple(columns) if columns is not None else tuple(self._field_slices)
+        for name in names:
+            if name not in self._field_slices:
+                raise KeyError(name)
+        text_struct, order = self._text_struct(names)
+        unpack = text_struct.unpack_from
+        mm = self._mm
+        header_len = self.header_len
+        record_len = self.record_len
+        decode = self._decode
+        
+        if self._memo_fields.intersection(names):
+            # Memo columns are read from the memo file record by record
+            memo = self.memo
+            order = [(i, name in self._memo_fields) for i, name in zip(order, names)]
+            for recno in islice(self._recnos, start, stop):
+                raw = unpack(mm, header_len + recno * record_len)
+                yield recno, tuple(memo(raw[i]) if is_memo else decode(raw[i], 'ignore')[0].strip()
+                                   for i, is_memo in order)
+            return
+        
+        if len(order) == 1:
+            for recno in islice(self._recnos, start, stop):
+                yield recno, (decode(unpack(mm, header_len + recno * record_len)[0], 'ignore')[0].strip(),)
+            return
+        
+        for recno in islice(self._recnos, start, stop):
+            raw = unpack(mm, header_len + recno * record_len)
+            yield recno, tuple(decode(raw[i], 'ignore')[0].strip() for i in order)
+    
+    def text_values(self, recno, columns):
+        # One record's columns as text, like iter_records
+        names = tuple(columns)
+        text_struct, order = self._text_struct(names)
+        raw = text_struct.unpack_from(self._mm, self.header_len + recno * self.record_len)
+        return tuple(self.memo(raw[i]) if name in self._memo_fields else self._decode(raw[i], 'ignore')[0].strip()
+                     for i, name in zip(order, names))
+    
+    def index_tags(self):
+        # Usable index tags of the table by column, found and checked on
+        # first use (see find_index_tags and _check_index_tag)
+        if self._index_tags is None:
+            tags = {}
+            found = find_index_tags(self.filename)
+            for tag in found:
+                try:
+                    column = self._check_index_tag(tag)
+                except (IndexFileError, struct.error) as e:
+                    print(f"Error reading index tag {tag.name} of {tag.filename}: {str(e)}")
+                    column = None
+                if column is not None and column not in tags:
+                    tags[column] = tag
+            used = {id(tag.mm) for tag in tags.values()}
+            for mm in {id(tag.mm): tag.mm for tag in found if id(tag.mm) not in used}.values():
+                mm.close()
+            self._index_tags = tags
+        return self._index_tags
+    
+    def _check_index_tag(self, tag):
+        # Column a tag can be used to seek on, or None. The tag has to index
+        # a character column (optionally upper-cased or trimmed), hold one
+        # key per record of the table, and its first keys have to be in
+        # order and equal to the upper-cased values of their records. A FOR
+        # clause, a unique tag or an index file that was not kept up to
+        # date with the table fails one of these.
+        column = index_column(tag.expression)
+        if column not in self._positions or self.fields[self._positions[column]]['type'] != 'C':
+            return None
+        if tag.count() != len(self._flags):
+            return None
+        previous = b''
+        for key, recno in tag.first_keys(INDEX_SAMPLE_KEYS):
+            key = key.rstrip(b' \x00')
+            if key < previous or not 1 <= recno <= len(self._flags):
+                return None
+            value = self.text_values(recno - 1, (column,))[0].upper()
+            if key.strip() != value.encode(self.codepage, 'replace'):
+                return None
+            previous = key
+        return column
+    
+    def seek(self, column, text, prefix=False):
+        # Live record numbers whose column equals text, or starts with it
+        # when prefix is set, ignoring case; None when no usable index tag
+        # covers the column. Only the records the tag points to are read,
+        # to check them against the text.
+        tag = self.index_tags().get(column)
+        if tag is None:
+            return None
+        text = text.strip().upper()
+        if not text:
+            return []
+        recnos = []
+        for recno in tag.seek(text.encode(self.codepage, 'replace'), prefix):
+            recno -= 1
+            if 0 <= recno < len(self._flags) and self._flags[recno] == 0x20:
+                value = self.text_values(recno, (column,))[0].upper()
+                if value.startswith(text) if prefix else value == text:
+                    recnos.append(recno)
+        return sorted(recnos)
+    
+    def seek_part(self, column, key):
+        # Live record numbers whose column holds a part number with the
+        # normalized key (see normalize_part), however it is written; None
+        # when no usable index tag covers the column. The tag is sorted by
+        # the values as stored, so they are walked a character at a time:
+        # each step takes the key's next character, a separator or, before
+        # the first one, a leading zero, and only characters some value
+        # has there are followed.
+        tag = self.index_tags().get(column)
+        if tag is None:
+            return None
+        if not key:
+            return []
+        target = key.encode('ascii')
+        values = []
+        pending = [(b'', 0)]
+        while pending:
+            prefix, matched = pending.pop()
+            if matched == len(target) and tag.next_key(prefix) == prefix:
+                values.append(prefix)
+            wanted = {target[matched]} if matched < len(target) else set()
+            if matched == 0:
+                wanted.add(ord('0'))
+            for byte in _next_bytes(tag, prefix, wanted):
+                # The key never starts with a zero, so a zero before its
+                # first character is a leading one, skipped like a separator
+                step = matched + 1 if matched < len(target) and byte == target[matched] else matched
+                pending.append((prefix + bytes((byte,)), step))
+        recnos = set()
+        for value in values:
+            for recno in tag.seek(value):
+                recno -= 1
+                if 0 <= recno < len(self._flags) and self._flags[recno] == 0x20:
+                    if normalize_part(self.text_values(recno, (column,))[0]) == key:
+                        recnos.add(recno)
+        return sorted(recnos)
+    
+    def _close_index_tags(self):
+        for mm in {id(tag.mm): tag.mm for tag in (self._index_tags or {}).values()}.values():
+            mm.close()
+        self._index_tags = None
+    
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._memo is not None:
+            self._memo.close()
+            self._memo = None
+        self._close_index_tags()
+
+# Index files the ERP keeps next to its tables. A .CDX (FoxPro) or .MDX
+# (dBASE IV) named after the table holds all its tags; .NDX files (dBASE
+# III) hold one tag each and can have any name, so every one in the
+# folder is checked against the table.
+INDEX_EXTENSIONS = ('.CDX', '.MDX')
+INDEX_PAGE_SIZE = 512
+INDEX_MAX_DEPTH = 32
+# Leaf keys compared with the table when a tag is opened
+INDEX_SAMPLE_KEYS = 64
+INDEX_WRAPPERS = re.compile(r'^(?:UPPER|TRIM|RTRIM|ALLTRIM)\((.*)\)$')
+
+class IndexFileError(Exception):
+    pass
+
+def index_column(expression):
+    # Column a tag's key expression indexes, when it is a bare column or
+    # its UPPER()/TRIM() form; None for anything else
+    expression = expression.replace(' ', '').upper()
+    match = INDEX_WRAPPERS.match(expression)
+    while match:
+        expression = match.group(1)
+        match = INDEX_WRAPPERS.match(expression)
+    return expression if re.fullmatch(r'\w+', expression) else None
+
+# Bytes normalize_part keeps; every other byte of an index key separates
+PART_KEY_BYTES = frozenset(b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+def _next_bytes(tag, prefix, wanted):
+    # The bytes that follow prefix in some key of the tag, of those in
+    # wanted and those outside PART_KEY_BYTES; one seek per byte found, and
+    # one to skip each run of PART_KEY_BYTES
+    found = [byte for byte in sorted(wanted)
+             if (tag.next_key(prefix + bytes((byte,))) or b'').startswith(prefix + bytes((byte,)))]
+    low = 0
+    while low < 256:
+        key = tag.next_key(prefix + bytes((low,)))
+        if key is None or not key.startswith(prefix) or len(key) == len(prefix):
+            break
+        byte = key[len(prefix)]
+        if byte in PART_KEY_BYTES:
+            low = 0x3A if byte < 0x3A else 0x5B
+        else:
+            found.append(byte)
+            low = byte + 1
+    return found
+
+class IndexTag(ABC):
+    # One tag (index order) of an index file: a B-tree of fixed-length
+    # keys whose leaves hold 1-based record numbers. Subclasses read the
+    # nodes of their file format: node(offset) returns (leaf, entries),
+    # where leaf entries are (key, recno) and interior entries are
+    # (key, child offset) with the highest key under that child, or None
+    # for an unbounded last child.
+    def __init__(self, mm, filename, name, expression, key_length, root):
+        self.mm = mm
+        self.filename = filename
+        self.name = name
+        self.expression = expression
+        self.key_length = key_length
+        self.root = root
+        self._interior = {}
+    
+    def _read(self, offset, size):
+        if offset < 0 or offset + size > len(self.mm):
+            raise IndexFileError(f"node at {offset} is past the end of {self.filename}")
+        return self.mm[offset:offset + size]
+    
+    @abstractmethod
+    def node(self, offset):
+        pass
+    
+    def leaf_size(self, offset):
+        # (leaf, number of keys) of a node, without decoding its keys
+        leaf, entries = self.node(offset)
+        return leaf, len(entries)
+    
+    def cached_node(self, offset):
+        # Interior nodes are few and read by every seek, so they are kept
+        node = self._interior.get(offset)
+        if node is None:
+            node = self.node(offset)
+            if not node[0]:
+                self._interior[offset] = node
+        return node
+    
+    def seek(self, key, prefix=False):
+        # Record numbers whose key equals key (trailing blanks ignored), or
+        # starts with it, in key order. Only the nodes on the way down and
+        # the leaves holding matches are read.
+        matched = []
+        self._seek(self.root, key, prefix, matched, 0)
+        return matched
+    
+    def _seek(self, offset, key, prefix, matched, depth):
+        # False once a key past the wanted ones was seen
+        if depth > INDEX_MAX_DEPTH:
+            raise IndexFileError(f"{self.filename} tag {self.name} is deeper than {INDEX_MAX_DEPTH} levels")
+        leaf, entries = self.cached_node(offset)
+        for entry_key, value in entries:
+            head = None
+            if entry_key is not None:
+                entry_key = entry_key.rstrip(b' \x00')
+                head = entry_key[:len(key)] if prefix else entry_key
+                if head < key:
+                    continue
+            if leaf:
+                if head != key:
+                    return False
+                matched.append(value)
+            elif not self._seek(value, key, prefix, matched, depth + 1) or (head is not None and head > key):
+                return False
+        return True
+    
+    def next_key(self, key):
+        # The first key at or after key (trailing blanks ignored), or None
+        return self._next_key(self.root, key, 0)
+    
+    def _next_key(self, offset, key, depth):
+        if depth > INDEX_MAX_DEPTH:
+            raise IndexFileError(f"{self.filename} tag {self.name} is deeper than {INDEX_MAX_DEPTH} levels")
+        leaf, entries = self.cached_node(offset)
+        for entry_key, value in entries:
+            if entry_key is not None:
+                entry_key = entry_key.rstrip(b' \x00')
+                if entry_key < key:
+                    continue
+            if leaf:
+                return entry_key
+            found = self._next_key(value, key, depth + 1)
+            if found is not None:
+                return found
+        return None
+    
+    def count(self):
+        # Number of keys in the tag, from the leaf headers
+        total = 0
+        pending = [(self.root, 0)]
+        seen = set()
+        while pending:
+            offset, depth = pending.pop()
+            if offset in seen or depth > INDEX_MAX_DEPTH:
+                raise IndexFileError(f"{self.filename} tag {self.name} has a loop")
+            seen.add(offset)
+            leaf, size = self.leaf_size(offset)
+            if leaf:
+                total += size
+            else:
+                pending.extend((child, depth + 1) for _, child in self.node(offset)[1])
+        return total
+    
+    def first_keys(self, limit):
+        # Up to limit (key, recno) pairs from the leftmost leaf
+        offset = self.root
+        for _ in range(INDEX_MAX_DEPTH):
+            leaf, entries = self.node(offset)
+            if leaf:
+                return entries[:limit]
+            if not entries:
+                return []
+            offset = entries[0][1]
+        raise IndexFileError(f"{self.filename} tag {self.name} is deeper than {INDEX_MAX_DEPTH} levels")
+
+class NdxTag(IndexTag):
+    # dBASE III .NDX: 512-byte pages of (left page, recno, key) entries.
+    # Interior pages have one page pointer more than keys; leaves have no
+    # page pointers.
+    @classmethod
+    def open(cls, mm, filename):
+        root, key_length, key_type, entry_length = struct.unpack('<I8xHxxHH', mm[:20])
+        expression = mm[24:INDEX_PAGE_SIZE].split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+        if key_type != 0:
+            return []
+        tag = cls(mm, filename, os.path.splitext(os.path.basename(filename))[0].upper(),
+                  expression, key_length, root * INDEX_PAGE_SIZE)
+        tag.entry_length = entry_length or (8 + (key_length + 3) // 4 * 4)
+        return [tag]
+    
+    def node(self, offset):
+        page = self._read(offset, INDEX_PAGE_SIZE)
+        count = struct.unpack('<I', page[:4])[0]
+        size = self.entry_length
+        if 8 + count * size > len(page):
+            raise IndexFileError(f"bad page at {offset} in {self.filename}")
+        entries = []
+        leaf = count == 0 or struct.unpack('<I', page[4:8])[0] == 0
+        for i in range(count):
+            start = 4 + i * size
+            child, recno = struct.unpack('<II', page[start:start + 8])
+            key = page[start + 8:start + 8 + self.key_length]
+            entries.append((key, recno) if leaf else (key, child * INDEX_PAGE_SIZE))
+        if not leaf:
+            start = 4 + count * size
+            entries.append((None, struct.unpack('<I', page[start:start + 4])[0] * INDEX_PAGE_SIZE))
+        return leaf, entries
+    
+    def leaf_size(self, offset):
+        page = self._read(offset, 8)
+        count = struct.unpack('<I', page[:4])[0]
+        return count == 0 or struct.unpack('<I', page[4:8])[0] == 0, count
+
+class MdxTag(IndexTag):
+    # dBASE IV .MDX: a tag table at byte 544, and nodes of (recno or
+    # child page, key) entries in blocks of the size set in the header.
+    # As in NDX, interior nodes end with one more page pointer than keys.
+    TAG_TABLE = 544
+    TAG_ENTRY = 32
+    
+    @classmethod
+    def open(cls, mm, filename):
+        block_size, = struct.unpack('<H', mm[22:24])
+        tag_count, = struct.unpack('<H', mm[28:30])
+        tags = []
+        for i in range(tag_count):
+            start = cls.TAG_TABLE + i * cls.TAG_ENTRY
+            entry = mm[start:start + cls.TAG_ENTRY]
+            if len(entry) < cls.TAG_ENTRY:
+                break
+            header_page, = struct.unpack('<I', entry[:4])
+            name = entry[4:15].split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+            header = mm[header_page * INDEX_PAGE_SIZE:(header_page + 1) * INDEX_PAGE_SIZE]
+            if len(header) < INDEX_PAGE_SIZE:
+                continue
+            root, key_format, key_type, key_length, entry_length = struct.unpack('<I4xBcxxH2x2xH', header[:20])
+            # 0x08 marks a descending tag
+            if key_type != b'C' or key_format & 0x08:
+                continue
+            expression = header[24:INDEX_PAGE_SIZE].split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+            tag = cls(mm, filename, name, expression, key_length, root * INDEX_PAGE_SIZE)
+            tag.block_size = block_size or INDEX_PAGE_SIZE
+            tag.entry_length = entry_length or (4 + (key_length + 3) // 4 * 4)
+            tags.append(tag)
+        return tags
+    
+    def node(self, offset):
+        block = self._read(offset, self.block_size)
+        count = struct.unpack('<I', block[:4])[0]
+        size = self.entry_length
+        if 8 + count * size + 4 > len(block):
+            raise IndexFileError(f"bad block at {offset} in {self.filename}")
+        last = 8 + count * size
+        leaf = struct.unpack('<I', block[last:last + 4])[0] == 0
+        entries = []
+        for i in range(count):
+            start = 8 + i * size
+            value, = struct.unpack('<I', block[start:start + 4])
+            key = block[start + 4:start + 4 + self.key_length]
+            entries.append((key, value) if leaf else (key, value * INDEX_PAGE_SIZE))
+        if not leaf:
+            entries.append((None, struct.unpack('<I', block[last:last + 4])[0] * INDEX_PAGE_SIZE))
+        return leaf, entries
+    
+    def leaf_size(self, offset):
+        count = struct.unpack('<I', self._read(offset, 4))[0]
+        last = offset + 8 + count * self.entry_length
+        return struct.unpack('<I', self._read(last, 4))[0] == 0, count
+
+class CdxTag(IndexTag):
+    # FoxPro .CDX (compact index). The file starts with a tag directory:
+    # itself a compact index whose keys are tag names and whose record
+    # numbers are the offsets of the tag headers. Interior nodes hold
+    # (key, recno, child) with big-endian numbers; leaf nodes pack recno,
+    # duplicate and trailing counts into a few bits per key and store the
+    # keys, minus the bytes shared with the previous key and the trailing
+    # blanks, backwards from the end of the node.
+    NODE_SIZE = 512
+    
+    @classmethod
+    def open(cls, mm, filename):
+        directory = cls.from_header(mm, filename, 0, 'directory')
+        if directory is None:
+            return []
+        tags = []
+        for name, offset in directory.entries():
+            tag = cls.from_header(mm, filename, offset, name.rstrip(b' \x00').decode('ascii', 'ignore'))
+            if tag is not None:
+                tags.append(tag)
+        return tags
+    
+    @classmethod
+    def from_header(cls, mm, filename, offset, name):
+        header = mm[offset:offset + 1024]
+        if len(header) < 1024:
+            return None
+        root, key_length, options = struct.unpack('<I8xHB', header[:15])
+        # Descending tags, and tags with a FOR clause that leave records out
+        descending, for_length = struct.unpack('<H2xH', header[502:508])
+        if descending or for_length > 1 or options & 0x08:
+            return None
+        expression = header[512:1024].split(b'\x00', 1)[0].decode('ascii', 'ignore').strip()
+        return cls(mm, filename, name, expression, key_length, root)
+    
+    def entries(self):
+        # Every (key, recno) of the tag in order, following the leaf chain
+        offset = self.first_leaf()
+        seen = set()
+        while offset not in seen and 0 <= offset < len(self.mm):
+            seen.add(offset)
+            yield from self.node(offset)[1]
+            offset, = struct.unpack('<i', self._read(offset + 8, 4))
+    
+    def first_leaf(self):
+        offset = self.root
+        for _ in range(INDEX_MAX_DEPTH):
+            leaf, entries = self.node(offset)
+            if leaf or not entries:
+                return offset
+            offset = entries[0][1]
+        raise IndexFileError(f"{self.filename} tag {self.name} is deeper than {INDEX_MAX_DEPTH} levels")
+    
+    def node(self, offset):
+        node = self._read(offset, self.NODE_SIZE)
+        attributes, count = struct.unpack('<HH', node[:4])
+        key_length = self.key_length
+        entries = []
+        if not attributes & 0x02:
+            size = key_length + 8
+            if 12 + count * size > self.NODE_SIZE:
+                raise IndexFileError(f"bad node at {offset} in {self.filename}")
+            for i in range(count):
+                start = 12 + i * size
+                child, = struct.unpack('>I', node[start + key_length + 4:start + size])
+                entries.append((node[start:start + key_length], child))
+            return False, entries
+        
+        (recno_mask, dup_mask, trail_mask, recno_bits, dup_bits,
+         trail_bits, width) = struct.unpack('<IBBBBBB', node[14:24])
+        if not width or 24 + count * width > self.NODE_SIZE:
+            raise IndexFileError(f"bad node at {offset} in {self.filename}")
+        end = self.NODE_SIZE
+        key = b''
+        for i in range(count):
+            info = int.from_bytes(node[24 + i * width:24 + (i + 1) * width], 'little')
+            duplicates = (info >> recno_bits) & dup_mask
+            trailing = (info >> (recno_bits + dup_bits)) & trail_mask
+            stored = key_length - duplicates - trailing
+            if stored < 0:
+                raise IndexFileError(f"bad node at {offset} in {self.filename}")
+            end -= stored
+            key = key[:duplicates] + node[end:end + stored] + b' ' * trailing
+            entries.append((key, info & recno_mask))
+        return True, entries
+    
+    def leaf_size(self, offset):
+        attributes, count = struct.unpack('<HH', self._read(offset, 4))
+        return bool(attributes & 0x02), count
+
+INDEX_FORMATS = {'.CDX': CdxTag, '.MDX': MdxTag, '.NDX': NdxTag}
+
+def find_index_tags(filename):
+    # Tags of the index files that can belong to the DBF table filename
+    folder, name = os.path.split(filename)
+    stem = os.path.splitext(name)[0].upper()
+    try:
+        entries = os.listdir(folder or '.')
+    except OSError:
+        return []
+    paths = []
+    for entry in sorted(entries):
+        entry_stem, extension = os.path.splitext(entry.upper())
+        if extension == '.NDX' or (extension in INDEX_EXTENSIONS and entry_stem == stem):
+            paths.append((os.path.join(folder, entry), INDEX_FORMATS[extension]))
+    
+    tags = []
+    for path, tag_class in paths:
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < 1024:
+                    continue
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            opened = tag_class.open(mm, path)
+            if not opened:
+                mm.close()
+            tags.extend(opened)
+        except (OSError, ValueError, struct.error, IndexFileError) as e:
+            print(f"Error reading index file {path}: {str(e)}")
+    return tags
+
+class TableRow(Mapping):
+    # Row proxy into a ColumnTable; holds no values of its own
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, name):
+        table = self._table
+        group_name, positions = table.groups[table.row_groups[self._row]]
+        if name == table.group_field:
+            return group_name
+        if name not in positions:
+            raise KeyError(name)
+        return table.columns[name][self._row]
+
+    def __iter__(self):
+        table = self._table
+        yield from table.groups[table.row_groups[self._row]][1]
+        yield table.group_field
+
+    def __len__(self):
+        table = self._table
+        return len(table.groups[table.row_groups[self._row]][1]) + 1
+
+    def __repr__(self):
+        return f"TableRow({dict(self)!r})"
+
+class ColumnTable(Sequence):
+    # Rows stored column by column: one list per column name, repeated
+    # values interned while loading, and the group (e.g. worksheet) of
+    # every row kept as a small integer. Rows of a group that lacks a
+    # column hold '' there and do not expose that key.
+    def __init__(self, group_field):
+        self.group_field = group_field
+        self.columns = {}
+        self.groups = []
+        self.row_groups = array('H')
+        self._group_columns = []
+        self._interned = {}
+
+    def add_group(self, group_name, names):
+        # Register a group with its column names; returns the group number.
+        # Like a dict, a repeated name keeps its last position.
+        positions = {name: i for i, name in enumerate(names)}
+        for name in positions:
+            if name not in self.columns:
+                self.columns[name] = [''] * len(self.row_groups)
+        self.groups.append((group_name, positions))
+        self._index_groups()
+        return len(self.groups) - 1
+
+    def _index_groups(self):
+        # Per group: (column list, value position) pairs and the columns it
+        # does not have
+        self._group_columns = []
+        for _, positions in self.groups:
+            present = [(self.columns[name], i) for name, i in positions.items()]
+            missing = [column for name, column in self.columns.items() if name not in positions]
+            self._group_columns.append((present, missing))
+
+    def append(self, group, values):
+        if self._interned is None:
+            self._interned = {}
+        intern = self._interned.setdefault
+        present, missing = self._group_columns[group]
+        for column, i in present:
+            value = values[i] if i < len(values) else ''
+            column.append(intern(value, value))
+        for column in missing:
+            column.append('')
+        self.row_groups.append(group)
+
+    def extend(self, other):
+        # Append the rows of another table after these, e.g. a worksheet
+        # read in another process; its groups are added after ours
+        offset = len(self.groups)
+        for group_name, positions in other.groups:
+            for name in positions:
+                if name not in self.columns:
+                    self.columns[name] = [''] * len(self.row_groups)
+            self.groups.append((group_name, positions))
+        self._index_groups()
+        blank = None
+        for name, column in self.columns.items():
+            values = other.columns.get(name)
+            if values is None:
+                if blank is None:
+                    blank = [''] * len(other)
+                values = blank
+            column.extend(values)
+        self.row_groups.extend(group + offset for group in other.row_groups)
+
+    def compact(self):
+        # Drop the interning table once loading is finished
+        self._interned = None
+
+    def column(self, name):
+        if name == self.group_field:
+            return [self.groups[group][0] for group in self.row_groups]
+        return self.columns.get(name)
+
+    def __len__(self):
+        return len(self.row_groups)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TableRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return TableRow(self, index)
+
+    def get_state(self):
+        return {
+            'group_field': self.group_field,
+            'columns': self.columns,
+            'groups': self.groups,
+            'row_groups': self.row_groups
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        table = cls(state['group_field'])
+        table.columns = state['columns']
+        table.groups = [(name, positions) for name, positions in state['groups']]
+        table.row_groups = state['row_groups']
+        table._index_groups()
+        table._interned = None
+        return table
+
+# Streaming xlsx reading: worksheets are parsed straight out of the zip
+# in batches of rows, without openpyxl's cell objects. Values come out as
+# openpyxl returns them with data_only=True, so both paths fill the same
+# table.
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_RELS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+XLSX_REL_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+XLSX_ROW, XLSX_CELL, XLSX_VALUE = XLSX_NS + 'row', XLSX_NS + 'c', XLSX_NS + 'v'
+XLSX_TEXT, XLSX_RUN, XLSX_INLINE = XLSX_NS + 't', XLSX_NS + 'r', XLSX_NS + 'is'
+
+# Built-in number formats that hold dates, and the rules openpyxl uses
+# for custom formats
+XLSX_DATE_FORMATS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+XLSX_TIMEDELTA_FORMATS = {46}
+XLSX_FORMAT_LITERALS = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+XLSX_DATE_CODES = re.compile(r'(?<![_\\])[dmhysDMHYS]')
+XLSX_TIMEDELTA_CODES = re.compile(r'\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?', re.I)
+
+# Worksheet rows are parsed in batches of about this many bytes
+XLSX_CHUNK_BYTES = 1 << 20
+XLSX_SHEET_DATA = re.compile(rb'<([\w.-]+:)?sheetData\b[^>]*?(/?)>')
+XLSX_NAMESPACES = re.compile(rb'xmlns(?::[\w.-]+)?="[^"]*"')
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+EXCEL_EPOCH_1904 = datetime.datetime(1904, 1, 1)
+
+class XlsxFormatError(Exception):
+    pass
+
+def excel_datetime(value, epoch=EXCEL_EPOCH, timedelta=False):
+    # Excel serial number to datetime, time or timedelta, rounded to the
+    # millisecond like openpyxl
+    if timedelta:
+        delta = datetime.timedelta(days=value)
+        if delta.microseconds:
+            delta = datetime.timedelta(seconds=delta.total_seconds() // 1,
+                                       microseconds=round(delta.microseconds, -3))
+        return delta
+    day, fraction = divmod(value, 1)
+    diff = datetime.timedelta(milliseconds=round(fraction * 86400 * 1000))
+    if 0 <= value < 1 and diff.days == 0:
+        minutes, seconds = divmod(diff.seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return datetime.time(hours, minutes, seconds, diff.microseconds)
+    if 0 < value < 60 and epoch == EXCEL_EPOCH:
+        # Excel counts the non-existent 1900-02-29
+        day += 1
+    return epoch + datetime.timedelta(days=day) + diff
+
+def _xlsx_text(element):
+    # Plain text of a string item: its text plus the text of its runs
+    parts = []
+    for child in element:
+        if child.tag == XLSX_TEXT:
+            parts.append(child.text or '')
+        elif child.tag == XLSX_RUN:
+            text = child.find(XLSX_TEXT)
+            if text is not None:
+                parts.append(text.text or '')
+    return ''.join(parts)
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+class XlsxWorkbook:
+    # Worksheet list, shared strings and date styles of an xlsx file; rows
+    # are streamed one sheet at a time
+    def __init__(self, filename):
+        self.filename = filename
+        self.zip = zipfile.ZipFile(filename)
+        try:
+            self._read_workbook()
+        except Exception:
+            self.zip.close()
+            raise
+        self._shared_strings = None
+        self._styles = None
+    
+    def close(self):
+        self.zip.close()
+    
+    def _rels(self, path):
+        # {relationship id: (type, target path)} of a part
+        folder, name = posixpath.split(path)
+        rels_path = posixpath.join(folder, '_rels', name + '.rels')
+        rels = {}
+        if rels_path not in self.zip.namelist():
+            return rels
+        with self.zip.open(rels_path) as f:
+            for _, element in iterparse(f):
+                if element.tag == XLSX_RELS_NS + 'Relationship':
+                    target = element.get('Target', '')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(posixpath.join(folder, target))
+                    rels[element.get('Id')] = (element.get('Type', '').rsplit('/', 1)[-1], target)
+        return rels
+    
+    def _read_workbook(self):
+        workbook_path = next((target for kind, target in self._rels('').values() if kind == 'officeDocument'),
+                             'xl/workbook.xml')
+        rels = self._rels(workbook_path)
+        self.sheets = []
+        self.epoch = EXCEL_EPOCH
+        with self.zip.open(workbook_path) as f:
+            for _, element in iterparse(f):
+                if element.tag == XLSX_NS + 'workbookPr':
+                    if element.get('date1904', '').lower() in ('1', 'true'):
+                        self.epoch = EXCEL_EPOCH_1904
+                elif element.tag == XLSX_NS + 'sheet':
+                    kind, target = rels.get(element.get(XLSX_REL_ID), (None, None))
+                    if kind == 'worksheet':
+                        self.sheets.append((element.get('name'), target))
+        parts = {kind: target for kind, target in rels.values()}
+        self.shared_strings_path = parts.get('sharedStrings')
+        self.styles_path = parts.get('styles')
+    
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            strings = []
+            if self.shared_strings_path in self.zip.namelist():
+                with self.zip.open(self.shared_strings_path) as f:
+                    context = iterparse(f, events=('start', 'end'))
+                    _, root = next(context)
+                    for event, element in context:
+                        if event == 'end' and element.tag == XLSX_NS + 'si':
+                            strings.append(_xlsx_text(element).replace('x005F_', ''))
+                            root.clear()
+            self._shared_strings = strings
+        return self._shared_strings
+    
+    @property
+    def styles(self):
+        # (date style indexes, timedelta style indexes)
+        if self._styles is None:
+            dates, timedeltas = set(), set()
+            if self.styles_path in self.zip.namelist():
+                custom = {}
+                with self.zip.open(self.styles_path) as f:
+                    in_cell_xfs = False
+                    style_index = 0
+                    for event, element in iterparse(f, events=('start', 'end')):
+                        if element.tag == XLSX_NS + 'numFmt' and event == 'end':
+                            custom[int(element.get('numFmtId'))] = element.get('formatCode', '')
+                        elif element.tag == XLSX_NS + 'cellXfs':
+                            in_cell_xfs = event == 'start'
+                        elif element.tag == XLSX_NS + 'xf' and in_cell_xfs and event == 'end':
+                            format_id = int(element.get('numFmtId', 0))
+                            if format_id in custom:
+                                code = custom[format_id].split(';')[0]
+                                if XLSX_DATE_CODES.search(XLSX_FORMAT_LITERALS.sub('', code)):
+                                    dates.add(style_index)
+                                if XLSX_TIMEDELTA_CODES.search(code):
+                                    timedeltas.add(style_index)
+                            else:
+                                if format_id in XLSX_DATE_FORMATS:
+                                    dates.add(style_index)
+                                if format_id in XLSX_TIMEDELTA_FORMATS:
+                                    timedeltas.add(style_index)
+                            style_index += 1
+            self._styles = (dates, timedeltas)
+        return self._styles
+    
+    def rows(self, path):
+        # Yield (row number, values) for every row element of a worksheet;
+        # values are indexed by column from A with None for missing cells
+        shared = self.shared_strings
+        dates, timedeltas = self.styles
+        epoch = self.epoch
+        columns = {}
+        styles = {}
+        row_number = 0
+        cell_tag, value_tag = XLSX_CELL, XLSX_VALUE
+        for element in self._row_elements(path):
+            number = element.get('r')
+            row_number = int(float(number)) if number else row_number + 1
+            values = []
+            column = 0
+            for cell in element:
+                if cell.tag != cell_tag:
+                    continue
+                ref = cell.get('r')
+                if ref:
+                    letters = ref.rstrip('0123456789')
+                    column = columns.get(letters)
+                    if column is None:
+                        column = columns[letters] = _column_number(letters)
+                else:
+                    column += 1
+                
+                cell_type = cell.get('t')
+                if cell_type == 's':
+                    value = cell.findtext(value_tag)
+                    value = shared[int(value)] if value else None
+                elif cell_type is None or cell_type == 'n':
+                    value = cell.findtext(value_tag)
+                    if value:
+                        value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+                        style = cell.get('s', '0')
+                        if style in styles:
+                            style = styles[style]
+                        else:
+                            style = styles[style] = int(style)
+                        if style in dates:
+                            try:
+                                value = excel_datetime(value, epoch, style in timedeltas)
+                            except (OverflowError, ValueError):
+                                value = '#VALUE!'
+                    else:
+                        value = None
+                elif cell_type == 'inlineStr':
+                    inline = cell.find(XLSX_INLINE)
+                    value = None if inline is None else _xlsx_text(inline)
+                else:
+                    value = cell.findtext(value_tag) or None
+                    if value is None:
+                        pass
+                    elif cell_type == 'b':
+                        value = bool(int(value))
+                    elif cell_type == 'd':
+                        raise XlsxFormatError(f"ISO date cell {ref} in {path}")
+                
+                if column > len(values):
+                    values.extend([None] * (column - len(values)))
+                values[column - 1] = value
+            
+            yield row_number, values
+    
+    def _row_elements(self, path):
+        # Row elements of a worksheet. The sheet data is cut after a closing
+        # row tag every XLSX_CHUNK_BYTES and each batch of rows is parsed in
+        # one call, under a root that repeats the worksheet's namespace
+        # declarations; that avoids a Python step per XML element. Sheets
+        # that do not fit this layout are read with iterparse.
+        with self.zip.open(path) as f:
+            buffer = b''
+            match = None
+            while match is None:
+                data = f.read(XLSX_CHUNK_BYTES)
+                if not data:
+                    break
+                buffer += data
+                match = XLSX_SHEET_DATA.search(buffer)
+        if match is None:
+            yield from self._iterparse_row_elements(path)
+            return
+        if match.group(2):
+            return
+        
+        root = b'<sheetData ' + b' '.join(XLSX_NAMESPACES.findall(buffer, 0, match.start())) + b'>'
+        close_row = b'</' + (match.group(1) or b'') + b'row>'
+        with self.zip.open(path) as f:
+            f.seek(match.end())
+            buffer = b''
+            while True:
+                data = f.read(XLSX_CHUNK_BYTES)
+                buffer += data
+                cut = buffer.rfind(close_row)
+                if cut >= 0:
+                    cut += len(close_row)
+                    parser = XMLParser()
+                    parser.feed(root)
+                    parser.feed(buffer[:cut])
+                    parser.feed(b'</sheetData>')
+                    yield from parser.close()
+                    buffer = buffer[cut:]
+                if not data:
+                    break
+    
+    def _iterparse_row_elements(self, path):
+        with self.zip.open(path) as f:
+            parent = None
+            for event, element in iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if parent is None and element.tag == XLSX_NS + 'sheetData':
+                        parent = element
+                    continue
+                if element.tag == XLSX_ROW:
+                    yield element
+                    if parent is not None:
+                        parent.clear()
+
+def xlsx_sheet_count(filename):
+    try:
+        workbook = XlsxWorkbook(filename)
+    except Exception:
+        return 0
+    workbook.close()
+    return len(workbook.sheets)
+
+def import_openpyxl():
+    # Return the openpyxl module, importing it the first time a workbook
+    # needs it, or None when it is not installed
+    global openpyxl
+    if openpyxl is None:
+        try:
+            import openpyxl
+        except ImportError:
+            openpyxl = False
+            print("Warning: openpyxl not installed. Only standard Excel files can be read.", file=sys.stderr)
+    return openpyxl or None
+
+class ExcelReader:
+    def __init__(self, filename, load=True, state=None):
+        self.filename = filename
+        self.records = ColumnTable('_sheet')
+        self.fields = []
+        self.schema = file_schema(filename)
+        if state is not None:
+            self.restore_state(state)
+        elif load:
+            self.read_excel()
+    
+    def read_excel(self):
+        try:
+            self.load_rows(self._iter_xlsx_rows())
+        except Exception as e:
+            # Workbooks the streaming reader cannot handle go through openpyxl
+            self.records = ColumnTable('_sheet')
+            self.fields = []
+            if not import_openpyxl():
+                print(f"Error reading Excel file {self.filename}: {str(e)}")
+                return
+            try:
+                self.load_rows(self._iter_openpyxl_rows())
+            except Exception as e:
+                print(f"Error reading Excel file {self.filename}: {str(e)}")
+        self.records.compact()
+    
+    def load_rows(self, rows):
+        # Append (sheet name, headers, values) rows to the table, without
+        # the columns the schema drops
+        table = self.records
+        last_headers = None
+        drop = self.schema.drop
+        for sheet_name, headers, values in rows:
+            if headers is not last_headers:
+                kept = [i for i, header in enumerate(headers) if header not in drop]
+                if len(kept) == len(headers):
+                    kept = None
+                group = table.add_group(sheet_name, headers if kept is None else [headers[i] for i in kept])
+                last_headers = headers
+            table.append(group, values if kept is None else tuple(values[i] if i < len(values) else '' for i in kept))
+    
+    def _iter_rows(self):
+        # Stream (sheet name, headers, values) for every non-empty row of
+        # every sheet; headers is the same list for all rows of a sheet
+        try:
+            workbook = XlsxWorkbook(self.filename)
+        except Exception:
+            if import_openpyxl():
+                yield from self._iter_openpyxl_rows()
+            return
+        workbook.close()
+        yield from self._iter_xlsx_rows()
+    
+    def _iter_xlsx_rows(self, sheets=None):
+        # Rows of the given sheet numbers (all by default), read with
+        # XlsxWorkbook. Like openpyxl's ws[1], headers come from row 1
+        # only and skip empty cells.
+        workbook = XlsxWorkbook(self.filename)
+        try:
+            for sheet_number, (sheet_name, path) in enumerate(workbook.sheets):
+                if sheets is not None and sheet_number not in sheets:
+                    continue
+                headers = None
+                width = 0
+                for row_number, row in workbook.rows(path):
+                    if headers is None:
+                        headers = [str(value).strip() for value in row if value] if row_number == 1 else []
+                        if not headers:
+                            break
+                        if not self.fields:
+                            self.fields = [{'name': h, 'type': 'C', 'length': 255} for h in self.schema.keep(headers)]
+                        width = len(headers)
+                        if row_number == 1:
+                            continue
+                    if row_number < 2 or not any(row):
+                        continue
+                    if len(row) < width:
+                        row.extend([None] * (width - len(row)))
+                    yield sheet_name, headers, tuple(str(value).strip() if value is not None else ''
+                                                     for value in row[:width])
+        finally:
+            workbook.close()
+    
+    def _iter_openpyxl_rows(self):
+        wb = openpyxl.load_workbook(self.filename, read_only=True, data_only=True)
+        try:
+            # Process each sheet
+            for sheet_name in wb.sheetnames:
+                ws = wb[sheet_name]
+                
+                # Get headers from first row; ws[1] fails on an empty sheet
+                headers = []
+                for value in next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ()):
+                    if value:
+                        headers.append(str(value).strip())
+                
+                if not headers:
+                    continue
+                
+                # Store fields info (similar to DBF format)
+                if not self.fields:  # Only set fields from first sheet
+                    self.fields = [{'name': h, 'type': 'C', 'length': 255} for h in self.schema.keep(headers)]
+                
+                width = len(headers)
+                
+                # Read data rows
+                for row in ws.iter_rows(min_row=2, values_only=True):
+                    # Skip empty rows
+                    if not any(row):
                         continue
                     
-                    record = {}
-                    offset = 1  # Skip deletion flag
-                    
-                    for field in self.fields:
-                        field_data = record_data[offset:offset+field['length']]
-                        value = field_data.decode('ascii', errors='ignore').strip()
-                        record[field['name']] = value
-                        offset += field['length']
-                    
-                    self.records.append(record)
-                    
+                    # Convert values to strings and handle None
+                    values = tuple(str(value).strip() if value is not None else '' for value in row[:width])
+                    yield sheet_name, headers, values
+        finally:
+            wb.close()
+    
+    def get_state(self):
+        return {'fields': self.fields, 'table': self.records.get_state()}
+    
+    def restore_state(self, state):
+        self.fields = state['fields']
+        self.records = ColumnTable.from_state(state['table'])
+    
+    def record(self, recno):
+        return self.records[recno]
+    
+    def text_values(self, recno, columns):
+        record = self.records[recno]
+        return tuple(record.get(column, '') for column in columns)
+    
+    def column(self, name):
+        return self.records.column(name)
+    
+    def close(self):
+        # Workbooks are read whole, so no file is left open; kept so that
+        # every reader can be closed alike
+        pass
+    
+    def iter_records(self, start=0, stop=None, columns=None):
+        # Yield (recno, values) for each row; streams from the workbook when
+        # the reader was created with load=False
+        table = self.records
+        if len(table):
+            names = columns if columns is not None else list(table.columns) + [table.group_field]
+            lists = [table.column(name) or repeat('', len(table)) for name in names]
+            yield from islice(enumerate(zip(*lists)), start, stop)
+            return
+        positions = None
+        last_headers = None
+        for recno, (sheet_name, headers, values) in islice(enumerate(self._iter_rows()), start, stop):
+            if headers is not last_headers:
+                positions = {h: i for i, h in enumerate(headers)}
+                last_headers = headers
+            if columns is None:
+                yield recno, values + ('',) * (len(headers) - len(values)) + (sheet_name,)
+            else:
+                yield recno, tuple(sheet_name if name == '_sheet' else
+                                   values[positions[name]] if positions.get(name, len(values)) < len(values) else ''
+                                   for name in columns)
+
+def find_part_fields(fields):
+    # Columns that look like part numbers; every column if none do. Memo
+    # fields are never part numbers and are not indexed.
+    fields = [field for field in fields if field.get('type') != 'M']
+    part_fields = []
+    for field in fields:
+        field_name = field['name'].upper()
+        if 'PART' in field_name or 'ITEM' in field_name or 'NUMBER' in field_name or 'PN' in field_name or 'CODIGO' in field_name:
+            part_fields.append(field['name'])
+    
+    # If no specific part fields found, search all fields
+    if not part_fields:
+        part_fields = [f['name'] for f in fields]
+    return part_fields
+
+def part_columns(reader):
+    # Part number columns of a reader, resolved once when the file is
+    # loaded: the schema's key columns, or those find_part_fields picks
+    names = {field['name'] for field in reader.fields}
+    missing = [name for name in reader.schema.key if name not in names]
+    if missing:
+        print(f"Warning: {reader.filename} has no key column {', '.join(missing)}")
+    return [name for name in reader.schema.key if name in names] or find_part_fields(reader.fields)
+
+def trigrams(value):
+    return {value[i:i+3] for i in range(len(value) - 2)}
+
+PART_SEPARATORS = re.compile(r'[^0-9A-Z]')
+CONFUSABLES = str.maketrans('OI', '01')
+
+def normalize_part(value, fold=False):
+    # Part number key without separators or leading zeros; fold also treats
+    # O/0 and I/1 as the same character
+    key = PART_SEPARATORS.sub('', value.upper()).lstrip('0')
+    if fold:
+        return fold_part_key(key)
+    return key
+
+def fold_part_key(key):
+    return key.translate(CONFUSABLES).lstrip('0')
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, or limit + 1 as soon as it must exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+def default_max_distance(key):
+    return 1 if len(key) < 12 else 2
+
+def _flat_lists(lists, items=None):
+    # (offsets, items) of lists stored end to end in items (an array of
+    # ids unless given); list i is items[offsets[i]:offsets[i + 1]]
+    items = array('I') if items is None else items
+    offsets = array('I', [0])
+    for part in lists:
+        items.extend(part)
+        offsets.append(len(items))
+    return offsets, items
+
+def _split_arrays(offsets, items):
+    return [items[start:stop] for start, stop in zip(offsets, offsets[1:])]
+
+class FuzzyIndex:
+    # Normalized keys of the distinct part numbers of one file, so that
+    # "MS20995C32" finds "MS-20995-C32". Keys are indexed by the trigrams of
+    # their folded form, which serves both substring lookups and near
+    # matches: a key within k edits of the query shares all but 3k of its
+    # trigrams, so only keys reaching that count are compared.
+    def __init__(self):
+        self.keys = []
+        self.key_ids = {}
+        self.key_values = []
+        self.grams = {}
+    
+    def add(self, value):
+        key = normalize_part(value)
+        if not key:
+            return
+        key_id = self.key_ids.get(key)
+        if key_id is not None:
+            values = self.key_values[key_id]
+            if isinstance(values, str):
+                self.key_values[key_id] = [values, value]
+            else:
+                values.append(value)
+            return
+        
+        key_id = len(self.keys)
+        self.keys.append(key)
+        self.key_ids[key] = key_id
+        self.key_values.append(value)
+        for gram in trigrams(fold_part_key(key)):
+            posting = self.grams.get(gram)
+            if posting is None:
+                self.grams[gram] = posting = array('I')
+            posting.append(key_id)
+    
+    def _values(self, key_ids):
+        values = []
+        for key_id in key_ids:
+            value = self.key_values[key_id]
+            if isinstance(value, str):
+                values.append(value)
+            else:
+                values.extend(value)
+        return values
+    
+    def lookup(self, query, fold=False, cancel=None):
+        # Part numbers whose normalized key contains the normalized query
+        target = normalize_part(query, fold)
+        if not target:
+            return []
+        grams = trigrams(fold_part_key(target))
+        if grams:
+            lists = sorted((self.grams.get(gram, ()) for gram in grams), key=len)
+            candidates = set(lists[0])
+            for posting in lists[1:]:
+                candidates.intersection_update(posting)
+        else:
+            candidates = range(len(self.keys))
+        
+        candidates = checked(candidates, cancel)
+        if fold:
+            matched = [key_id for key_id in candidates if target in fold_part_key(self.keys[key_id])]
+        else:
+            matched = [key_id for key_id in candidates if target in self.keys[key_id]]
+        return self._values(matched)
+    
+    def exact(self, query, fold=False):
+        # Part numbers whose normalized key equals the normalized query
+        target = normalize_part(query, fold)
+        if not target:
+            return []
+        if not fold:
+            key_id = self.key_ids.get(target)
+            return [] if key_id is None else self._values([key_id])
+        return [value for value in self.lookup(query, fold) if normalize_part(value, fold) == target]
+    
+    def near(self, query, max_distance=None, fold=False, cancel=None):
+        # Part numbers within max_distance edits of the query, as
+        # (distance, key, values) sorted closest first. Queries too short
+        # for the trigram filter return nothing.
+        key = normalize_part(query)
+        if not key:
+            return []
+        folded = fold_part_key(key)
+        target = folded if fold else key
+        if max_distance is None:
+            max_distance = default_max_distance(target)
+        
+        grams = trigrams(folded)
+        threshold = len(grams) - 3 * max_distance
+        if threshold <= 0:
+            return []
+        counts = {}
+        for gram in grams:
+            for key_id in checked(self.grams.get(gram, ()), cancel):
+                counts[key_id] = counts.get(key_id, 0) + 1
+        
+        found = []
+        for key_id in checked([key_id for key_id, count in counts.items() if count >= threshold], cancel):
+            candidate = self.keys[key_id]
+            distance = edit_distance(target, fold_part_key(candidate) if fold else candidate, max_distance)
+            if distance <= max_distance:
+                found.append((distance, candidate, self._values([key_id])))
+        found.sort()
+        return found
+    
+    def get_state(self):
+        # Lists of text and flat arrays only (see encode_state)
+        value_offsets, values = _flat_lists(([value] if isinstance(value, str) else value
+                                             for value in self.key_values), [])
+        grams = list(self.grams)
+        gram_offsets, gram_ids = _flat_lists(self.grams[gram] for gram in grams)
+        return {'keys': self.keys, 'value_offsets': value_offsets, 'values': values,
+                'grams': grams, 'gram_offsets': gram_offsets, 'gram_ids': gram_ids}
+    
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.keys = state['keys']
+        values = state['values']
+        offsets = state['value_offsets']
+        index.key_values = [values[start] if stop - start == 1 else values[start:stop]
+                            for start, stop in zip(offsets, offsets[1:])]
+        index.grams = dict(zip(state['grams'], _split_arrays(state['gram_offsets'], state['gram_ids'])))
+        index.key_ids = {key: i for i, key in enumerate(index.keys)}
+        return index
+
+class PartIndex:
+    # Trigram inverted index over the part number columns of one file.
+    # Distinct upper-cased values are indexed once; each value keeps the
+    # record numbers it occurs in (an int, or an array once repeated).
+    # Indexes built in parallel over record ranges are attached as shards.
+    def __init__(self, columns):
+        self.columns = columns
+        self.values = []
+        self.value_ids = {}
+        self.postings = []
+        self.grams = {}
+        self.shards = []
+        self.deleted = set()
+        self.fuzzy = None
+    
+    @classmethod
+    def build(cls, reader, start=0, stop=None):
+        index = cls(part_columns(reader))
+        for recno, values in reader.iter_records(start, stop, columns=index.columns):
+            index.add(recno, values)
+        return index
+    
+    def add(self, recno, values):
+        for value in values:
+            value = value.upper()
+            if value:
+                self._add_value(value, recno)
+    
+    def _add_value(self, value, recno):
+        value_id = self.value_ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            self.value_ids[value] = value_id
+            self.postings.append(recno)
+            for gram in trigrams(value):
+                posting = self.grams.get(gram)
+                if posting is None:
+                    self.grams[gram] = posting = array('I')
+                posting.append(value_id)
+            if self.fuzzy is not None:
+                self.fuzzy.add(value)
+            return
+        
+        posting = self.postings[value_id]
+        if isinstance(posting, int):
+            if posting != recno:
+                self.postings[value_id] = array('I', (posting, recno))
+        elif posting[-1] != recno:
+            posting.append(recno)
+    
+    def update(self, reader, appended, deleted, recalled):
+        # Patch the index with the result of DBFReader.refresh. Deleted
+        # records are filtered out at search time rather than unlinked.
+        added = []
+        for recno in recalled:
+            if recno in self.deleted:
+                self.deleted.discard(recno)
+            else:
+                added.append(recno)
+        self.deleted.update(deleted)
+        for recno in added + list(appended):
+            self.add(recno, reader.text_values(recno, self.columns))
+    
+    def build_fuzzy(self):
+        self.fuzzy = FuzzyIndex()
+        for shard in [self] + self.shards:
+            for value in shard.values:
+                self.fuzzy.add(value)
+    
+    def recnos_for(self, values):
+        # Record numbers holding any of the given (upper-cased) values
+        recnos = set()
+        for shard in [self] + self.shards:
+            for value in values:
+                value_id = shard.value_ids.get(value)
+                if value_id is None:
+                    continue
+                posting = shard.postings[value_id]
+                if isinstance(posting, int):
+                    recnos.add(posting)
+                else:
+                    recnos.update(posting)
+        return recnos - self.deleted
+    
+    def match(self, query, fold=False, exact=False, prefix=False, cancel=None):
+        # Substring matches on the part numbers as stored, plus matches on
+        # their normalized keys. exact only takes part numbers equal to the
+        # query once normalized; prefix only those starting with the query
+        # as typed. cancel is polled as in checked.
+        if prefix:
+            return self.search(query, prefix=True, cancel=cancel)
+        if exact:
+            if self.fuzzy is None:
+                return sorted(self.recnos_for([query.upper()]))
+            return sorted(self.recnos_for(self.fuzzy.exact(query, fold)))
+        recnos = set(self.search(query, cancel=cancel))
+        if self.fuzzy is not None:
+            recnos |= self.recnos_for(self.fuzzy.lookup(query, fold, cancel))
+        return sorted(recnos)
+    
+    def near(self, query, max_distance=None, fold=False, cancel=None):
+        if self.fuzzy is None:
+            return []
+        values = [value for _, _, values in self.fuzzy.near(query, max_distance, fold, cancel) for value in values]
+        return sorted(self.recnos_for(values))
+    
+    def filter(self, reader, recnos, query, fold=False, cancel=None):
+        # The records among recnos that still match the query, checked
+        # against their part number values; used to narrow a previous
+        # result set when the query is extended
+        query = query.upper()
+        key = normalize_part(query, fold)
+        matched = []
+        for recno in checked(recnos, cancel):
+            if recno in self.deleted:
+                continue
+            for value in reader.text_values(recno, self.columns):
+                value = value.upper()
+                if query in value or (key and key in normalize_part(value, fold)):
+                    matched.append(recno)
+                    break
+        return matched
+    
+    def merge(self, other):
+        # Attach an index built over other records of the same file. It is
+        # kept as a shard because re-inserting its values would cost about
+        # as much as building them.
+        self.shards.append(other)
+        self.shards.extend(other.shards)
+        other.shards = []
+    
+    def candidates(self, query):
+        # Ids of values that contain every trigram of the query
+        if len(query) < 3:
+            return range(len(self.values))
+        
+        lists = []
+        for gram in trigrams(query):
+            posting = self.grams.get(gram)
+            if posting is None:
+                return ()
+            lists.append(posting)
+        
+        lists.sort(key=len)
+        result = set(lists[0])
+        for posting in lists[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+    
+    def search(self, query, prefix=False, cancel=None):
+        # Record numbers whose part number columns contain the query, or
+        # start with it when prefix is set
+        query = query.upper()
+        recnos = set()
+        for shard in [self] + self.shards:
+            for value_id in checked(shard.candidates(query), cancel):
+                value = shard.values[value_id]
+                if value.startswith(query) if prefix else query in value:
+                    posting = shard.postings[value_id]
+                    if isinstance(posting, int):
+                        recnos.add(posting)
+                    else:
+                        recnos.update(posting)
+        if self.deleted:
+            recnos -= self.deleted
+        return sorted(recnos)
+    
+    def get_state(self):
+        # Lists of text and flat arrays only (see encode_state): the
+        # postings and trigram lists are stored end to end with their
+        # offsets
+        posting_offsets, postings = _flat_lists((posting,) if isinstance(posting, int) else posting
+                                                for posting in self.postings)
+        grams = list(self.grams)
+        gram_offsets, gram_ids = _flat_lists(self.grams[gram] for gram in grams)
+        return {
+            'columns': self.columns,
+            'values': self.values,
+            'posting_offsets': posting_offsets,
+            'postings': postings,
+            'grams': grams,
+            'gram_offsets': gram_offsets,
+            'gram_ids': gram_ids,
+            'shards': [shard.get_state() for shard in self.shards],
+            'deleted': array('I', sorted(self.deleted)),
+            'fuzzy': self.fuzzy.get_state() if self.fuzzy is not None else None
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        index = cls(state['columns'])
+        index.values = state['values']
+        postings = state['postings']
+        offsets = state['posting_offsets']
+        index.postings = [postings[start] if stop - start == 1 else postings[start:stop]
+                          for start, stop in zip(offsets, offsets[1:])]
+        index.grams = dict(zip(state['grams'], _split_arrays(state['gram_offsets'], state['gram_ids'])))
+        index.value_ids = {value: i for i, value in enumerate(index.values)}
+        index.shards = [cls.from_state(shard) for shard in state['shards']]
+        index.deleted = set(state['deleted'])
+        if state['fuzzy'] is not None:
+            index.fuzzy = FuzzyIndex.from_state(state['fuzzy'])
+        return index
+
+class SeekIndex:
+    # Stands in for PartIndex on a DBF table whose part number columns all
+    # have usable index tags, so exact and prefix lookups need no index
+    # build. Exact lookups compare normalized part numbers like PartIndex
+    # (see DBFReader.seek_part); prefix lookups take the query as typed.
+    # Any other lookup, or an index file that fails to read, builds the
+    # PartIndex on first use instead; once built, it answers everything.
+    def __init__(self, reader, columns):
+        self.reader = reader
+        self.columns = columns
+        self.index = None
+    
+    def fallback(self):
+        if self.index is None:
+            self.index = PartIndex.build(self.reader)
+            self.index.build_fuzzy()
+        return self.index
+    
+    @property
+    def values(self):
+        # Distinct part numbers held in memory, as on PartIndex; none
+        # until the fallback is built
+        return self.index.values if self.index is not None else []
+    
+    @property
+    def shards(self):
+        return self.index.shards if self.index is not None else []
+    
+    def update(self, reader, appended, deleted, recalled):
+        # After DBFReader.refresh the tags are checked again on the next
+        # seek; a built fallback is patched like any PartIndex
+        if self.index is not None:
+            self.index.update(reader, appended, deleted, recalled)
+    
+    def match(self, query, fold=False, exact=False, prefix=False, cancel=None):
+        if self.index is not None or fold or not (exact or prefix):
+            return self.fallback().match(query, fold, exact, prefix, cancel)
+        recnos = set()
+        try:
+            for column in self.columns:
+                if prefix:
+                    found = self.reader.seek(column, query, prefix=True)
+                else:
+                    found = self.reader.seek_part(column, normalize_part(query))
+                if found is None:
+                    return self.fallback().match(query, fold, exact, prefix, cancel)
+                recnos.update(found)
+        except (IndexFileError, struct.error) as e:
+            print(f"Error reading the index files of {self.reader.filename}, searching the table: {str(e)}",
+                  file=sys.stderr)
+            return self.fallback().match(query, fold, exact, prefix, cancel)
+        return sorted(recnos)
+    
+    def near(self, query, max_distance=None, fold=False, cancel=None):
+        return self.fallback().near(query, max_distance, fold, cancel)
+    
+    def filter(self, reader, recnos, query, fold=False, cancel=None):
+        return self.fallback().filter(reader, recnos, query, fold, cancel)
+
+def open_seek_index(filepath):
+    # (reader, SeekIndex) for a DBF table whose part number columns all
+    # have usable index tags, else None
+    reader = DBFReader(filepath)
+    columns = part_columns(reader)
+    tags = reader.index_tags()
+    if reader.records and columns and all(column in tags for column in columns):
+        return reader, SeekIndex(reader, columns)
+    reader.close()
+    return None
+
+# Alternate part numbers: each ALTPART.DBF record pairs a part number
+# with one that can replace it
+ALTERNATE_FILE = 'ALTPART.DBF'
+ALTERNATE_FIELDS = ('PARTNO', 'ALTPARTNO')
+
+def alternate_columns(reader):
+    # The part number and alternate columns of ALTPART.DBF: the first two
+    # key columns of its schema, else PARTNO and ALTPARTNO, else the first
+    # two columns part_columns picks; None when there is no such pair
+    names = {field['name'] for field in reader.fields}
+    if not reader.schema.key and set(ALTERNATE_FIELDS) <= names:
+        return list(ALTERNATE_FIELDS)
+    columns = part_columns(reader)
+    return columns[:2] if len(columns) >= 2 else None
+
+class AlternateParts:
+    # Families of interchangeable part numbers. Every pair joins the two
+    # normalized keys with union-find, so alternates of alternates (A-B,
+    # B-C) end up in one family.
+    def __init__(self):
+        self.parent = {}
+        self.names = {}
+        self.members = {}
+        self.folded = {}
+        self.columns = None
+    
+    def _find(self, key):
+        parent = self.parent
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+    
+    def _key(self, value):
+        key = normalize_part(value)
+        if key and key not in self.parent:
+            self.parent[key] = key
+            self.names[key] = value.strip().upper()
+        return key
+    
+    def add(self, part, alternate):
+        part_key, alternate_key = self._key(part), self._key(alternate)
+        if part_key and alternate_key:
+            part_root, alternate_root = self._find(part_key), self._find(alternate_key)
+            if part_root != alternate_root:
+                self.parent[alternate_root] = part_root
+    
+    def build(self, reader):
+        self.columns = alternate_columns(reader)
+        if self.columns is None:
+            print(f"Warning: {reader.filename} has no pair of part number columns; alternates are off")
+            log_event('alternates', file=os.path.basename(reader.filename), columns=None)
+            return self
+        for _, (part, alternate) in reader.iter_records(columns=self.columns):
+            self.add(part, alternate)
+        
+        # Members per family, and keys per folded key for fold lookups
+        self.members = {}
+        self.folded = {}
+        for key in self.parent:
+            self.members.setdefault(self._find(key), []).append(key)
+            self.folded.setdefault(fold_part_key(key), []).append(key)
+        return self
+    
+    def family(self, part_number, fold=False):
+        # Part numbers interchangeable with part_number, itself included;
+        # empty when it has no alternates
+        key = normalize_part(part_number)
+        if fold:
+            keys = self.folded.get(fold_part_key(key), [])
+        else:
+            keys = [key] if key in self.parent else []
+        roots = {self._find(key) for key in keys}
+        family = sorted(self.names[member] for root in roots for member in self.members[root])
+        return family if len(family) > 1 else []
+
+CACHE_VERSION = 9
+
+# Cache entries are JSON with every array replaced by a reference into the
+# binary section that follows it, so reading an entry never runs code from
+# the file the way unpickling would
+STATE_TYPECODES = frozenset('bBhHiIlLqQfd')
+
+def encode_state(state):
+    blobs = []
+    size = [0]
+    
+    def default(value):
+        if isinstance(value, array):
+            blob = value.tobytes()
+            blobs.append(blob)
+            size[0] += len(blob)
+            return {'$array': value.typecode, 'offset': size[0] - len(blob), 'count': len(value)}
+        if isinstance(value, (set, frozenset)):
+            return {'$set': sorted(value)}
+        if isinstance(value, range):
+            return {'$range': [value.start, value.stop, value.step]}
+        raise TypeError(f"cannot store {type(value).__name__}")
+    
+    header = json.dumps(state, default=default, separators=(',', ':')).encode('utf-8')
+    return b''.join([struct.pack('<I', len(header)), header] + blobs)
+
+def decode_state(payload):
+    # Inverse of encode_state; raises ValueError for a damaged payload
+    payload = memoryview(payload)
+    if len(payload) < 4:
+        raise ValueError("truncated state")
+    (length,) = struct.unpack_from('<I', payload)
+    base = 4 + length
+    if base > len(payload):
+        raise ValueError("truncated state")
+    
+    def restore(obj):
+        if '$array' in obj:
+            if obj['$array'] not in STATE_TYPECODES:
+                raise ValueError(f"unknown array type {obj['$array']!r}")
+            values = array(obj['$array'])
+            start = base + obj['offset']
+            stop = start + obj['count'] * values.itemsize
+            if obj['offset'] < 0 or stop > len(payload):
+                raise ValueError("truncated state")
+            values.frombytes(payload[start:stop])
+            return values
+        if '$set' in obj:
+            return set(obj['$set'])
+        if '$range' in obj:
+            return range(*obj['$range'])
+        return obj
+    
+    return json.loads(bytes(payload[4:base]).decode('utf-8'), object_hook=restore)
+
+def cache_dir():
+    # Per-user local folder of the parse cache; PARTLOOKUP_CACHE_DIR
+    # overrides it
+    folder = os.environ.get('PARTLOOKUP_CACHE_DIR', '').strip()
+    if folder:
+        return folder
+    if sys.platform == 'win32':
+        return os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local'), 'PartLookup')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/PartLookup')
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'partlookup')
+
+def dbf_record_count(filename):
+    with open(filename, 'rb') as f:
+        header = f.read(8)
+    return struct.unpack('<I', header[4:8])[0] if len(header) == 8 else 0
+
+class ParsedCache:
+    # SQLite store of parsed reader state in the user's local cache folder
+    # (see cache_dir), never next to the shared data. An entry is only used
+    # while the source file keeps the same path, size, mtime and (for DBF
+    # files) header record count; anything else is re-parsed and replaced.
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'parsed.sqlite')
+        self.conn = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS parsed ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                'num_records INTEGER, version INTEGER, payload BLOB)'
+            )
+        except (OSError, sqlite3.Error) as e:
+            print(f"Parse cache disabled ({self.path}): {str(e)}")
+            self.conn = None
+    
+    @staticmethod
+    def signature(filename):
+        st = os.stat(filename)
+        num_records = dbf_record_count(filename) if filename.upper().endswith('.DBF') else -1
+        return (st.st_size, st.st_mtime_ns, num_records)
+    
+    def load(self, filename, signature):
+        if self.conn is None:
+            return None
+        try:
+            row = self.conn.execute(
+                'SELECT size, mtime_ns, num_records, version, payload FROM parsed WHERE path = ?',
+                (os.path.abspath(filename),)
+            ).fetchone()
+            if row is None or tuple(row[:3]) != signature or row[3] != CACHE_VERSION:
+                return None
+            return decode_state(row[4])
         except Exception as e:
-            print(f"Error reading {self.filename}: {str(e)}")
+            print(f"Ignoring parse cache entry for {filename}: {str(e)}")
+            return None
+    
+    def holds(self, filename, signature):
+        # Whether a current entry exists, without reading its payload
+        if self.conn is None:
+            return False
+        try:
+            row = self.conn.execute(
+                'SELECT size, mtime_ns, num_records, version FROM parsed WHERE path = ?',
+                (os.path.abspath(filename),)
+            ).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None and tuple(row[:3]) == signature and row[3] == CACHE_VERSION
+    
+    def store(self, filename, signature, state):
+        if self.conn is None:
+            return
+        try:
+            payload = encode_state(state)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(filename),) + tuple(signature) + (CACHE_VERSION, sqlite3.Binary(payload))
+            )
+            self.conn.commit()
+        except Exception as e:
+            print(f"Could not update parse cache for {filename}: {str(e)}")
+    
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# Compiled snapshot of the data folder (see compile_snapshot). Bump when
+# the snapshot layout changes; older snapshots are then ignored.
+SNAPSHOT_VERSION = 2
+
+def snapshot_path(data_dir):
+    # PARTLOOKUP_SNAPSHOT overrides the default next to the data folder
+    return (os.environ.get('PARTLOOKUP_SNAPSHOT', '').strip()
+            or os.path.join(os.path.dirname(data_dir), 'AirDataDatabase.snapshot'))
+
+def quote_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def snapshot_value(value):
+    # SQLite value of a decoded field; dates are stored as ISO text
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+def snapshot_text_columns(reader):
+    # DBF columns whose decoded value is not the field text (numbers,
+    # dates, logicals, binary fields); the snapshot keeps their text as
+    # well, for iter_records and text_values
+    if not isinstance(reader, DBFReader):
+        return []
+    return [field['name'] for field in reader.fields if field['type'] not in ('C', 'M')]
+
+def _snapshot_converter(field):
+    # Inverse of snapshot_value for one field, None when values are stored
+    # as they are decoded
+    field_type = field.get('type')
+    if field_type == 'D':
+        return datetime.date.fromisoformat
+    if field_type == 'T':
+        return datetime.datetime.fromisoformat
+    if field_type == 'L':
+        return bool
+    return None
+
+def compile_snapshot(data_dir, path=None, progress=None):
+    # Stream every source file into one SQLite database: a table of the
+    # records of each file, and a table of its part number values with a
+    # B-tree index on each form (as stored, normalized, folded) and an FTS5
+    # trigram index for substring search. Written to a temporary file that
+    # replaces the snapshot once complete. Returns the number of records.
+    path = path or snapshot_path(data_dir)
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    total = 0
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE snapshot (name TEXT PRIMARY KEY, value)')
+        conn.execute('CREATE TABLE sources (filename TEXT PRIMARY KEY, type TEXT, number INTEGER, '
+                     'size INTEGER, mtime_ns INTEGER, num_records INTEGER, records INTEGER, '
+                     'fields TEXT, columns TEXT, text_columns TEXT, part_columns TEXT, schema TEXT)')
+        try:
+            conn.execute("CREATE VIRTUAL TABLE fts_probe USING fts5(value, tokenize='trigram')")
+            conn.execute('DROP TABLE fts_probe')
+            fts = True
+        except sqlite3.OperationalError:
+            print("SQLite has no FTS5 trigram tokenizer; substring searches will scan the part numbers")
+            fts = False
+        
+        for number, (filename, reader_class, file_type, filepath) in enumerate(data_sources(data_dir)):
+            if progress:
+                progress(filename)
+            signature = ParsedCache.signature(filepath)
+            reader = reader_class(filepath)
+            try:
+                if not reader.records:
+                    continue
+                key_columns = part_columns(reader)
+                count = _compile_source(conn, number, reader, key_columns, fts)
+            finally:
+                if isinstance(reader, DBFReader):
+                    reader.close()
+            conn.execute('INSERT INTO sources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (filename, file_type, number) + tuple(signature)
+                         + (count, json.dumps(reader.fields), json.dumps(reader_columns(reader)),
+                            json.dumps(snapshot_text_columns(reader)), json.dumps(key_columns),
+                            reader.schema.token()))
+            total += count
+        conn.execute('INSERT INTO snapshot VALUES (?, ?)', ('version', SNAPSHOT_VERSION))
+        conn.execute('INSERT INTO snapshot VALUES (?, ?)', ('fts', int(fts)))
+        conn.execute('INSERT INTO snapshot VALUES (?, ?)', ('created', datetime.datetime.now().isoformat(' ', 'seconds')))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(temp_path)
+        raise
+    conn.close()
+    os.replace(temp_path, path)
+    return total
+
+def reader_columns(reader):
+    # Every column a record of the reader can hold, in order; workbook
+    # sheets can add columns the first sheet does not have
+    if isinstance(reader, ExcelReader):
+        return list(reader.records.columns) + [reader.records.group_field]
+    if isinstance(reader, SnapshotReader):
+        return list(reader.columns)
+    return [field['name'] for field in reader.fields]
+
+def _compile_source(conn, number, reader, key_columns, fts):
+    columns = reader_columns(reader)
+    text_columns = snapshot_text_columns(reader)
+    records = f'records_{number}'
+    parts = f'parts_{number}'
+    # The field text of text_columns follows the values, as "NAME:text"
+    conn.execute(f'CREATE TABLE {records} (recno INTEGER PRIMARY KEY, '
+                 + ', '.join(quote_name(column) for column in columns + [f'{name}:text' for name in text_columns])
+                 + ')')
+    insert = (f'INSERT INTO {records} VALUES (?' + ', ?' * (len(columns) + len(text_columns)) + ')')
+    if isinstance(reader, DBFReader):
+        rows = ((recno,) + tuple(snapshot_value(record[column]) for column in columns) + texts
+                for record, (recno, texts) in zip(reader.records, reader.iter_records(columns=text_columns)))
+    else:
+        # Columns missing from a row's sheet are stored as NULL and left
+        # out of the record again when it is read
+        rows = ((recno,) + tuple(row[column] if column in row else None for column in columns)
+                for recno, row in enumerate(reader.records))
+    conn.executemany(insert, rows)
+    count = conn.execute(f'SELECT COUNT(*) FROM {records}').fetchone()[0]
+    
+    conn.execute(f'CREATE TABLE {parts} (recno INTEGER NOT NULL, value TEXT NOT NULL, '
+                 'key TEXT NOT NULL, fkey TEXT NOT NULL)')
+    
+    def part_rows():
+        for recno, values in reader.iter_records(columns=key_columns):
+            for value in {value.upper() for value in values if value}:
+                key = normalize_part(value)
+                yield recno, value, key, fold_part_key(key)
+    conn.executemany(f'INSERT INTO {parts} VALUES (?, ?, ?, ?)', part_rows())
+    for column in ('value', 'key', 'fkey'):
+        conn.execute(f'CREATE INDEX {parts}_{column} ON {parts} ({column})')
+    if fts:
+        conn.execute(f"CREATE VIRTUAL TABLE {parts}_fts USING fts5(value, key, fkey, content='{parts}', "
+                     "tokenize='trigram', detail='column')")
+        conn.execute(f"INSERT INTO {parts}_fts ({parts}_fts) VALUES ('rebuild')")
+    return count
+
+class Snapshot:
+    # Read-only view of a compiled snapshot. Every thread gets its own
+    # connection, as the GUI searches and the server answers requests on
+    # worker threads.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self.connection()
+        settings = dict(conn.execute('SELECT name, value FROM snapshot'))
+        if settings.get('version') != SNAPSHOT_VERSION:
+            raise sqlite3.DatabaseError(f"snapshot version {settings.get('version')}, expected {SNAPSHOT_VERSION}")
+        self.fts = bool(settings.get('fts'))
+        self.created = settings.get('created')
+        self.sources = {}
+        for row in conn.execute('SELECT filename, type, number, size, mtime_ns, num_records, records, '
+                                'fields, columns, text_columns, part_columns, schema FROM sources'):
+            self.sources[row[0]] = {
+                'type': row[1],
+                'number': row[2],
+                'signature': tuple(row[3:6]),
+                'records': row[6],
+                'fields': json.loads(row[7]),
+                'columns': json.loads(row[8]),
+                'text_columns': json.loads(row[9]),
+                'part_columns': json.loads(row[10]),
+                'schema': row[11]
+            }
+    
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+        return conn
+    
+    def covers(self, filename, signature, schema):
+        # Whether the snapshot holds filename as it is now on disk, read
+        # with the same schema
+        source = self.sources.get(filename)
+        return source is not None and source['signature'] == tuple(signature) and source['schema'] == schema.token()
+    
+    def open(self, filename, filepath):
+        reader = SnapshotReader(self, filename, filepath)
+        return reader, SnapshotIndex(self, self.sources[filename])
+
+def open_snapshot(data_dir):
+    # The compiled snapshot of data_dir, or None when there is none or it
+    # cannot be read
+    path = snapshot_path(data_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        return Snapshot(path)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Ignoring snapshot {path}: {str(e)}")
+        return None
+
+class SnapshotRecords(Sequence):
+    # Records of a snapshot table in record number order, read on access
+    def __init__(self, reader):
+        self.reader = reader
+    
+    def __len__(self):
+        return self.reader.num_records
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.reader.record(recno) for recno in self.reader.recnos()[index]]
+        return self.reader.record(self.reader.recnos()[index])
+
+class SnapshotReader:
+    # Reader over one file of a snapshot; a record is one row fetched by
+    # its record number when accessed
+    def __init__(self, snapshot, filename, filepath):
+        source = snapshot.sources[filename]
+        self.snapshot = snapshot
+        self.filename = filepath
+        self.fields = source['fields']
+        self.columns = source['columns']
+        self.num_records = source['records']
+        # As the snapshot only covers files compiled with the current
+        # schema, it is the schema of the source file
+        self.schema = file_schema(filepath)
+        self.signature = source['signature']
+        self.table = f"records_{source['number']}"
+        self.records = SnapshotRecords(self)
+        self._recnos = None
+        self._sparse = source['type'] == 'Excel'
+        field_types = {field['name']: field for field in self.fields}
+        self._converters = [_snapshot_converter(field_types.get(column, {})) for column in self.columns]
+        self._select = f'SELECT * FROM {self.table} WHERE recno = ?'
+        # Position in a row of the text of each column, after the recno
+        text_columns = {name: len(self.columns) + i for i, name in enumerate(source['text_columns'])}
+        self._text_positions = {column: text_columns.get(column, i) for i, column in enumerate(self.columns)}
+    
+    def recnos(self):
+        # Record numbers in order, read once; the rows of a table without
+        # deleted records are numbered from 0
+        if self._recnos is None:
+            conn = self.snapshot.connection()
+            last = conn.execute(f'SELECT MAX(recno) FROM {self.table}').fetchone()[0]
+            if last is None or last + 1 == self.num_records:
+                self._recnos = range(self.num_records)
+            else:
+                self._recnos = array('I', (row[0] for row in conn.execute(
+                    f'SELECT recno FROM {self.table} ORDER BY recno')))
+        return self._recnos
+    
+    def _row(self, values):
+        record = {}
+        for column, convert, value in zip(self.columns, self._converters, values):
+            if value is None:
+                if self._sparse:
+                    continue
+            elif convert is not None:
+                value = convert(value)
+            record[column] = value
+        return record
+    
+    def record(self, recno):
+        row = self.snapshot.connection().execute(self._select, (recno,)).fetchone()
+        if row is None:
+            raise IndexError(recno)
+        return self._row(row[1:])
+    
+    def _texts(self, row, positions):
+        # Field text of the given row positions, as the source reader's
+        # iter_records and text_values give it
+        return tuple('' if row[i] is None else str(row[i]) for i in positions)
+    
+    def text_values(self, recno, columns):
+        row = self.snapshot.connection().execute(self._select, (recno,)).fetchone()
+        if row is None:
+            raise IndexError(recno)
+        return self._texts(row, [self._text_positions[column] + 1 for column in columns])
+    
+    def iter_records(self, start=0, stop=None, columns=None):
+        names = list(columns) if columns is not None else self.columns
+        positions = [self._text_positions[name] + 1 for name in names]
+        recnos = self.recnos()
+        if start >= len(recnos):
+            return
+        limit = -1 if stop is None else max(stop - start, 0)
+        rows = self.snapshot.connection().execute(
+            f'SELECT * FROM {self.table} WHERE recno >= ? ORDER BY recno LIMIT ?', (recnos[start], limit))
+        for row in rows:
+            yield row[0], self._texts(row, positions)
+    
+    def refresh(self):
+        # The snapshot does not change; once its source file does, the
+        # file has to be loaded again from the source
+        if ParsedCache.signature(self.filename) != self.signature:
+            return None
+        return [], [], []
+    
+    def close(self):
+        pass
+
+class SnapshotIndex:
+    # Part number lookups in a snapshot with SQL, matching as PartIndex
+    # does: the stored values, normalized keys and folded keys each have a
+    # B-tree index, and substring searches go through the FTS5 trigram
+    # index (queries under three characters scan the values)
+    def __init__(self, snapshot, source):
+        self.snapshot = snapshot
+        self.columns = source['part_columns']
+        self.table = f"parts_{source['number']}"
+        self.fuzzy = None
+        self._fuzzy_lock = threading.Lock()
+    
+    def _recnos(self, sql, params):
+        return [row[0] for row in self.snapshot.connection().execute(sql, params)]
+    
+    def _contains(self, column, text):
+        # SQL and parameters for the rows whose column contains text. GLOB
+        # (values are upper-cased) with bracketed wildcards is answered from
+        # the trigram index, where LIKE with an ESCAPE clause is not.
+        pattern = '*' + re.sub(r'([*?\[])', r'[\1]', text) + '*'
+        source = f'{self.table}_fts' if self.snapshot.fts else self.table
+        return f'SELECT rowid FROM {source} WHERE {column} GLOB ?', (pattern,)
+    
+    def match(self, query, fold=False, exact=False, prefix=False, cancel=None):
+        # The SQL runs to completion; cancel only applies to near and filter
+        query = query.upper()
+        if prefix:
+            return self._recnos(f'SELECT DISTINCT recno FROM {self.table} WHERE value >= ? AND value < ? '
+                                'ORDER BY recno', (query, query + '\uffff'))
+        target = normalize_part(query, fold)
+        if exact:
+            if not target:
+                return []
+            return self._recnos(f'SELECT DISTINCT recno FROM {self.table} WHERE {"fkey" if fold else "key"} = ? '
+                                'ORDER BY recno', (target,))
+        value_sql, value_params = self._contains('value', query)
+        sql = f'SELECT recno FROM {self.table} WHERE rowid IN ({value_sql})'
+        params = value_params
+        if target:
+            key_sql, key_params = self._contains('fkey' if fold else 'key', target)
+            sql += f' UNION SELECT recno FROM {self.table} WHERE rowid IN ({key_sql})'
+            params += key_params
+        return self._recnos(sql + ' ORDER BY recno', params)
+    
+    def near(self, query, max_distance=None, fold=False, cancel=None):
+        # Edit-distance matching needs the FuzzyIndex, built from the
+        # distinct values on first use
+        with self._fuzzy_lock:
+            if self.fuzzy is None:
+                fuzzy = FuzzyIndex()
+                for value, in self.snapshot.connection().execute(f'SELECT DISTINCT value FROM {self.table}'):
+                    fuzzy.add(value)
+                self.fuzzy = fuzzy
+        values = [value for _, _, values in self.fuzzy.near(query, max_distance, fold, cancel) for value in values]
+        recnos = set()
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            recnos.update(self._recnos(f'SELECT recno FROM {self.table} WHERE value IN '
+                                       f'({", ".join("?" * len(chunk))})', chunk))
+        return sorted(recnos)
+    
+    def filter(self, reader, recnos, query, fold=False, cancel=None):
+        matched = set(self.match(query, fold))
+        return [recno for recno in checked(recnos, cancel) if recno in matched]
+    
+    def update(self, reader, appended, deleted, recalled):
+        # A snapshot never changes; see SnapshotReader.refresh
+        pass
+
+# DBF files above this many records are indexed in ranges of this size
+# when parsing in a process pool
+DBF_CHUNK_RECORDS = 250000
+
+# Rough in-process parse and index cost, used to decide what is worth
+# sending to the process pool: starting workers (a fresh interpreter each
+# on Windows) and shipping results back only pays off for larger work.
+# Files estimated under POOL_FILE_SECONDS are parsed directly, and no pool
+# is started unless the remaining files add up to POOL_MIN_SECONDS.
+DBF_SECONDS_PER_RECORD = 3.5e-6
+XLSX_SECONDS_PER_BYTE = 1.4e-6
+POOL_FILE_SECONDS = 0.5
+POOL_MIN_SECONDS = 4.0
+
+def parse_estimate(reader_class, filepath):
+    if reader_class is DBFReader:
+        return dbf_record_count(filepath) * DBF_SECONDS_PER_RECORD
+    return os.path.getsize(filepath) * XLSX_SECONDS_PER_BYTE
+
+def parse_workers():
+    # PARTLOOKUP_WORKERS=N parses source files in N processes ('auto' uses
+    # every core); unset or 1 parses on the loading thread
+    value = os.environ.get('PARTLOOKUP_WORKERS', '').strip().lower()
+    if value == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return int(value) if value else 1
+    except ValueError:
+        return 1
 
-class ExcelReader:
-    def __init__(self, filename):
-        self.filename = filename
-        self.records = []
-        self.fields = []
-        self.read_excel()
+def log_event(event, **fields):
+    # Append one JSON line to the file named by PARTLOOKUP_LOG, if set
+    path = os.environ.get('PARTLOOKUP_LOG')
+    if not path:
+        return
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'event': event}
+    record.update((name, round(value, 4) if isinstance(value, float) else value) for name, value in fields.items())
+    try:
+        with _log_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print(f"Error writing log {path}: {str(e)}")
+
+_log_lock = threading.Lock()
+_profile_runs = iter(range(1, sys.maxsize))
+
+def profiled(name, fn, *args):
+    # Run fn under cProfile when PARTLOOKUP_PROFILE names a folder; the
+    # stats of each run are dumped there as <name>-<n>.prof
+    folder = os.environ.get('PARTLOOKUP_PROFILE')
+    if not folder:
+        return fn(*args)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args)
+    finally:
+        os.makedirs(folder, exist_ok=True)
+        profiler.dump_stats(os.path.join(folder, f"{name}-{os.getpid()}-{next(_profile_runs)}.prof"))
+
+def parse_source(reader_class, filepath, stats=None):
+    # stats, when given, receives the parse and index build times
+    started = time.perf_counter()
+    reader = reader_class(filepath)
+    parsed = time.perf_counter()
+    index = PartIndex.build(reader)
+    index.build_fuzzy()
+    if stats is not None:
+        stats['parse_s'] = parsed - started
+        stats['index_s'] = time.perf_counter() - parsed
+    return reader, index
+
+# Process pool jobs send their results back encoded by encode_state: one
+# bytes object of packed arrays is much cheaper to pass between processes
+# than the nested lists and dicts it holds
+
+def _parse_job(reader_class, filepath):
+    stats = {}
+    reader, index = parse_source(reader_class, filepath, stats)
+    return encode_state({'reader': reader.get_state(), 'index': index.get_state(), 'stats': stats})
+
+def _index_chunk_job(filepath, start, stop):
+    reader = DBFReader(filepath)
+    state = PartIndex.build(reader, start, stop).get_state()
+    reader.close()
+    return encode_state(state)
+
+def _excel_sheet_job(filepath, sheet_number):
+    # The reader state of one worksheet, for workbooks read a sheet per
+    # process
+    reader = ExcelReader(filepath, load=False)
+    reader.load_rows(reader._iter_xlsx_rows({sheet_number}))
+    reader.records.compact()
+    return encode_state(reader.get_state())
+
+def submit_parse(pool, reader_class, filepath, stats=None):
+    # Start parsing a file in the process pool and return a function that
+    # waits for the jobs and assembles (reader, index). Large DBF files are
+    # indexed in record ranges whose partial indexes are merged in order;
+    # workbooks with several sheets are read a sheet per job.
+    sheet_count = xlsx_sheet_count(filepath) if reader_class is ExcelReader else 0
+    if sheet_count > 1:
+        futures = [pool.submit(_excel_sheet_job, filepath, sheet_number) for sheet_number in range(sheet_count)]
+        
+        def collect():
+            started = time.perf_counter()
+            reader = ExcelReader(filepath, load=False)
+            for future in futures:
+                state = decode_state(future.result())
+                if not reader.fields:
+                    reader.fields = state['fields']
+                reader.records.extend(ColumnTable.from_state(state['table']))
+            parsed = time.perf_counter()
+            index = PartIndex.build(reader)
+            index.build_fuzzy()
+            if stats is not None:
+                stats['parse_s'] = parsed - started
+                stats['index_s'] = time.perf_counter() - parsed
+            return reader, index
+    elif reader_class is DBFReader and dbf_record_count(filepath) > DBF_CHUNK_RECORDS:
+        count = dbf_record_count(filepath)
+        futures = [pool.submit(_index_chunk_job, filepath, start, start + DBF_CHUNK_RECORDS)
+                   for start in range(0, count, DBF_CHUNK_RECORDS)]
+        
+        def collect():
+            started = time.perf_counter()
+            index = PartIndex.from_state(decode_state(futures[0].result()))
+            for future in futures[1:]:
+                index.merge(PartIndex.from_state(decode_state(future.result())))
+            index.build_fuzzy()
+            indexed = time.perf_counter()
+            reader = DBFReader(filepath)
+            if stats is not None:
+                # Time spent waiting here; the chunks were indexed in parallel
+                stats['index_s'] = indexed - started
+                stats['parse_s'] = time.perf_counter() - indexed
+            return reader, index
+    else:
+        future = pool.submit(_parse_job, reader_class, filepath)
+        
+        def collect():
+            state = decode_state(future.result())
+            if stats is not None:
+                stats.update(state['stats'])
+            return reader_class(filepath, state=state['reader']), PartIndex.from_state(state['index'])
     
-    def read_excel(self):
-        if not EXCEL_SUPPORT:
-            return
-            
+    def finish():
         try:
-            wb = openpyxl.load_workbook(self.filename, read_only=True, data_only=True)
-            
-            # Process each sheet
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                
-                # Get headers from first row
-                headers = []
-                for cell in ws[1]:
-                    if cell.value:
-                        headers.append(str(cell.value).strip())
-                
-                if not headers:
-                    continue
-                
-                # Store fields info (similar to DBF format)
-                if not self.fields:  # Only set fields from first sheet
-                    self.fields = [{'name': h, 'type': 'C', 'length': 255} for h in headers]
-                
-                # Read data rows
-                for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                    # Skip empty rows
-                    if not any(row):
-                        continue
-                    
-                    record = {}
-                    for col_idx, value in enumerate(row):
-                        if col_idx < len(headers):
-                            # Convert value to string and handle None
-                            str_value = str(value) if value is not None else ''
-                            record[headers[col_idx]] = str_value.strip()
-                    
-                    # Add sheet info to record
-                    record['_sheet'] = sheet_name
-                    self.records.append(record)
-                    
-                    # Limit records for performance
-                    if len(self.records) >= 50000:
-                        break
-                
-                if len(self.records) >= 50000:
-                    break
-                    
-            wb.close()
-            
+            return collect()
         except Exception as e:
-            print(f"Error reading Excel file {self.filename}: {str(e)}")
+            print(f"Parallel parse of {filepath} failed, parsing directly: {str(e)}")
+            return parse_source(reader_class, filepath, stats)
+    return finish
+
+def start_reader(reader_class, filepath, cache=None, pool=None, stats=None):
+    # Restore a reader and its part index from the parse cache, or parse
+    # the file (in the pool when given), build the index and cache both.
+    # Returns a function producing (reader, index). stats, when given,
+    # records where the data came from and how long each step took.
+    if stats is None:
+        stats = {}
+    signature = ParsedCache.signature(filepath) if cache is not None else None
+    started = time.perf_counter()
+    state = cache.load(filepath, signature) if cache is not None else None
+    # Entries parsed under another schema.json are parsed again
+    if state is not None and state.get('schema') != file_schema(filepath).token():
+        state = None
+    if state is not None:
+        stats['source'] = 'cache'
+        stats['cache_load_s'] = time.perf_counter() - started
+        
+        def restore():
+            started = time.perf_counter()
+            restored = reader_class(filepath, state=state['reader']), PartIndex.from_state(state['index'])
+            stats['parse_s'] = time.perf_counter() - started
+            return restored
+        return restore
+    
+    if pool is not None:
+        stats['source'] = 'pool'
+        parsed = submit_parse(pool, reader_class, filepath, stats)
+    else:
+        stats['source'] = 'parsed'
+        parsed = lambda: parse_source(reader_class, filepath, stats)
+    
+    def finish():
+        reader, index = parsed()
+        if cache is not None and reader.records:
+            started = time.perf_counter()
+            cache.store(filepath, signature, {'reader': reader.get_state(), 'index': index.get_state(),
+                                              'schema': reader.schema.token()})
+            stats['cache_store_s'] = time.perf_counter() - started
+        return reader, index
+    return finish
+
+def open_reader(reader_class, filepath, cache=None):
+    return start_reader(reader_class, filepath, cache)()
+
+# Priority files for part data
+DBF_FILES = ['INVENT.DBF', 'POITEM.DBF', 'BUYQUOTE.DBF', 'ALTPART.DBF', 'KIT.DBF']
+EXCEL_FILES = ['INVENTORIO ACTUAL GENTHRUST.xlsx']
+
+def app_base_path():
+    # Get the directory where the executable/script is located
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable
+        return os.path.dirname(sys.executable)
+    # Running as script
+    return os.path.dirname(os.path.abspath(__file__))
+
+def find_data_dir(base_path):
+    # Try to find the data directory
+    possible_paths = [
+        os.path.join(base_path, 'AirDataDatabase'),
+        os.path.join(base_path, 'assets', 'AirDataDatabase'),
+        os.path.join(os.path.dirname(base_path), 'assets', 'AirDataDatabase'),
+        '/var/www/cal.lueshub.com/assets/AirDataDatabase'
+    ]
+    
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+def data_sources(data_dir, filenames=None):
+    # (filename, reader class, type, path) of each source file present in
+    # data_dir, in load order; filenames restricts them to those files
+    sources = [(filename, DBFReader, 'DBF') for filename in DBF_FILES]
+    sources += [(filename, ExcelReader, 'Excel') for filename in EXCEL_FILES]
+    
+    sources = [(filename, reader_class, file_type, os.path.join(data_dir, filename))
+               for filename, reader_class, file_type in sources]
+    return [source for source in sources if os.path.exists(source[3])
+            and (filenames is None or source[0] in filenames)]
+
+def load_sources(data_dir, progress=None, workers=None, filenames=None, seek=False):
+    # Yield (filename, entry) for each source file as soon as it is loaded;
+    # entry is None when the file holds no records. progress(filename) is
+    # called before each file is opened. With more than one worker the
+    # uncached files big enough to gain from it (see parse_estimate) are
+    # submitted to a process pool up front. filenames restricts loading to
+    # those files. seek loads DBF tables whose part number columns have
+    # index tags with a SeekIndex instead of building their PartIndex; only
+    # exact and prefix lookups use the tags. Files a compiled snapshot holds
+    # unchanged are read from the snapshot.
+    sources = data_sources(data_dir, filenames)
+    snapshot = open_snapshot(data_dir)
+    
+    if workers is None:
+        workers = parse_workers()
+    pool = None
+    
+    # Parsed files are cached in the user's local cache folder
+    cache = ParsedCache()
+    try:
+        stats = [{'file': filename, 'bytes': os.path.getsize(filepath)} for filename, _, _, filepath in sources]
+        # Files read from the snapshot or through index files are opened
+        # first, so only the others go to the pool
+        opened = {}
+        if snapshot is not None:
+            for filename, _, _, filepath in sources:
+                if snapshot.covers(filename, ParsedCache.signature(filepath), file_schema(filepath)):
+                    opened[filepath] = snapshot.open(filename, filepath)
+        if seek:
+            for _, reader_class, _, filepath in sources:
+                if reader_class is DBFReader and filepath not in opened:
+                    seekable = open_seek_index(filepath)
+                    if seekable is not None:
+                        opened[filepath] = seekable
+        # Only uncached files large enough to gain from it go to the pool
+        pooled = {}
+        if workers > 1:
+            for _, reader_class, _, filepath in sources:
+                if filepath not in opened and not cache.holds(filepath, ParsedCache.signature(filepath)):
+                    estimate = parse_estimate(reader_class, filepath)
+                    if estimate >= POOL_FILE_SECONDS:
+                        pooled[filepath] = estimate
+        if sum(pooled.values()) >= POOL_MIN_SECONDS:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers)
+            pending = [start_reader(reader_class, filepath, cache, pool, file_stats) if filepath in pooled else None
+                       for (_, reader_class, _, filepath), file_stats in zip(sources, stats)]
+        else:
+            pending = [None] * len(sources)
+        
+        for (filename, reader_class, file_type, filepath), finish, file_stats in zip(sources, pending, stats):
+            if progress:
+                progress(filename)
+            
+            started = time.perf_counter()
+            signature = ParsedCache.signature(filepath)
+            if filepath in opened:
+                reader, index = opened.pop(filepath)
+                if isinstance(reader, SnapshotReader):
+                    file_stats['source'] = 'snapshot'
+                else:
+                    file_stats['source'] = 'index'
+                    file_stats['tags'] = {column: tag.name for column, tag in reader.index_tags().items()}
+            else:
+                if finish is None:
+                    finish = start_reader(reader_class, filepath, cache, stats=file_stats)
+                reader, index = finish()
+                file_stats['values'] = len(index.values) + sum(len(shard.values) for shard in index.shards)
+            file_stats['total_s'] = time.perf_counter() - started
+            file_stats['records'] = len(reader.records)
+            file_stats['deleted'] = reader.num_records - len(reader.records) if isinstance(reader, DBFReader) else 0
+            log_event('load', **file_stats)
+            entry = None
+            if reader.records:
+                entry = {
+                    # Columns shown in results and batch output
+                    'fields': file_schema(filepath).display_fields(reader.fields),
+                    'records': reader.records,
+                    'reader': reader,
+                    'index': index,
+                    # Sorted column indexes for field queries
+                    'columns': ColumnIndexes(reader),
+                    'type': file_type,
+                    'path': filepath,
+                    'signature': signature,
+                    'stats': file_stats
+                }
+                if filename == ALTERNATE_FILE:
+                    entry['alternates'] = AlternateParts().build(reader)
+            yield filename, entry
+    finally:
+        if pool is not None:
+            try:
+                pool.shutdown(cancel_futures=True)
+            except TypeError:
+                # Before Python 3.9 queued jobs cannot be cancelled
+                pool.shutdown()
+        for reader, _ in opened.values():
+            reader.close()
+        cache.close()
+
+class RecordList(Sequence):
+    # Matching records of one file, created from their record numbers only
+    # when accessed
+    __slots__ = ('reader', 'recnos')
+
+    def __init__(self, reader, recnos):
+        self.reader = reader
+        self.recnos = recnos
+
+    def __len__(self):
+        return len(self.recnos)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.reader.record(recno) for recno in self.recnos[index]]
+        return self.reader.record(self.recnos[index])
+
+class SearchCancelled(Exception):
+    pass
+
+# Loops over the records or values of one file poll a search's cancel
+# function every this many items
+CANCEL_INTERVAL = 4096
+
+def checked(items, cancel):
+    # items, raising SearchCancelled as soon as a poll of cancel() returns
+    # True; items as they are when there is nothing to poll. They are taken
+    # a chunk at a time, so the loop itself runs at nearly full speed.
+    if cancel is None:
+        return items
+    return chain.from_iterable(_checked_chunks(iter(items), cancel))
+
+def _checked_chunks(items, cancel):
+    while True:
+        chunk = list(islice(items, CANCEL_INTERVAL))
+        if not chunk:
+            return
+        if cancel():
+            raise SearchCancelled()
+        yield chunk
+
+def _file_results(all_data, lookup, cancel=None):
+    results = []
+    for filename, data in all_data.items():
+        if cancel is not None and cancel():
+            raise SearchCancelled()
+        recnos = lookup(filename, data)
+        if recnos:
+            results.append({
+                'filename': filename,
+                'matches': RecordList(data['reader'], recnos),
+                'fields': data['fields'],
+                'part_fields': data['index'].columns,
+                'type': data.get('type', 'Unknown')
+            })
+    return results
+
+def alternate_family(all_data, part_number, fold=False):
+    # The alternate family of part_number from ALTPART.DBF, if loaded
+    data = all_data.get(ALTERNATE_FILE)
+    if data is None or 'alternates' not in data:
+        return []
+    return data['alternates'].family(part_number, fold)
+
+def find_matches(all_data, part_number, fold=False, cancel=None, previous=None,
+                 exact=False, near=True, alternates=False, timings=None, prefix=False):
+    # Search every loaded file for the part number. Returns (results, near)
+    # where results has one entry per file with matching records. When
+    # nothing matches, results holds the records of the closest part
+    # numbers instead and near is True; pass near=False to skip that.
+    # exact restricts matches to part numbers equal to the query, prefix to
+    # part numbers starting with it.
+    # alternates adds the records of every part number in the query's
+    # alternate family, matched exactly. timings, when given, receives the
+    # seconds spent scanning the indexes (scan_s), of which near_s in the
+    # near-match pass.
+    #
+    # cancel() is polled between files and every CANCEL_INTERVAL values or
+    # records within one; SearchCancelled is raised once it returns True.
+    # previous maps filename to the matching record numbers of
+    # an earlier query contained in this one; those files are narrowed from
+    # that set instead of searched again.
+    key = normalize_part(part_number, fold)
+    members = [member for member in (alternate_family(all_data, part_number, fold) if alternates else ())
+               if normalize_part(member, fold) != key]
+    
+    def lookup(filename, data):
+        if previous is not None and filename in previous:
+            return data['index'].filter(data['reader'], previous[filename], part_number, fold, cancel)
+        recnos = data['index'].match(part_number, fold, exact, prefix, cancel)
+        if members:
+            recnos = set(recnos)
+            for member in members:
+                recnos.update(data['index'].match(member, fold, exact=True, cancel=cancel))
+            recnos = sorted(recnos)
+        return recnos
+    
+    started = time.perf_counter()
+    results = _file_results(all_data, lookup, cancel)
+    if timings is not None:
+        timings['scan_s'] = time.perf_counter() - started
+    if results or not near:
+        return results, False
+    
+    near_started = time.perf_counter()
+    results = _file_results(all_data, lambda filename, data: data['index'].near(part_number, fold=fold, cancel=cancel),
+                            cancel)
+    if timings is not None:
+        timings['near_s'] = time.perf_counter() - near_started
+        timings['scan_s'] = time.perf_counter() - started
+    return results, True
+
+# Field queries: a part number and FIELD<op>VALUE terms that a record must
+# all meet, e.g.
+#   AN3-4A QTY>0
+#   FILE=POITEM.DBF VENDOR=ACME PODATE>=2024
+# = matches a value, ignoring case, or with a trailing * a prefix; >, >=,
+# < and <= compare numbers, dates and otherwise text. Dates are written
+# YYYY, YYYY-MM or YYYY-MM-DD and stand for the whole period, so
+# PODATE>=2024 starts on 2024-01-01 and PODATE<=2024 ends on 2024-12-31.
+# Values and field names with spaces are quoted. FILE= restricts the query
+# to the named files; files without one of the fields are skipped.
+QUERY_TERM = re.compile(r'\s*(?:("[^"]*"|[^\s"=<>]+)\s*(>=|<=|=|>|<)\s*("[^"]*"|[^\s"]*)|("[^"]*"|[^\s"]+))')
+QUERY_OPERATORS = re.compile(r'[=<>]')
+QUERY_PERIOD = re.compile(r'^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+QUERY_NUMBER_TYPES = ('N', 'F', 'I', 'Y', 'B')
+QUERY_DATE_TYPES = ('D', 'T')
+QUERY_TRUE = ('T', 'Y', 'YES', 'TRUE', '1')
+QUERY_FALSE = ('F', 'N', 'NO', 'FALSE', '0')
+
+# Candidates below this many are checked record by record instead of
+# building column indexes for the query's other fields
+QUERY_VERIFY_LIMIT = 2000
+
+class QueryError(ValueError):
+    pass
+
+class FieldCondition:
+    # One FIELD<op>VALUE term of a query
+    __slots__ = ('field', 'op', 'value')
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return f"FieldCondition({self.field!r}, {self.op!r}, {self.value!r})"
+
+def is_field_query(text):
+    # Whether the search box holds a field query rather than a part number
+    return bool(QUERY_OPERATORS.search(text))
+
+def parse_query(text):
+    # (part number, conditions, file patterns) of a query; raises
+    # QueryError when it cannot be read
+    words = []
+    conditions = []
+    files = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        term = QUERY_TERM.match(text, position)
+        if term is None:
+            raise QueryError(f"Unmatched quote in: {text[position:].strip()}")
+        position = term.end()
+        field, op, value, word = (part.strip('"') if part else part for part in term.groups())
+        if word is not None:
+            words.append(word.upper())
+        elif not value:
+            raise QueryError(f"{field}{op} needs a value")
+        elif field.upper() == 'FILE':
+            if op != '=':
+                raise QueryError("FILE only takes =")
+            files.append(value.upper())
+        else:
+            conditions.append(FieldCondition(field, op, value))
+    if not words and not conditions:
+        raise QueryError("Empty query")
+    return ' '.join(words), conditions, files
+
+def query_period(text):
+    # (first day, day after the last) of a YYYY, YYYY-MM or YYYY-MM-DD
+    # value, or None if it is not a date
+    period = QUERY_PERIOD.match(text)
+    if period is None:
+        return None
+    year, month, day = period.groups()
+    try:
+        if month is None:
+            return datetime.date(int(year), 1, 1), datetime.date(int(year) + 1, 1, 1)
+        start = datetime.date(int(year), int(month), int(day or 1))
+        if day is not None:
+            return start, start + datetime.timedelta(days=1)
+        return start, (start + datetime.timedelta(days=31)).replace(day=1)
+    except (ValueError, OverflowError):
+        raise QueryError(f"Invalid date: {text}")
+
+def _text_key(value):
+    return display_value(value).strip().upper() or None
+
+def _number_key(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _date_key(value):
+    # Dates from decoded values, DBF text (YYYYMMDD) or ISO text
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if not isinstance(value, str):
+        return None
+    digits = re.sub(r'\D', '', value)
+    if len(digits) < 8:
+        return None
+    try:
+        return datetime.date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+    except ValueError:
+        return None
+
+def _logical_key(value):
+    if isinstance(value, bool):
+        return value
+    value = display_value(value).strip().upper()
+    if value in QUERY_TRUE:
+        return True
+    if value in QUERY_FALSE:
+        return False
+    return None
+
+QUERY_KEYS = {'text': _text_key, 'number': _number_key, 'date': _date_key, 'logical': _logical_key}
+
+def condition_kind(field, condition):
+    # How a condition compares the field's values: by the field's type in
+    # a DBF, by the value the query gives for text columns
+    field_type = field.get('type')
+    if field_type in QUERY_NUMBER_TYPES:
+        return 'number'
+    if field_type in QUERY_DATE_TYPES:
+        return 'date'
+    if field_type == 'L':
+        return 'logical'
+    if condition.op == '=':
+        return 'text'
+    if '-' in condition.value and query_period(condition.value) is not None:
+        return 'date'
+    if _number_key(condition.value) is not None:
+        return 'number'
+    return 'text'
+
+def condition_bounds(kind, condition):
+    # (low, low exclusive, high, high exclusive) of the keys a condition
+    # accepts; None bounds are open
+    op, value = condition.op, condition.value
+    if value.endswith('*'):
+        if kind != 'text' or op != '=':
+            raise QueryError(f"{condition.field}: * only applies to = on text")
+        prefix = value[:-1].upper()
+        return prefix, False, prefix + '\U0010ffff', False
+    if kind == 'date':
+        period = query_period(value)
+        if period is None:
+            raise QueryError(f"{condition.field}: {value} is not a date (YYYY, YYYY-MM or YYYY-MM-DD)")
+        start, end = period
+        return {'=': (start, False, end, True), '>=': (start, False, None, False), '>': (end, False, None, False),
+                '<': (None, False, start, True), '<=': (None, False, end, True)}[op]
+    key = QUERY_KEYS[kind](value)
+    if key is None:
+        raise QueryError(f"{condition.field}: {value} is not a {'number' if kind == 'number' else 'logical'}")
+    if kind == 'logical' and op != '=':
+        raise QueryError(f"{condition.field} only takes =")
+    return {'=': (key, False, key, False), '>=': (key, False, None, False), '>': (key, True, None, False),
+            '<': (None, False, key, True), '<=': (None, False, key, False)}[op]
+
+def in_bounds(key, bounds):
+    low, low_exclusive, high, high_exclusive = bounds
+    if key is None:
+        return False
+    if low is not None and (key <= low if low_exclusive else key < low):
+        return False
+    if high is not None and (key >= high if high_exclusive else key > high):
+        return False
+    return True
+
+def column_values(reader, columns, recnos=None):
+    # (recno, values) of the given columns like iter_records, for every
+    # record or only those in recnos. DBF fields stored in binary
+    # (integer, currency, double, datetime) have no text form and come
+    # decoded instead.
+    columns = list(columns)
+    binary = set()
+    if isinstance(reader, DBFReader):
+        types = {field['name']: field.get('type') for field in reader.fields}
+        binary = {i for i, name in enumerate(columns) if types.get(name) in ('I', 'Y', 'B', 'T')}
+    if recnos is None:
+        rows = reader.iter_records(columns=columns)
+    else:
+        rows = ((recno, reader.text_values(recno, columns)) for recno in recnos)
+    if not binary:
+        return rows
+    
+    def decoded():
+        for recno, values in rows:
+            record = reader.record(recno)
+            yield recno, tuple(record[columns[i]] if i in binary else value for i, value in enumerate(values))
+    return decoded()
+
+class ColumnIndex:
+    # One column's keys in sorted order next to their record numbers, so
+    # equality, prefix and range conditions are two binary searches.
+    # Records without a value for the column are left out.
+    __slots__ = ('keys', 'recnos')
+
+    def __init__(self, keys, recnos):
+        self.keys = keys
+        self.recnos = recnos
+
+    @classmethod
+    def build(cls, reader, field, kind):
+        key_of = QUERY_KEYS[kind]
+        keys = []
+        recnos = []
+        for recno, (value,) in column_values(reader, [field['name']]):
+            key = key_of(value)
+            if key is not None:
+                keys.append(key)
+                recnos.append(recno)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return cls([keys[i] for i in order], array('L', [recnos[i] for i in order]))
+
+    def span(self, bounds):
+        # (start, stop) positions of the keys within bounds
+        low, low_exclusive, high, high_exclusive = bounds
+        keys = self.keys
+        start = 0 if low is None else (bisect_right if low_exclusive else bisect_left)(keys, low)
+        stop = len(keys) if high is None else (bisect_left if high_exclusive else bisect_right)(keys, high)
+        return start, max(start, stop)
+
+class ColumnIndexes:
+    # The column indexes of one loaded file, each built the first time a
+    # query needs it and kept until the file changes. Server threads share
+    # them, so building is serialized.
+    def __init__(self, reader):
+        self.reader = reader
+        self._indexes = {}
+        self._lock = threading.Lock()
+    
+    def get(self, field, kind, build=True):
+        key = (field['name'], kind)
+        index = self._indexes.get(key)
+        if index is None and build:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._indexes[key] = ColumnIndex.build(self.reader, field, kind)
+        return index
+
+def query_recnos(data, part_number, conditions, fold=False, cancel=None):
+    # Record numbers of one loaded file that match a parsed query. The
+    # most selective of the part number lookup and the conditions' column
+    # ranges gives the candidates; the other conditions are checked on
+    # those, by record when there are few of them. cancel is polled as in
+    # checked.
+    reader = data['reader']
+    fields = {field['name'].upper(): field for field in reader.fields}
+    plans = []
+    for condition in conditions:
+        field = fields.get(condition.field.upper())
+        if field is None:
+            return []
+        kind = condition_kind(field, condition)
+        plans.append((field, kind, condition_bounds(kind, condition)))
+    
+    part_recnos = None
+    if part_number:
+        part_recnos = data['index'].match(part_number, fold, cancel=cancel)
+        if not part_recnos:
+            return []
+    # Column indexes are only worth building when the part number does not
+    # already narrow the file to a few records. A build is not cancelled:
+    # the index is kept for the next query, typically the same one typed on.
+    build = part_recnos is None or len(part_recnos) > QUERY_VERIFY_LIMIT
+    columns = data.get('columns') or ColumnIndexes(reader)
+    ranges = []
+    checks = []
+    for field, kind, bounds in plans:
+        index = columns.get(field, kind, build)
+        if index is None:
+            checks.append((field['name'], QUERY_KEYS[kind], bounds))
+            continue
+        start, stop = index.span(bounds)
+        if start == stop:
+            return []
+        ranges.append((stop - start, index.recnos, start, stop, (field['name'], QUERY_KEYS[kind], bounds)))
+    ranges.sort(key=lambda item: item[0])
+    
+    if part_recnos is not None and (not ranges or len(part_recnos) <= ranges[0][0]):
+        candidates = part_recnos
+    else:
+        _, recnos, start, stop, _ = ranges.pop(0)
+        candidates = recnos[start:stop]
+        if part_recnos is not None:
+            part_set = set(part_recnos)
+            candidates = [recno for recno in checked(candidates, cancel) if recno in part_set]
+    
+    for count, recnos, start, stop, check in ranges:
+        if len(candidates) * 8 < count:
+            # Cheaper to look at the few candidates than to hash the range
+            checks.append(check)
+            continue
+        members = set(recnos[start:stop])
+        candidates = [recno for recno in checked(candidates, cancel) if recno in members]
+    if checks:
+        candidates = [recno for recno in checked(candidates, cancel) if _record_matches(reader, recno, checks)]
+    return sorted(candidates)
+
+def _record_matches(reader, recno, checks):
+    record = reader.record(recno)
+    return all(in_bounds(key_of(record.get(name)), bounds) for name, key_of, bounds in checks)
+
+def run_query(all_data, query, fold=False, cancel=None, timings=None):
+    # Results of a field query over every loaded file, shaped like those
+    # of find_matches; raises QueryError for a query it cannot read
+    part_number, conditions, files = parse_query(query)
+    
+    def lookup(filename, data):
+        name = filename.upper()
+        if files and not any(name.startswith(pattern[:-1]) if pattern.endswith('*') else name == pattern
+                             for pattern in files):
+            return []
+        return query_recnos(data, part_number, conditions, fold, cancel)
+    
+    started = time.perf_counter()
+    results = _file_results(all_data, lookup, cancel)
+    if timings is not None:
+        timings['scan_s'] = time.perf_counter() - started
+    return results
+
+# Per-part rollups: headline figures of every part number, kept per file
+# and combined when a part is looked up. Stock files add up quantities by
+# sheet and location, order files keep the last and the lowest cost, quote
+# files count quotes and keep the lowest price. Columns are found by name,
+# first match wins.
+ROLLUP_FILES = {'INVENT.DBF': 'stock', 'POITEM.DBF': 'orders', 'BUYQUOTE.DBF': 'quotes'}
+ROLLUP_COLUMNS = {
+    'qty': ('QTYOH', 'ONHAND', 'QTY', 'QUANTITY', 'CANTIDAD', 'STOCK'),
+    'location': ('LOCATION', 'LOC', 'BIN', 'UBICACION'),
+    'cost': ('COST', 'UNITCOST', 'PRICE'),
+    'price': ('PRICE', 'UNITPRICE', 'COST'),
+    'date': ('PODATE', 'QUOTEDATE', 'DATE'),
+    'vendor': ('VENDOR', 'VENDNO', 'SUPPLIER'),
+    'order': ('PONUMBER', 'PONO', 'PO'),
+    'sheet': ('_SHEET',),
+}
+ROLLUP_ROLES = {'stock': ('qty', 'location', 'sheet'), 'orders': ('cost', 'date', 'order'),
+                'quotes': ('price', 'date', 'vendor')}
+# A file without this column has no rollup
+ROLLUP_REQUIRED = {'stock': 'qty', 'orders': 'cost', 'quotes': 'price'}
+
+def rollup_kind(filename):
+    if filename in EXCEL_FILES:
+        return 'stock'
+    return ROLLUP_FILES.get(filename.upper())
+
+class PartRollup:
+    # One file's figures per normalized part number, taken from the first
+    # part number column with a value:
+    #   stock:  {(sheet, location): quantity}
+    #   orders: [count, last date, last cost, last order, lowest cost, its order]
+    #   quotes: [count, lowest price, its vendor, its date]
+    # Only positive costs and prices count as last, lowest or best.
+    def __init__(self, kind, part_columns, columns):
+        self.kind = kind
+        self.part_columns = list(part_columns)
+        self.columns = columns
+        self.parts = {}
+        self.folded = {}
+        self._dates = {}
+    
+    @classmethod
+    def build(cls, reader, kind, part_columns):
+        # None when the file lacks the kind's required column
+        names = {name.upper(): name for name in reader_columns(reader)}
+        columns = {}
+        for role in ROLLUP_ROLES[kind]:
+            name = next((names[column] for column in ROLLUP_COLUMNS[role] if column in names), None)
+            if name is not None:
+                columns[role] = name
+        if ROLLUP_REQUIRED[kind] not in columns:
+            return None
+        # Not the columns of other roles (an order number looks like a part
+        # number to find_part_fields), and part number columns first
+        part_columns = sorted([name for name in part_columns if name not in columns.values()] or part_columns,
+                              key=lambda name: 'PART' not in name.upper())
+        rollup = cls(kind, part_columns, columns)
+        rollup.add_records(column_values(reader, rollup.names()))
+        return rollup
+    
+    def names(self):
+        return self.part_columns + list(self.columns.values())
+    
+    def _key(self, values):
+        return next((normalize_part(value) for value in values[:len(self.part_columns)] if value), '')
+    
+    def add_records(self, rows, keys=None):
+        # Add (recno, values) rows read with names(); keys limits them to
+        # those part numbers. Part numbers repeat a lot, so each distinct
+        # one is normalized once.
+        count = len(self.part_columns)
+        roles = list(self.columns)
+        # Roles the file has no column for read the None appended below
+        first, second, third = (count + roles.index(role) if role in roles else count + len(roles)
+                                for role in ROLLUP_ROLES[self.kind])
+        add = getattr(self, '_add_' + self.kind)
+        parts = self.parts
+        part_keys = {}
+        for _, values in rows:
+            part = values[0] if count == 1 else next((value for value in values[:count] if value), '')
+            key = part_keys.get(part)
+            if key is None:
+                key = part_keys[part] = normalize_part(part) if part else ''
+            if not key or (keys is not None and key not in keys):
+                continue
+            if key not in parts:
+                self.folded.setdefault(fold_part_key(key), []).append(key)
+            values += (None,)
+            add(key, values[first], values[second], values[third])
+    
+    def _date(self, value):
+        date = self._dates.get(value, False)
+        if date is False:
+            date = self._dates[value] = _date_key(value)
+        return date
+    
+    def _add_stock(self, key, qty, location, sheet):
+        places = self.parts.get(key)
+        if places is None:
+            places = self.parts[key] = {}
+        qty = _number_key(qty)
+        if qty:
+            place = (sheet or '', location if isinstance(location, str) else display_value(location))
+            places[place] = places.get(place, 0) + qty
+    
+    def _add_orders(self, key, cost, date, order):
+        figures = self.parts.get(key)
+        if figures is None:
+            figures = self.parts[key] = [0, None, None, None, None, None]
+        figures[0] += 1
+        cost = _number_key(cost)
+        if not cost or cost < 0:
+            return
+        date = self._date(date)
+        if figures[2] is None or (date or datetime.date.min) >= (figures[1] or datetime.date.min):
+            figures[1:4] = date, cost, display_value(order)
+        if figures[4] is None or cost < figures[4]:
+            figures[4:6] = cost, display_value(order)
+    
+    def _add_quotes(self, key, price, date, vendor):
+        figures = self.parts.get(key)
+        if figures is None:
+            figures = self.parts[key] = [0, None, None, None]
+        figures[0] += 1
+        price = _number_key(price)
+        if price and price > 0 and (figures[1] is None or price < figures[1]):
+            figures[1:4] = price, display_value(vendor), self._date(date)
+    
+    def update(self, reader, index, appended, deleted, recalled):
+        # After a refresh: part numbers with deleted or recalled records
+        # are added up again from their live records, appended records are
+        # added to the figures
+        changed = list(deleted) + list(recalled)
+        if changed:
+            keys = {self._key(values) for _, values in column_values(reader, self.part_columns, changed)}
+            keys.discard('')
+            new = set(appended)
+            recnos = set()
+            for key in keys:
+                # Taken out of folded as well; add_records puts it back if
+                # the part number still has records
+                if self.parts.pop(key, None) is not None:
+                    folded = self.folded[fold_part_key(key)]
+                    folded.remove(key)
+                    if not folded:
+                        del self.folded[fold_part_key(key)]
+                recnos.update(recno for recno in index.match(key, exact=True) if recno not in new)
+            self.add_records(column_values(reader, self.names(), sorted(recnos)), keys)
+        if appended:
+            self.add_records(column_values(reader, self.names(), appended))
+    
+    def lookup(self, key, fold=False):
+        # Figures of every part number matching the normalized key
+        keys = self.folded.get(fold_part_key(key), []) if fold else [key]
+        return [self.parts[key] for key in dict.fromkeys(keys) if key in self.parts]
+
+def build_rollups(entries):
+    # Give every loaded stock, order and quote file its rollup; runs once
+    # the files are loaded
+    for filename, data in entries:
+        kind = rollup_kind(filename)
+        if kind is not None:
+            rollup = PartRollup.build(data['reader'], kind, data['index'].columns)
+            if rollup is not None:
+                data['rollup'] = rollup
+
+def _plain_number(value):
+    return int(value) if value is not None and value == int(value) else value
+
+def part_summary(all_data, part_number, fold=False):
+    # Headline figures of a part number from the loaded rollups as plain
+    # data (dates as ISO text); None when no rollup has the part. One
+    # dict lookup per file, so it is ready before any record is read.
+    key = normalize_part(part_number, fold)
+    if not key:
+        return None
+    summary = {'part_number': part_number, 'on_hand': 0, 'stock': [], 'orders': 0, 'last_cost': None,
+               'last_date': None, 'last_order': None, 'min_cost': None, 'min_order': None,
+               'quotes': 0, 'best_quote': None, 'best_vendor': None, 'best_date': None}
+    found = False
+    last_date = None
+    best_date = None
+    for filename, data in all_data.items():
+        rollup = data.get('rollup')
+        if rollup is None:
+            continue
+        for figures in rollup.lookup(key, fold):
+            found = True
+            if rollup.kind == 'stock':
+                for (sheet, location), qty in figures.items():
+                    summary['on_hand'] += qty
+                    summary['stock'].append({'file': filename, 'sheet': sheet, 'location': location,
+                                             'qty': _plain_number(qty)})
+            elif rollup.kind == 'orders':
+                count, date, cost, order, min_cost, min_order = figures
+                summary['orders'] += count
+                if cost is not None and (summary['last_cost'] is None or
+                                         (date or datetime.date.min) >= (last_date or datetime.date.min)):
+                    last_date = date
+                    summary.update(last_cost=cost, last_order=order)
+                if min_cost is not None and (summary['min_cost'] is None or min_cost < summary['min_cost']):
+                    summary.update(min_cost=min_cost, min_order=min_order)
+            else:
+                count, price, vendor, date = figures
+                summary['quotes'] += count
+                if price is not None and (summary['best_quote'] is None or price < summary['best_quote']):
+                    best_date = date
+                    summary.update(best_quote=price, best_vendor=vendor)
+    if not found:
+        return None
+    summary['on_hand'] = _plain_number(summary['on_hand'])
+    summary['last_date'] = last_date.isoformat() if last_date else None
+    summary['best_date'] = best_date.isoformat() if best_date else None
+    return summary
+
+def format_summary(summary):
+    # One line of headline figures for the results header
+    parts = []
+    if summary['stock'] or summary['on_hand']:
+        places = sorted(summary['stock'], key=lambda place: -place['qty'])
+        shown = ', '.join(f"{place['location'] or place['sheet'] or place['file']}: {place['qty']}"
+                          for place in places[:4])
+        if len(places) > 4:
+            shown += f", {len(places) - 4} more"
+        parts.append(f"On hand: {summary['on_hand']}" + (f" ({shown})" if shown else ""))
+    if summary['orders']:
+        text = f"{summary['orders']} POs"
+        if summary['last_cost'] is not None:
+            text += f", last cost {summary['last_cost']:.2f}"
+            if summary['last_date']:
+                text += f" on {summary['last_date']}"
+            text += f", lowest {summary['min_cost']:.2f}"
+        parts.append(text)
+    if summary['quotes']:
+        text = f"{summary['quotes']} quotes"
+        if summary['best_quote'] is not None:
+            text += f", best {summary['best_quote']:.2f}"
+            if summary['best_vendor']:
+                text += f" from {summary['best_vendor']}"
+        parts.append(text)
+    return ' | '.join(parts)
+
+def format_diagnostics(all_data, searches=(), startup=None):
+    # Load statistics of every file, startup times and timings of recent
+    # searches as text
+    lines = []
+    if startup:
+        times = [f"{label} after {startup[key]:.2f}s"
+                 for key, label in (('first_paint_s', "window shown"), ('first_search_s', "first file searchable"),
+                                    ('loaded_s', "all files loaded")) if key in startup]
+        lines += ["Startup: " + ", ".join(times), ""]
+    lines.append("Loaded files:")
+    for filename, data in all_data.items():
+        stats = data.get('stats') or {}
+        records = data['records']
+        # Files of a lookup server only report their record count
+        count = records if isinstance(records, int) else len(records)
+        line = f"  {filename}: {count:,} records"
+        if stats.get('deleted'):
+            line += f" ({stats['deleted']:,} deleted)"
+        if 'bytes' in stats:
+            line += f", {stats['bytes'] / 2 ** 20:.1f} MB"
+        if 'source' in stats:
+            line += f", from {stats['source']}"
+        for key, label in (('cache_load_s', 'cache lookup'), ('parse_s', 'read'), ('index_s', 'index'),
+                           ('cache_store_s', 'cache write'), ('total_s', 'total')):
+            if key in stats:
+                line += f", {label} {stats[key]:.2f}s"
+        lines.append(line)
+    if searches:
+        lines.append("")
+        lines.append("Recent searches:")
+        for search in searches:
+            lines.append(f"  {search['query']}: {search['matches']:,} matches in {search['files']} files, "
+                         f"scan {search['scan_ms']:.1f} ms, match {search['match_ms']:.1f} ms, "
+                         f"render {search['render_ms']:.1f} ms, total {search['total_ms']:.1f} ms")
+    return '\n'.join(lines)
+
+def read_part_numbers(stream):
+    # One part number per line; for CSV/TSV exports only the first column
+    # is used. Blank lines are skipped.
+    for line in stream:
+        part_number = re.split(r'[,;\t]', line, 1)[0].strip().strip('"').upper()
+        if part_number:
+            yield part_number
+
+def read_queries(stream):
+    # One field query per line (see parse_query); blank lines are skipped
+    for line in stream:
+        query = line.strip()
+        if query:
+            yield query
+
+BATCH_COLUMNS = ['query', 'match', 'file', 'sheet', 'record', 'part_number', 'fields']
+
+def record_row(result, recno, record):
+    # One matching record as plain data, for batch output and the server;
+    # numbers and logicals stay native, dates become ISO text
+    values = ((field['name'], record[field['name']]) for field in result['fields']
+              if field['name'] != '_sheet' and field['name'] in record)
+    return {
+        'file': result['filename'],
+        'sheet': record['_sheet'] if '_sheet' in record else '',
+        'record': recno + 1,
+        'part_number': next((display_value(record[field]) for field in result['part_fields']
+                             if field in record and record[field]), ''),
+        'fields': {name: value.isoformat() if isinstance(value, datetime.date) else value
+                   for name, value in values if value is not None and value != ''}
+    }
+
+def batch_rows(all_data, part_numbers, fold=False, exact=False, near=False, alternates=False, prefix=False,
+               query=False):
+    # Yield one dict per matching record for each part number, in input
+    # order; a part number without matches yields a single row with match
+    # 'none' so the output accounts for every line of the input. With
+    # query the lines are field queries instead (see run_query).
+    for part_number in part_numbers:
+        if query:
+            try:
+                results, is_near = run_query(all_data, part_number, fold), False
+            except QueryError as e:
+                print(f"Error in query {part_number}: {str(e)}", file=sys.stderr)
+                results, is_near = [], False
+            match = 'query'
+        else:
+            results, is_near = find_matches(all_data, part_number, fold, exact=exact, near=near,
+                                            alternates=alternates, prefix=prefix)
+            match = 'near' if is_near else 'prefix' if prefix else 'exact' if exact else 'match'
+        if not results:
+            yield {'query': part_number, 'match': 'none', 'file': '', 'sheet': '',
+                   'record': '', 'part_number': '', 'fields': {}}
+            continue
+        for result in results:
+            matches = result['matches']
+            for recno, record in zip(matches.recnos, matches):
+                row = {'query': part_number, 'match': match}
+                row.update(record_row(result, recno, record))
+                yield row
+
+def write_batch(rows, out, output_format='csv', all_data=None):
+    # Stream rows as CSV (fields flattened to "NAME: value; ...") or as
+    # JSON lines. Returns the number of rows written. CSV values are shown
+    # as in the window, with the field descriptors of all_data (numbers keep
+    # their decimals).
+    count = 0
+    if output_format == 'jsonl':
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+        return count
+    
+    described = {filename: {field['name']: field for field in data['fields']}
+                 for filename, data in (all_data or {}).items()}
+    writer = csv.writer(out)
+    writer.writerow(BATCH_COLUMNS)
+    for row in rows:
+        fields_of = described.get(row['file'], {})
+        fields = '; '.join(f"{name}: {display_value(value, fields_of.get(name))}"
+                           for name, value in row['fields'].items())
+        writer.writerow([row[column] for column in BATCH_COLUMNS[:-1]] + [fields])
+        count += 1
+    return count
+
+def load_all(data_dir, seek=False, rollups=False):
+    # Load every source file up front for the headless modes; seek as for
+    # load_sources. rollups builds the per-part rollups once all files are
+    # loaded.
+    started = time.time()
+    all_data = {}
+    # Reader warnings go to stderr so they never mix with the output
+    def load():
+        for filename, entry in load_sources(data_dir, seek=seek):
+            if entry is not None:
+                all_data[filename] = entry
+        if rollups:
+            profiled('rollups', build_rollups, all_data.items())
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        profiled('load', load)
+    total_records = sum(len(data['records']) for data in all_data.values())
+    print(f"Loaded {total_records:,} records from {len(all_data)} files in {time.time() - started:.1f}s",
+          file=sys.stderr)
+    return all_data
+
+def headless_data_dir(args):
+    data_dir = args.data_dir or find_data_dir(app_base_path())
+    if not data_dir or not os.path.isdir(data_dir):
+        print("Error: AirDataDatabase folder not found.", file=sys.stderr)
+        return None
+    return data_dir
+
+def run_batch(args):
+    # Headless lookup: load every file once, then answer each part number
+    # read from args.batch ('-' for stdin) without starting the GUI
+    data_dir = headless_data_dir(args)
+    if data_dir is None:
+        return 2
+    
+    # The input and output are opened before the data is loaded, so a
+    # wrong path fails at once
+    try:
+        source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8-sig', errors='replace')
+    except OSError as e:
+        print(f"Error: cannot read {args.batch}: {e.strerror or str(e)}", file=sys.stderr)
+        return 2
+    try:
+        out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    except OSError as e:
+        print(f"Error: cannot write {args.output}: {e.strerror or str(e)}", file=sys.stderr)
+        if source is not sys.stdin:
+            source.close()
+        return 2
+    
+    try:
+        # Exact and prefix lookups can seek through the ERP's index files
+        # instead of indexing the tables; fold and near matching and field
+        # queries need the index
+        all_data = load_all(data_dir, seek=(args.exact or args.prefix) and not (args.fold or args.near or args.query))
+        started = time.time()
+        part_numbers = read_queries(source) if args.query else read_part_numbers(source)
+        rows = batch_rows(all_data, part_numbers, args.fold, args.exact, args.near, args.alternates, args.prefix,
+                          args.query)
+        count = write_batch(rows, out, args.format, all_data)
+        out.flush()
+    except BrokenPipeError:
+        # Whatever read the output (head, a closed pager) stopped early.
+        # Point stdout at devnull so the interpreter's final flush does
+        # not fail again on the closed pipe.
+        if out is sys.stdout:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        print("Output closed before all rows were written.", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"Error writing {args.output}: {e.strerror or str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"Wrote {count:,} rows in {time.time() - started:.1f}s", file=sys.stderr)
+    return 0
+
+def run_compile(args):
+    # Compile the data folder into a snapshot that later loads read
+    # instead of parsing the files
+    data_dir = headless_data_dir(args)
+    if data_dir is None:
+        return 2
+    path = snapshot_path(data_dir)
+    started = time.time()
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            count = compile_snapshot(data_dir, path, lambda filename: print(f"Compiling {filename}..."))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error compiling {path}: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"Compiled {count:,} records into {path} in {time.time() - started:.1f}s", file=sys.stderr)
+    return 0
+
+# Records returned per file and query by the lookup server unless the
+# request asks for another limit
+SERVER_RECORD_LIMIT = 1000
+
+def lookup_result(all_data, part_number, fold=False, exact=False, near=False, alternates=False,
+                  limit=SERVER_RECORD_LIMIT, prefix=False):
+    # The matches for one part number as plain data; each file lists at
+    # most limit records next to its total
+    results, is_near = find_matches(all_data, part_number, fold, exact=exact, near=near,
+                                    alternates=alternates, prefix=prefix)
+    files = result_files(results, limit)
+    return {'query': part_number, 'near': is_near,
+            'alternates': alternate_family(all_data, part_number, fold) if alternates else [],
+            'summary': None if is_near else part_summary(all_data, part_number, fold),
+            'total': sum(result['total'] for result in files), 'results': files}
+
+def query_result(all_data, query, fold=False, limit=SERVER_RECORD_LIMIT):
+    # The matches for one field query as plain data, like lookup_result
+    files = result_files(run_query(all_data, query, fold), limit)
+    return {'query': query, 'near': False, 'alternates': [],
+            'total': sum(result['total'] for result in files), 'results': files}
+
+def result_files(results, limit):
+    # Each file's matches as plain data, at most limit records next to
+    # the total
+    files = []
+    for result in results:
+        matches = result['matches']
+        files.append({
+            'file': result['filename'],
+            'type': result['type'],
+            'total': len(matches),
+            'fields': [field['name'] for field in result['fields'] if field['name'] != '_sheet'],
+            'part_fields': list(result['part_fields']),
+            'records': [record_row(result, recno, record)
+                        for recno, record in zip(matches.recnos[:limit], matches[:limit])]
+        })
+    return files
+
+class LookupClient:
+    # Searches through a lookup server instead of local files; results
+    # have the same shape as find_matches so the GUI can show them
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+    
+    def _get(self, path, params=None):
+        url = self.url + path
+        if params:
+            url += '?' + urlencode(params)
+        # urllib.request pulls in the http and email packages, so it is
+        # only imported once the window runs as a client
+        import urllib.request
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    
+    def status(self):
+        return self._get('/status')
+    
+    def find_matches(self, part_number, fold=False, alternates=False):
+        # Returns (results, near, alternate family, part summary)
+        reply = self._get('/lookup', {'pn': part_number, 'fold': int(fold), 'near': 1,
+                                      'alternates': int(alternates)})
+        return self._results(reply), reply['near'], reply.get('alternates', []), reply.get('summary')
+    
+    def run_query(self, query, fold=False):
+        # The query is read here first so a mistake is reported like a
+        # local one
+        parse_query(query)
+        return self._results(self._get('/query', {'q': query, 'fold': int(fold)}))
+    
+    def _results(self, reply):
+        results = []
+        for result in reply['results']:
+            matches = []
+            for row in result['records']:
+                record = dict(row['fields'])
+                if row['sheet']:
+                    record['_sheet'] = row['sheet']
+                matches.append(record)
+            results.append({
+                'filename': result['file'],
+                'matches': matches,
+                'total': result['total'],
+                'fields': [{'name': name} for name in result['fields']],
+                'part_fields': result['part_fields'],
+                'type': result['type']
+            })
+        return results
+
+# Result rows added to the list per page while scrolling
+RESULT_PAGE_SIZE = 200
+
+def result_positions(results):
+    # (result index, match index) of every row of the results list
+    return ((i, j) for i, result in enumerate(results) for j in range(len(result['matches'])))
+
+def result_row(result, match_index):
+    # (file, record number, part number, details) of one row of the results
+    # list; each value is read once, memo fields are decoded here
+    record = result['matches'][match_index]
+    location = result['filename']
+    if '_sheet' in record:
+        location += f" [{record['_sheet']}]"
+    part = next((display_value(record[field]) for field in result['part_fields']
+                 if field in record and record[field]), '')
+    values = ((field, display_value(record[field['name']], field)) for field in result['fields']
+              if field['name'] in record and field['name'] not in result['part_fields'])
+    details = '; '.join(f"{field['name']}: {value}" for field, value in values if value)
+    return location, match_index + 1, part, details[:300].replace('\n', ' ')
+
+# Search-as-you-type waits this long after the last keystroke and needs at
+# least this many characters
+SEARCH_DELAY_MS = 250
+SEARCH_MIN_CHARS = 2
+
+# Extending a query narrows the previous results when they are this small
+REUSE_LIMIT = 5000
 
 class PartLookupApp:
-    def __init__(self, root):
+    def __init__(self, root, server=None):
         self.root = root
         self.root.title("Offline Part Number Lookup (with Excel Support)")
         self.root.geometry("900x700")
         
         # Data storage
         self.all_data = {}
-        self.data_loaded = False
+        self.results = []
+        self.pending_rows = iter(())
         
-        # Get the directory where the executable/script is located
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable
-            self.base_path = os.path.dirname(sys.executable)
-        else:
-            # Running as script
-            self.base_path = os.path.dirname(os.path.abspath(__file__))
+        # Background search state; a search is stale once the generation
+        # has moved on
+        self.index_lock = threading.Lock()
+        self.search_queue = queue.Queue()
+        self.search_generation = 0
+        self.search_running = False
+        self.search_after = None
+        self.search_query = None
+        self.last_search = None
+        self.search_stats = []
+        self.search_elapsed = None
+        self.loading = False
+        self.load_queue = None
+        self.data_dir = None
+        self.load_started = 0
+        self.refresh_message = None
+        
+        # With a server URL the window is a thin client of a lookup server
+        # and loads no files itself
+        self.client = LookupClient(server) if server else None
+        
+        self.base_path = app_base_path()
         
         # Setup GUI
         self.setup_gui()
         
+        # Draw the window before any file is opened; loading then runs
+        # while it is already on screen
+        self.startup = {}
+        self.root.update()
+        self.startup['first_paint_s'] = time.perf_counter() - STARTED
+        
         # Load data
         self.load_data()
     
@@ -178,6 +4183,7 @@ class PartLookupApp:
         self.part_entry = ttk.Entry(search_frame, width=30)
         self.part_entry.grid(row=0, column=1, padx=(0, 10))
         self.part_entry.bind('<Return>', lambda e: self.search_part())
+        self.part_entry.bind('<KeyRelease>', self._on_part_typed)
         
         # Search button
         self.search_btn = ttk.Button(search_frame, text="Search", command=self.search_part)
@@ -186,6 +4192,22 @@ class PartLookupApp:
         # Clear button
         ttk.Button(search_frame, text="Clear", command=self.clear_all).grid(row=0, column=3)
         
+        # Refresh button
+        ttk.Button(search_frame, text="Refresh", command=self.refresh_data).grid(row=0, column=4, padx=(10, 0))
+        
+        # Diagnostics button
+        ttk.Button(search_frame, text="Diagnostics", command=self.show_diagnostics).grid(row=0, column=5, padx=(10, 0))
+        
+        # Fuzzy matching option
+        self.fold_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="Treat O/0 and I/1 as the same", variable=self.fold_var,
+                        command=self._on_part_typed).grid(row=1, column=1, columnspan=3, sticky=tk.W, pady=(5, 0))
+        
+        # Alternate part numbers option
+        self.alternates_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(search_frame, text="Include alternate part numbers", variable=self.alternates_var,
+                        command=self._on_part_typed).grid(row=2, column=1, columnspan=3, sticky=tk.W)
+        
         # Status label
         self.status_label = ttk.Label(main_frame, text="Loading data...", foreground="blue")
         self.status_label.grid(row=1, column=0, columnspan=2, pady=5)
@@ -194,9 +4216,27 @@ class PartLookupApp:
         results_frame = ttk.LabelFrame(main_frame, text="Search Results", padding="10")
         results_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
         
-        # Results text area
-        self.results_text = scrolledtext.ScrolledText(results_frame, wrap=tk.WORD, width=80, height=25)
-        self.results_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # Result summary
+        self.summary_label = ttk.Label(results_frame, text="")
+        self.summary_label.grid(row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 5))
+        
+        # Results list, one row per matching record. Rows are inserted a
+        # page at a time as the list is scrolled towards its end.
+        columns = ('file', 'record', 'part', 'details')
+        self.results_tree = ttk.Treeview(results_frame, columns=columns, show='headings', selectmode='browse', height=15)
+        for column, heading, width, stretch in (('file', "File", 200, False), ('record', "Record", 60, False),
+                                                ('part', "Part Number", 150, False), ('details', "Details", 400, True)):
+            self.results_tree.heading(column, text=heading, anchor=tk.W)
+            self.results_tree.column(column, width=width, stretch=stretch, anchor=tk.W)
+        self.results_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.results_scroll = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.results_tree.yview)
+        self.results_scroll.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.results_tree.configure(yscrollcommand=self._on_results_scroll)
+        self.results_tree.bind('<<TreeviewSelect>>', self._show_record_details)
+        
+        # Details of the selected record
+        self.results_text = scrolledtext.ScrolledText(results_frame, wrap=tk.WORD, width=80, height=10)
+        self.results_text.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
         
         # Configure grid weights
         self.root.columnconfigure(0, weight=1)
@@ -204,87 +4244,228 @@ class PartLookupApp:
         main_frame.columnconfigure(0, weight=1)
         main_frame.rowconfigure(2, weight=1)
         results_frame.columnconfigure(0, weight=1)
-        results_frame.rowconfigure(0, weight=1)
+        results_frame.rowconfigure(1, weight=3)
+        results_frame.rowconfigure(2, weight=1)
     
     def load_data(self):
-        # Try to find the data directory
-        possible_paths = [
-            os.path.join(self.base_path, 'AirDataDatabase'),
-            os.path.join(self.base_path, 'assets', 'AirDataDatabase'),
-            os.path.join(os.path.dirname(self.base_path), 'assets', 'AirDataDatabase'),
-            '/var/www/cal.lueshub.com/assets/AirDataDatabase'
-        ]
-        
-        data_dir = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                data_dir = path
-                break
+        if self.client is not None:
+            self.status_label.config(text=f"Connecting to {self.client.url}...")
+            self.loading = True
+            self.load_queue = queue.Queue()
+            threading.Thread(target=self._connect_worker, daemon=True).start()
+            self.root.after(100, self._poll_load_queue)
+            return
         
+        data_dir = find_data_dir(self.base_path)
         if not data_dir:
             self.status_label.config(text="Error: AirDataDatabase folder not found!", foreground="red")
             messagebox.showerror("Error", "Could not find AirDataDatabase folder. Please ensure it's in the same directory as this application.")
             return
         
+        self.data_dir = data_dir
         self.status_label.config(text=f"Loading data from {data_dir}...")
-        self.root.update()
-        
-        # Priority files for part data
-        dbf_files = ['INVENT.DBF', 'POITEM.DBF', 'BUYQUOTE.DBF', 'ALTPART.DBF', 'KIT.DBF']
-        excel_files = ['INVENTORIO ACTUAL GENTHRUST.xlsx']
-        
-        loaded_count = 0
-        
-        # Load DBF files
-        for filename in dbf_files:
-            filepath = os.path.join(data_dir, filename)
-            if os.path.exists(filepath):
-                self.status_label.config(text=f"Loading {filename}...")
-                self.root.update()
-                
-                reader = DBFReader(filepath)
-                if reader.records:
-                    self.all_data[filename] = {
-                        'fields': reader.fields,
-                        'records': reader.records,
-                        'type': 'DBF'
-                    }
-                    loaded_count += 1
-        
-        # Load Excel files
-        if EXCEL_SUPPORT:
-            for filename in excel_files:
-                filepath = os.path.join(data_dir, filename)
-                if os.path.exists(filepath):
-                    self.status_label.config(text=f"Loading {filename}...")
-                    self.root.update()
-                    
-                    reader = ExcelReader(filepath)
-                    if reader.records:
-                        self.all_data[filename] = {
-                            'fields': reader.fields,
-                            'records': reader.records,
-                            'type': 'Excel'
-                        }
-                        loaded_count += 1
-        else:
-            # Check if Excel files exist but can't be read
-            for filename in excel_files:
-                filepath = os.path.join(data_dir, filename)
-                if os.path.exists(filepath):
-                    print(f"Found {filename} but openpyxl is not installed. Skipping Excel file.")
+        self._start_loading()
+    
+    def _start_loading(self, filenames=None):
+        # Parse on a worker thread; files become searchable as the main
+        # thread picks them up from the queue
+        self.loading = True
+        self.load_started = time.time()
+        self.load_queue = queue.Queue()
+        threading.Thread(target=self._load_worker, args=(self.data_dir, filenames), daemon=True).start()
+        self.root.after(100, self._poll_load_queue)
+    
+    def _load_worker(self, data_dir, filenames=None):
+        def load():
+            progress = lambda filename: self.load_queue.put(('loading', filename, None))
+            loaded = []
+            for filename, entry in load_sources(data_dir, progress, filenames=filenames):
+                self.load_queue.put(('loaded', filename, entry))
+                if entry is not None:
+                    loaded.append((filename, entry))
+            # Searching does not wait for the rollups; the part summary
+            # shows up once they are built
+            profiled('rollups', build_rollups, loaded)
         
-        if loaded_count > 0:
-            self.data_loaded = True
-            excel_msg = " (Excel support enabled)" if EXCEL_SUPPORT else " (Excel support disabled - install openpyxl)"
-            self.status_label.config(text=f"Data loaded from {loaded_count} files{excel_msg}. Ready to search.", foreground="green")
+        try:
+            profiled('load', load)
+        except Exception as e:
+            print(f"Error loading data: {str(e)}")
+        self.load_queue.put(('done', None, None))
+    
+    def _connect_worker(self):
+        # The server's files stand in for loaded ones; searches go to it
+        try:
+            for entry in self.client.status()['files']:
+                self.load_queue.put(('loaded', entry['file'], {'type': entry['type'], 'records': entry['records'],
+                                                               'stats': entry.get('stats', {})}))
+        except Exception as e:
+            print(f"Error connecting to {self.client.url}: {str(e)}")
+        self.load_queue.put(('done', None, None))
+    
+    def _poll_load_queue(self):
+        try:
+            while True:
+                kind, filename, entry = self.load_queue.get_nowait()
+                if kind == 'loading':
+                    searchable = f" ({len(self.all_data)} files searchable)" if self.all_data else ""
+                    self.status_label.config(text=f"Loading {filename}...{searchable}", foreground="blue")
+                elif kind == 'loaded' and entry is not None:
+                    self.all_data[filename] = entry
+                    # Searching works from the first loaded file on
+                    self.startup.setdefault('first_search_s', time.perf_counter() - STARTED)
+                elif kind == 'loaded':
+                    self.all_data.pop(filename, None)
+                elif kind == 'refreshed':
+                    # filename holds the refresh summary; entry is whether
+                    # files are being loaded again
+                    self.status_label.config(text=filename, foreground="blue" if entry else "green")
+                    self.refresh_message = None if entry else filename
+                elif kind == 'replaced':
+                    self._retire_entry(entry)
+                elif kind == 'done':
+                    self.loading = False
+                    if 'loaded_s' not in self.startup:
+                        self.startup['loaded_s'] = time.perf_counter() - STARTED
+                        log_event('startup', **self.startup)
+                    if self.refresh_message is not None:
+                        self.status_label.config(text=self.refresh_message, foreground="green")
+                        self.refresh_message = None
+                    else:
+                        self._loading_finished()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self._poll_load_queue)
+    
+    def _loading_finished(self):
+        loaded_count = len(self.all_data)
+        if self.client is not None:
+            if loaded_count > 0:
+                self.status_label.config(text=f"Connected to {self.client.url} ({loaded_count} files). Ready to search.", foreground="green")
+                self.part_entry.focus()
+            else:
+                self.status_label.config(text=f"Error: Could not reach the lookup server at {self.client.url}!", foreground="red")
+        elif loaded_count > 0:
+            # Workbooks are read by XlsxWorkbook; openpyxl is only imported
+            # for those it cannot read, and is False once that failed
+            excel_msg = " (install openpyxl to read every workbook)" if openpyxl is False else ""
+            alternates = self.all_data.get(ALTERNATE_FILE, {}).get('alternates')
+            alternates_msg = (f" {ALTERNATE_FILE} has no pair of part number columns, so alternates are off."
+                              if alternates is not None and alternates.columns is None else "")
+            self.status_label.config(text=f"Data loaded from {loaded_count} files{excel_msg}. Ready to search.{alternates_msg}", foreground="green")
             self.part_entry.focus()
         else:
             self.status_label.config(text="Error: Could not load any data files!", foreground="red")
     
+    def refresh_data(self):
+        # Pick up rows appended to the DBF files since they were loaded;
+        # files that changed in any other way are loaded again. The files
+        # are checked on a worker thread (see _refresh_worker).
+        if self.client is not None:
+            self.status_label.config(text="The lookup server keeps the data up to date.", foreground="green")
+            return
+        if self.loading or not self.data_dir:
+            self.status_label.config(text="Data is still loading. Please wait.", foreground="blue")
+            return
+        
+        self.last_search = None
+        self.refresh_message = None
+        since = self.load_started
+        self.loading = True
+        self.load_started = time.time()
+        self.load_queue = queue.Queue()
+        self.status_label.config(text="Checking the data files for changes...", foreground="blue")
+        threading.Thread(target=self._refresh_worker, args=(self.data_dir, since), daemon=True).start()
+        self.root.after(100, self._poll_load_queue)
+    
+    def _refresh_worker(self, data_dir, since):
+        # Tables are refreshed in place under index_lock, so a search sees
+        # them either before or after. Files that have to be read again are
+        # loaded outside the lock and swapped in under it; the main thread
+        # closes the readers they replace (see _retire_entry).
+        try:
+            appended_count = 0
+            changed_count = 0
+            reload = []
+            with self.index_lock:
+                for filename, data in self.all_data.items():
+                    if data['type'] == 'DBF':
+                        result = data['reader'].refresh()
+                        if result is None:
+                            reload.append(filename)
+                            continue
+                        appended, deleted, recalled = result
+                        data['index'].update(data['reader'], appended, deleted, recalled)
+                        data['records'] = data['reader'].records
+                        if appended or deleted or recalled:
+                            data['columns'] = ColumnIndexes(data['reader'])
+                            if 'rollup' in data:
+                                data['rollup'].update(data['reader'], data['index'], appended, deleted, recalled)
+                        if 'alternates' in data and (appended or deleted or recalled):
+                            data['alternates'] = AlternateParts().build(data['reader'])
+                        appended_count += len(appended)
+                        changed_count += len(deleted) + len(recalled)
+                    elif ParsedCache.signature(data['path']) != data['signature']:
+                        reload.append(filename)
+            
+            # Files that were missing or empty when the data was loaded
+            for filename in DBF_FILES + EXCEL_FILES:
+                filepath = os.path.join(data_dir, filename)
+                if filename in self.all_data or not os.path.exists(filepath):
+                    continue
+                if filename in DBF_FILES:
+                    changed = dbf_record_count(filepath) > 0
+                else:
+                    changed = os.path.getmtime(filepath) >= since
+                if changed:
+                    reload.append(filename)
+            
+            message = f"Refreshed: {appended_count} new records, {changed_count} deleted or restored."
+            if reload:
+                message += f" Reloading {', '.join(reload)}..."
+            self.load_queue.put(('refreshed', message, bool(reload)))
+            
+            if reload:
+                progress = lambda filename: self.load_queue.put(('loading', filename, None))
+                loaded = []
+                for filename, entry in load_sources(data_dir, progress, filenames=reload):
+                    # The main thread reads all_data without the lock, so
+                    # it is replaced rather than changed
+                    with self.index_lock:
+                        all_data = dict(self.all_data)
+                        old = all_data.pop(filename, None)
+                        if entry is not None:
+                            all_data[filename] = entry
+                            loaded.append((filename, entry))
+                        self.all_data = all_data
+                    if old is not None:
+                        self.load_queue.put(('replaced', filename, old))
+                profiled('rollups', build_rollups, loaded)
+        except Exception as e:
+            print(f"Error refreshing data: {str(e)}")
+        self.load_queue.put(('done', None, None))
+    
+    def _retire_entry(self, entry):
+        # Close the reader of a file that was loaded again. Searches take
+        # their files under index_lock, so after the swap only results
+        # shown or still on their way here can use it: those are dropped,
+        # and a search in flight is started again on the new data.
+        reader = entry['reader']
+        if self.search_running and self.search_query is not None:
+            self._start_search(self.search_query[0])
+        if any(getattr(result['matches'], 'reader', None) is reader for result in self.results):
+            self._clear_results()
+            if not self.search_running:
+                self.search_query = None
+        reader.close()
+    
     def search_part(self):
-        if not self.data_loaded:
-            messagebox.showwarning("Warning", "Data is not loaded yet. Please wait.")
+        if not self.all_data:
+            if self.loading:
+                messagebox.showwarning("Warning", "Data is not loaded yet. Please wait.")
+            else:
+                messagebox.showwarning("Warning", "No data files are loaded.")
             return
         
         part_number = self.part_entry.get().strip().upper()
@@ -292,91 +4473,325 @@ class PartLookupApp:
             messagebox.showwarning("Warning", "Please enter a part number.")
             return
         
-        self.results_text.delete(1.0, tk.END)
+        if self.search_after is not None:
+            self.root.after_cancel(self.search_after)
+            self.search_after = None
+        self._start_search(part_number)
+    
+    def _on_part_typed(self, event=None):
+        # Debounce keystrokes; the search starts once typing pauses
+        if self.search_after is not None:
+            self.root.after_cancel(self.search_after)
+        self.search_after = self.root.after(SEARCH_DELAY_MS, self._search_typed)
+    
+    def _search_typed(self):
+        self.search_after = None
+        part_number = self.part_entry.get().strip().upper()
+        if len(part_number) < SEARCH_MIN_CHARS:
+            # Drop any search still running for a longer query
+            self.search_generation += 1
+            self.search_running = False
+            self.search_query = None
+            if not part_number:
+                self._clear_results()
+            return
+        if self.search_query == (part_number, self.fold_var.get(), self.alternates_var.get()):
+            return
+        if self.all_data:
+            self._start_search(part_number)
+    
+    def _start_search(self, part_number):
+        # Search on a worker thread. Starting a new search makes the one in
+        # flight stale; it stops within a few thousand records (see checked).
+        fold = self.fold_var.get()
+        alternates = self.alternates_var.get()
+        self.search_query = (part_number, fold, alternates)
+        self.search_generation += 1
+        generation = self.search_generation
+        cancel = lambda: generation != self.search_generation
+        
+        # An extended query only has to narrow the previous results;
+        # records of alternates would not survive that
+        previous = None
+        if self.last_search is not None and not alternates and not is_field_query(part_number):
+            last_query, last_fold, last_recnos = self.last_search
+            if (last_fold == fold and last_query in part_number and last_query != part_number
+                    and sum(len(recnos) for recnos in last_recnos.values()) <= REUSE_LIMIT):
+                previous = last_recnos
+        
         self.status_label.config(text=f"Searching for part number: {part_number}...", foreground="blue")
-        self.root.update()
+        args = (generation, part_number, fold, alternates, previous, cancel, time.perf_counter())
+        threading.Thread(target=self._search_worker, args=args, daemon=True).start()
+        if not self.search_running:
+            self.search_running = True
+            self.root.after(50, self._poll_search_queue)
+    
+    def _search_worker(self, generation, part_number, fold, alternates, previous, cancel, started):
+        all_data = {}
+        family = []
+        summary = None
+        page = []
+        timings = {'started': started}
+        # Text with FIELD<op>VALUE terms is a field query (see parse_query)
+        query = is_field_query(part_number)
+        try:
+            if self.client is not None:
+                if query:
+                    results, near = self.client.run_query(part_number, fold), False
+                else:
+                    results, near, family, summary = self.client.find_matches(part_number, fold, alternates)
+                timings['scan_s'] = time.perf_counter() - started
+                matched = time.perf_counter()
+                page = [result_row(results[i], j) for i, j in islice(result_positions(results), RESULT_PAGE_SIZE)]
+                timings['match_s'] = time.perf_counter() - matched
+                self.search_queue.put((generation, part_number, fold, results, near, family, summary, page, None,
+                                       timings))
+                return
+            with self.index_lock:
+                if cancel():
+                    return
+                # Taken under the lock, so a refresh cannot swap out and
+                # close a file's reader while it is searched
+                all_data = dict(self.all_data)
+                if query:
+                    results = profiled('query', run_query, all_data, part_number, fold, cancel, timings)
+                    near = False
+                else:
+                    results, near = profiled('search', find_matches, all_data, part_number, fold, cancel, previous,
+                                             False, True, alternates, timings)
+                # The match phase gathers what is shown besides the record
+                # numbers: the alternates, the part summary and the first
+                # page of rows, read here rather than on the main thread
+                # (and under the lock, while the readers are open)
+                matched = time.perf_counter()
+                if alternates:
+                    family = alternate_family(all_data, part_number, fold)
+                if not near and not query:
+                    summary = part_summary(all_data, part_number, fold)
+                page = [result_row(results[i], j) for i, j in islice(result_positions(results), RESULT_PAGE_SIZE)]
+                timings['match_s'] = time.perf_counter() - matched
+        except SearchCancelled:
+            return
+        except QueryError as e:
+            timings['error'] = str(e)
+            results, near = [], False
+        except Exception as e:
+            print(f"Error searching for {part_number}: {str(e)}")
+            results, near = [], False
         
-        results = []
-        total_matches = 0
+        # Record numbers per searched file, for narrowing the next query
+        searched = None
+        if not alternates and not query:
+            searched = {filename: [] for filename in all_data}
+            for result in results:
+                searched[result['filename']] = result['matches'].recnos
+        self.search_queue.put((generation, part_number, fold, results, near, family, summary, page, searched, timings))
+    
+    def _poll_search_queue(self):
+        latest = None
+        try:
+            while True:
+                item = self.search_queue.get_nowait()
+                if item[0] == self.search_generation:
+                    latest = item
+        except queue.Empty:
+            pass
         
-        # Search through each loaded file
-        for filename, data in self.all_data.items():
-            file_matches = []
-            
-            # Find part number fields
-            part_fields = []
-            for field in data['fields']:
-                field_name = field['name'].upper()
-                if 'PART' in field_name or 'ITEM' in field_name or 'NUMBER' in field_name or 'PN' in field_name or 'CODIGO' in field_name:
-                    part_fields.append(field['name'])
-            
-            # If no specific part fields found, search all fields
-            if not part_fields:
-                part_fields = [f['name'] for f in data['fields']]
-            
-            # Search records
-            for record in data['records']:
-                match_found = False
-                for field in part_fields:
-                    if field in record:
-                        value = str(record[field]).upper()
-                        if part_number in value or value == part_number:
-                            match_found = True
-                            break
-                
-                if match_found:
-                    file_matches.append(record)
-                    total_matches += 1
-            
-            if file_matches:
-                results.append({
-                    'filename': filename,
-                    'matches': file_matches,
-                    'fields': data['fields'],
-                    'type': data.get('type', 'Unknown')
-                })
+        if latest is not None:
+            _, part_number, fold, results, near, family, summary, page, searched, timings = latest
+            self.search_running = False
+            self.last_search = None if near or searched is None else (part_number, fold, searched)
+            if 'error' in timings:
+                self._clear_results()
+                self.status_label.config(text=f"Query error: {timings['error']}", foreground="red")
+                return
+            rendered = time.perf_counter()
+            self.search_elapsed = rendered - timings['started']
+            self.show_results(part_number, results, near, family, summary, page)
+            self._record_search(part_number, fold, results, timings, rendered)
+        elif self.search_running:
+            self.root.after(50, self._poll_search_queue)
+    
+    def _record_search(self, part_number, fold, results, timings, rendered):
+        # Keep the timings of recent searches for the diagnostics window
+        # and append them to the log
+        finished = time.perf_counter()
+        search = {
+            'query': part_number,
+            'fold': fold,
+            'files': len(results),
+            'matches': sum(result.get('total', len(result['matches'])) for result in results),
+            'near': 'near_s' in timings,
+            'scan_ms': timings.get('scan_s', 0) * 1000,
+            'match_ms': timings.get('match_s', 0) * 1000,
+            'render_ms': (finished - rendered) * 1000,
+            'total_ms': (finished - timings['started']) * 1000
+        }
+        self.search_stats = self.search_stats[-19:] + [search]
+        log_event('search', **search)
+    
+    def show_diagnostics(self):
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("700x400")
+        text = scrolledtext.ScrolledText(window, wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, format_diagnostics(self.all_data, self.search_stats, self.startup))
+        log_path = os.environ.get('PARTLOOKUP_LOG')
+        if log_path:
+            text.insert(tk.END, f"\n\nLogging to {log_path}")
+        text.config(state=tk.DISABLED)
+    
+    def show_results(self, part_number, results, near, family=(), summary=None, page=()):
+        # page holds the first rows already read (see result_row)
+        self._clear_results()
+        total_matches = sum(result.get('total', len(result['matches'])) for result in results)
+        self.results = results
+        self.pending_rows = result_positions(results)
+        searched = f"query: {part_number}" if is_field_query(part_number) else f"part number: {part_number}"
         
         # Display results
         if results:
-            self.results_text.insert(tk.END, f"Found {total_matches} matches for part number: {part_number}\n")
-            self.results_text.insert(tk.END, "=" * 80 + "\n\n")
-            
-            for result in results:
-                self.results_text.insert(tk.END, f"FILE: {result['filename']} ({result['type']})\n")
-                self.results_text.insert(tk.END, "-" * 40 + "\n")
-                
-                for i, record in enumerate(result['matches'], 1):
-                    self.results_text.insert(tk.END, f"\nRecord {i}:")
-                    if '_sheet' in record:
-                        self.results_text.insert(tk.END, f" [Sheet: {record['_sheet']}]")
-                    self.results_text.insert(tk.END, "\n")
-                    
-                    # Display all non-empty fields
-                    for field in result['fields']:
-                        field_name = field['name']
-                        if field_name in record and record[field_name].strip() and field_name != '_sheet':
-                            self.results_text.insert(tk.END, f"  {field_name}: {record[field_name]}\n")
-                    
-                    self.results_text.insert(tk.END, "\n")
-                
-                self.results_text.insert(tk.END, "\n" + "=" * 80 + "\n\n")
-            
-            self.status_label.config(text=f"Search complete. Found {total_matches} matches.", foreground="green")
+            if near:
+                self.summary_label.config(text=f"No exact matches for part number: {part_number}. Showing {total_matches} records with similar part numbers.")
+                self.status_label.config(text=f"No exact matches. Showing {total_matches} similar records.{self._partial_note()}", foreground="orange")
+            else:
+                others = [member for member in family if normalize_part(member) != normalize_part(part_number)]
+                family_note = f" and its alternates ({', '.join(others)})" if others else ""
+                headline = f"\n{format_summary(summary)}" if summary else ""
+                self.summary_label.config(text=f"Found {total_matches} matches for {searched}{family_note}{headline}")
+                self.status_label.config(text=f"Search complete. Found {total_matches} matches.{self._partial_note()}", foreground="green")
+            self._insert_result_page(page)
+            self.results_text.insert(tk.END, "Select a record to see all of its fields.")
         else:
-            self.results_text.insert(tk.END, f"No matches found for part number: {part_number}\n\n")
+            self.summary_label.config(text=f"No matches found for {searched}")
+            self.results_text.insert(tk.END, f"No matches found for {searched}\n\n")
             self.results_text.insert(tk.END, "Try searching with a partial part number or check the spelling.")
-            self.status_label.config(text="No matches found.", foreground="orange")
+            self.status_label.config(text=f"No matches found.{self._partial_note()}", foreground="orange")
+    
+    def _insert_result_page(self, rows=()):
+        # Materialize the next page of result rows, taking those already
+        # read from rows
+        rows = iter(rows)
+        for result_index, match_index in islice(self.pending_rows, RESULT_PAGE_SIZE):
+            values = next(rows, None) or result_row(self.results[result_index], match_index)
+            self.results_tree.insert('', tk.END, iid=f"{result_index}:{match_index}", values=values)
+    
+    def _on_results_scroll(self, first, last):
+        self.results_scroll.set(first, last)
+        if float(last) > 0.9:
+            self._insert_result_page()
+    
+    def _show_record_details(self, event=None):
+        selection = self.results_tree.selection()
+        if not selection:
+            return
+        result_index, match_index = (int(part) for part in selection[0].split(':'))
+        result = self.results[result_index]
+        record = result['matches'][match_index]
+        
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, f"FILE: {result['filename']} ({result['type']})\n")
+        self.results_text.insert(tk.END, f"Record {match_index + 1}:")
+        if '_sheet' in record:
+            self.results_text.insert(tk.END, f" [Sheet: {record['_sheet']}]")
+        self.results_text.insert(tk.END, "\n")
+        
+        # Display all non-empty fields
+        for field in result['fields']:
+            field_name = field['name']
+            if field_name in record and field_name != '_sheet':
+                value = display_value(record[field_name], field)
+                if value.strip():
+                    # Memo text continues on indented lines
+                    value = value.replace('\n', '\n    ')
+                    self.results_text.insert(tk.END, f"  {field_name}: {value}\n")
+    
+    def _clear_results(self):
+        self.results = []
+        self.pending_rows = iter(())
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.results_text.delete(1.0, tk.END)
+        self.summary_label.config(text="")
+    
+    def _partial_note(self):
+        note = f" ({self.search_elapsed * 1000:.0f} ms)" if self.search_elapsed is not None else ""
+        if self.loading:
+            note += f" (still loading - searched {len(self.all_data)} files)"
+        return note
     
     def clear_all(self):
+        self.search_generation += 1
+        self.search_running = False
+        self.search_query = None
+        self.last_search = None
         self.part_entry.delete(0, tk.END)
-        self.results_text.delete(1.0, tk.END)
+        self._clear_results()
         self.status_label.config(text="Ready to search.", foreground="green")
         self.part_entry.focus()
 
-def main():
+def import_tk():
+    # tkinter is only needed for the window, so batch mode runs on machines
+    # and servers without it
+    global tk, ttk, messagebox, scrolledtext
+    import tkinter as tk
+    from tkinter import ttk, messagebox, scrolledtext
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline part number lookup")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="look up the part numbers listed in FILE ('-' for stdin) without opening the window")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv',
+                        help="batch output format (default: csv)")
+    parser.add_argument('--output', '-o', default='-', metavar='FILE',
+                        help="write batch output to FILE instead of stdout")
+    parser.add_argument('--compile', action='store_true',
+                        help="compile the data files into a snapshot that later starts read instead of the files")
+    parser.add_argument('--serve', action='store_true',
+                        help="run a lookup server instead of opening the window")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address the server listens on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765,
+                        help="port the server listens on (default: 8765)")
+    parser.add_argument('--threads', type=int, default=8,
+                        help="server request threads (default: 8)")
+    parser.add_argument('--server', metavar='URL', default=os.environ.get('PARTLOOKUP_SERVER'),
+                        help="open the window as a client of the lookup server at URL")
+    parser.add_argument('--data-dir', metavar='DIR',
+                        help="AirDataDatabase folder (default: searched next to the program)")
+    parser.add_argument('--exact', action='store_true',
+                        help="only match part numbers equal to the query, ignoring separators")
+    parser.add_argument('--prefix', action='store_true',
+                        help="only match part numbers starting with the query")
+    parser.add_argument('--fold', action='store_true',
+                        help="treat O/0 and I/1 as the same character")
+    parser.add_argument('--near', action='store_true',
+                        help="report the closest part numbers when nothing matches")
+    parser.add_argument('--alternates', action='store_true',
+                        help="include the records of alternate part numbers from ALTPART.DBF")
+    parser.add_argument('--query', action='store_true',
+                        help="read the batch lines as field queries such as 'AN3-4A QTY>0'")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compile:
+        return run_compile(args)
+    if args.batch:
+        return run_batch(args)
+    if args.serve:
+        from lookup_server import run_server
+        return run_server(args)
+    
+    import_tk()
     root = tk.Tk()
-    app = PartLookupApp(root)
+    app = PartLookupApp(root, args.server)
     root.mainloop()
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Only a frozen Windows build starts pool workers through the exe
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
\ No newline at end of file
@@ -3,7 +3,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from offline_part_lookup import DBFReader
+from offline_part_lookup import DBFReader, display_value
 
 # Test reading a DBF file
 test_file = '/var/www/cal.lueshub.com/assets/AirDataDatabase/ALTPART.DBF'
@@ -18,9 +18,12 @@ for field in reader.fields:
 print(f"\nRecords found: {len(reader.records)}")
 if reader.records:
     print("\nFirst record:")
+    # Values are decoded (numbers, dates, None); print them as the window shows them
+    fields = {field['name']: field for field in reader.fields}
     for key, value in reader.records[0].items():
-        if value.strip():
-            print(f"  {key}: {value}")
+        text = display_value(value, fields.get(key))
+        if text.strip():
+            print(f"  {key}: {text}")
 
 # Test with a larger file
 test_file2 = '/var/www/cal.lueshub.com/assets/AirDataDatabase/INVENT.DBF'
@@ -34,8 +37,8 @@ if part_fields and reader2.records:
     print(f"\nSample part numbers from field '{part_fields[0]}':")
     count = 0
     for record in reader2.records[:100]:
-        if part_fields[0] in record and record[part_fields[0]].strip():
-            print(f"  - {record[part_fields[0]]}")
+        if part_fields[0] in record and display_value(record[part_fields[0]]).strip():
+            print(f"  - {display_value(record[part_fields[0]])}")
             count += 1
             if count >= 5:
                 break
\ No newline at end of file
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Tests of the lookup server on localhost over a generated data folder.
+# Run with:
+#   python -m pytest -q
+import os
+import sys
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import offline_part_lookup as lookup
+from lookup_server import LookupServer
+from test_part_lookup import STOCK_PARTS, close_readers, write_stock_dir
+
+@pytest.fixture
+def server(tmp_path):
+    data_dir = write_stock_dir(tmp_path, count=2000)
+    all_data = lookup.load_all(data_dir, rollups=True)
+    server = LookupServer(('127.0.0.1', 0), all_data, threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", all_data, STOCK_PARTS
+    server.shutdown()
+    server.server_close()
+    thread.join()
+    close_readers(all_data)
+
+def get(url, path, params=None):
+    if params:
+        path += '?' + urlencode(params)
+    with urllib.request.urlopen(url + path, timeout=30) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def error(url, path, params=None, data=None):
+    # (status, error message) of a request the server refuses
+    if params:
+        path += '?' + urlencode(params)
+    with pytest.raises(urllib.error.HTTPError) as raised:
+        urllib.request.urlopen(urllib.request.Request(url + path, data=data), timeout=30)
+    return raised.value.code, json.loads(raised.value.read().decode('utf-8'))['error']
+
+def test_lookup_equals_local_result(server):
+    url, all_data, parts = server
+    for part in parts[:5]:
+        reply = get(url, '/lookup', {'pn': part})
+        assert reply == lookup.lookup_result(all_data, part)
+        assert reply['total'] > 0
+        assert reply['summary']['part_number'] == part
+    reply = get(url, '/lookup', {'pn': parts[0], 'exact': 1, 'limit': 2})
+    assert reply == lookup.lookup_result(all_data, parts[0], exact=True, limit=2)
+    assert all(len(result['records']) <= 2 for result in reply['results'])
+
+def test_post_lookup_of_several_part_numbers(server):
+    url, all_data, parts = server
+    body = json.dumps({'pn': parts[:3] + ['NO-SUCH-PART'], 'prefix': True}).encode('utf-8')
+    request = urllib.request.Request(url + '/lookup', data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        reply = json.loads(response.read().decode('utf-8'))
+    assert reply['results'] == [lookup.lookup_result(all_data, part.upper(), prefix=True)
+                                for part in parts[:3] + ['NO-SUCH-PART']]
+    assert reply['results'][-1]['total'] == 0
+
+def test_status(server):
+    url, all_data, _ = server
+    status = get(url, '/status')
+    assert sorted(entry['file'] for entry in status['files']) == sorted(all_data)
+    assert status['records'] == sum(len(data['records']) for data in all_data.values())
+
+def test_query(server):
+    url, all_data, _ = server
+    query = 'FILE=INVENT.DBF QTY>=4'
+    assert get(url, '/query', {'q': query}) == lookup.query_result(all_data, query)
+    assert get(url, '/query', {'q': query})['total'] == sum(1 for record in all_data['INVENT.DBF']['records']
+                                                            if record['QTY'] >= 4)
+
+def test_bad_requests(server):
+    url, _, _ = server
+    assert error(url, '/lookup') == (400, "missing pn parameter")
+    assert error(url, '/lookup', {'pn': 'AN3', 'limit': 'many'}) == (400, "limit must be a number")
+    assert error(url, '/query', {'q': 'QTY>'}) == (400, "QTY> needs a value")
+    assert error(url, '/lookup', data=b'not json')[0] == 400
+    assert error(url, '/nothing')[0] == 404
+
+def test_client_results_match_local_search(server):
+    url, all_data, parts = server
+    client = lookup.LookupClient(url)
+    results, near, _, summary = client.find_matches(parts[1])
+    expected, expected_near = lookup.find_matches(all_data, parts[1])
+    assert near == expected_near
+    assert summary == lookup.part_summary(all_data, parts[1])
+    assert [(result['filename'], len(result['matches'])) for result in results] == \
+        [(result['filename'], len(result['matches'])) for result in expected]
+    with pytest.raises(lookup.QueryError):
+        client.run_query('"unclosed')
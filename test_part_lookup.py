@@ -0,0 +1,954 @@
+#!/usr/bin/env python3
+# Tests of offline_part_lookup.py over small generated data folders.
+# Run with:
+#   python -m pytest -q
+import io
+import os
+import sys
+import csv
+import json
+import random
+import struct
+import datetime
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import benchmark_lookup as bench
+import offline_part_lookup as lookup
+
+def write_table(path, fields, rows, version=0x03, language=0, deleted=()):
+    # dBase table of (name, type, length) fields; str values are written
+    # as ASCII, bytes as they are. Row numbers in deleted are marked
+    # deleted.
+    header_len = 32 + 32 * len(fields) + 1
+    record_len = 1 + sum(length for _, _, length in fields)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<BBBBIHH17xB2x', version, 124, 1, 1, len(rows), header_len, record_len, language))
+        for name, field_type, length in fields:
+            f.write(struct.pack('<11sc4xBB14x', name.encode('ascii'), field_type.encode('ascii'), length, 0))
+        f.write(b'\r')
+        for number, row in enumerate(rows):
+            f.write(b'*' if number in deleted else b' ')
+            for (_, field_type, length), value in zip(fields, row):
+                if not isinstance(value, bytes):
+                    value = str(value).encode('ascii')
+                f.write(value.rjust(length) if field_type in ('N', 'M') else value.ljust(length)[:length])
+        f.write(b'\x1a')
+
+def close_readers(all_data):
+    for data in all_data.values():
+        if isinstance(data['reader'], lookup.DBFReader):
+            data['reader'].close()
+
+def results_by_file(results):
+    return {result['filename']: (list(result['matches'].recnos), [dict(record) for record in result['matches']])
+            for result in results}
+
+STOCK_FIELDS = [('PARTNO', 'C', 20), ('QTY', 'N', 6)]
+STOCK_PARTS = ['AN3-4A', 'MS20995C32', 'NAS1149F0363P', '123456-01', 'AN960-10L', 'MS21042L3']
+
+def stock_rows(count, parts=STOCK_PARTS):
+    return [(parts[i % len(parts)], i % 7) for i in range(count)]
+
+def write_stock_dir(tmp_path, count=300, parts=STOCK_PARTS):
+    # AirDataDatabase folder holding only INVENT.DBF
+    data_dir = tmp_path / 'AirDataDatabase'
+    data_dir.mkdir()
+    write_table(str(data_dir / 'INVENT.DBF'), STOCK_FIELDS, stock_rows(count, parts))
+    return str(data_dir)
+
+def make_data_dir(tmp_path, records=3000, seed=1):
+    # AirDataDatabase folder with the three benchmark tables and the stock
+    # workbook, sharing one list of part numbers
+    data_dir = tmp_path / 'AirDataDatabase'
+    data_dir.mkdir()
+    rng = random.Random(seed)
+    parts = [bench.part_number(rng) for _ in range(records // 10)]
+    for number, name in enumerate(bench.TABLES):
+        bench.write_dbf(str(data_dir / name), bench.TABLES[name], records, parts, seed + number)
+    bench.write_xlsx(str(data_dir / lookup.EXCEL_FILES[0]), records // 2, parts, seed)
+    return str(data_dir), parts
+
+# Parse cache
+
+def test_parse_cache_round_trip_and_invalidation(tmp_path, monkeypatch):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, STOCK_FIELDS, stock_rows(300), deleted={5, 77})
+    cache = lookup.ParsedCache()
+    try:
+        reader, index = lookup.open_reader(lookup.DBFReader, path, cache)
+        expected = [dict(record) for record in reader.records]
+        reader.close()
+        assert len(expected) == 298
+
+        # A current entry is restored without parsing the file again
+        with monkeypatch.context() as patched:
+            patched.setattr(lookup.DBFReader, 'read_dbf', None)
+            cached, cached_index = lookup.open_reader(lookup.DBFReader, path, cache)
+        assert [dict(record) for record in cached.records] == expected
+        for part in STOCK_PARTS + ['AN', '-']:
+            assert cached_index.search(part) == index.search(part)
+        cached.close()
+
+        # A changed file is parsed again and its entry replaced
+        write_table(path, STOCK_FIELDS, stock_rows(400))
+        signature = lookup.ParsedCache.signature(path)
+        assert cache.load(path, signature) is None
+        reader, _ = lookup.open_reader(lookup.DBFReader, path, cache)
+        assert len(reader.records) == 400
+        reader.close()
+        assert cache.load(path, signature) is not None
+
+        # A damaged entry is ignored
+        cache.conn.execute('UPDATE parsed SET payload = ?', (b'\x10\0\0\0{"reader"',))
+        cache.conn.commit()
+        assert cache.load(path, signature) is None
+        reader, _ = lookup.open_reader(lookup.DBFReader, path, cache)
+        assert len(reader.records) == 400
+        reader.close()
+    finally:
+        cache.close()
+
+def test_encode_state_round_trip():
+    state = {'ids': lookup.array('I', [1, 5, 70000]), 'costs': lookup.array('d', [0.5, 2.25]),
+             'deleted': {3, 1}, 'rows': range(2, 9, 3), 'names': ['AN3', None]}
+    assert lookup.decode_state(lookup.encode_state(state)) == state
+    for payload in (b'', b'\xff\0\0\0{}', lookup.encode_state(state)[:-4]):
+        with pytest.raises(ValueError):
+            lookup.decode_state(payload)
+
+# Part index
+
+def test_part_index_search_equals_substring_scan(tmp_path):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, STOCK_FIELDS, stock_rows(500), deleted={3, 250})
+    reader = lookup.DBFReader(path)
+    try:
+        index = lookup.PartIndex.build(reader)
+        for query in STOCK_PARTS + ['an', '-', 'MS2', '0363', 'C32', 'NOPE', '']:
+            expected = [recno for recno, (value,) in reader.iter_records(columns=['PARTNO'])
+                        if query.upper() in value.upper()]
+            assert index.search(query) == expected, query
+    finally:
+        reader.close()
+
+# Process pool
+
+def test_pool_parsing_equals_direct_parsing(tmp_path, monkeypatch, capsys):
+    data_dir = write_stock_dir(tmp_path, count=5000)
+    monkeypatch.setattr(lookup, 'POOL_FILE_SECONDS', 0)
+    monkeypatch.setattr(lookup, 'POOL_MIN_SECONDS', 0)
+    # Small chunks so that the partial indexes are merged
+    monkeypatch.setattr(lookup, 'DBF_CHUNK_RECORDS', 1500)
+    submitted = []
+    submit_parse = lookup.submit_parse
+
+    def submit(pool, reader_class, filepath, *args):
+        submitted.append(os.path.basename(filepath))
+        return submit_parse(pool, reader_class, filepath, *args)
+    monkeypatch.setattr(lookup, 'submit_parse', submit)
+
+    def load(workers):
+        monkeypatch.setenv('PARTLOOKUP_CACHE_DIR', str(tmp_path / f'cache{workers}'))
+        return dict(lookup.load_sources(data_dir, workers=workers))
+
+    direct, pooled = load(1), load(2)
+    try:
+        assert submitted == ['INVENT.DBF']
+        assert 'failed' not in capsys.readouterr().out
+        expected, found = direct['INVENT.DBF'], pooled['INVENT.DBF']
+        assert [dict(record) for record in found['records']] == [dict(record) for record in expected['records']]
+        for part in STOCK_PARTS + ['AN3', 'NO-SUCH-PART']:
+            assert found['index'].search(part) == expected['index'].search(part), part
+    finally:
+        close_readers(direct)
+        close_readers(pooled)
+
+# Column table
+
+def test_column_table_rows_and_state():
+    table = lookup.ColumnTable('_sheet')
+    first = table.add_group('STOCK', ['PART NUMBER', 'QTY'])
+    table.append(first, ('AN3-4A', '5'))
+    table.append(first, ('MS20995C32',))
+    second = table.add_group('QUOTES', ['PART NUMBER', 'PRICE'])
+    table.append(second, ('AN3-4A', '1.25'))
+    rows = [{'PART NUMBER': 'AN3-4A', 'QTY': '5', '_sheet': 'STOCK'},
+            {'PART NUMBER': 'MS20995C32', 'QTY': '', '_sheet': 'STOCK'},
+            {'PART NUMBER': 'AN3-4A', 'PRICE': '1.25', '_sheet': 'QUOTES'}]
+    assert [dict(row) for row in table] == rows
+    assert 'PRICE' not in table[0] and 'QTY' not in table[-1]
+    assert table.column('QTY') == ['5', '', '']
+    assert table.column('_sheet') == ['STOCK', 'STOCK', 'QUOTES']
+    # Repeated values are stored once
+    assert table.column('PART NUMBER')[0] is table.column('PART NUMBER')[2]
+    with pytest.raises(IndexError):
+        table[3]
+
+    table.compact()
+    restored = lookup.ColumnTable.from_state(lookup.decode_state(lookup.encode_state(table.get_state())))
+    assert [dict(row) for row in restored] == rows
+
+    other = lookup.ColumnTable('_sheet')
+    other.append(other.add_group('KITS', ['PART NUMBER', 'KIT']), ('MS21042L3', 'K1'))
+    restored.extend(other)
+    assert [dict(row) for row in restored] == rows + [{'PART NUMBER': 'MS21042L3', 'KIT': 'K1', '_sheet': 'KITS'}]
+    assert restored.column('KIT') == ['', '', '', 'K1']
+
+# Refresh
+
+def rewrite_in_place(path, data):
+    # Overwrite the file without replacing it, as the ERP does, so open
+    # readers keep their handle
+    with open(path, 'r+b') as f:
+        f.write(data)
+
+def write_refresh_table(path, count, parts):
+    # Stock table whose records cycle through parts, one in 50 deleted
+    write_table(path, STOCK_FIELDS, stock_rows(count, parts), deleted=set(range(49, count, 50)))
+
+def test_refresh_reports_appended_deleted_and_recalled(tmp_path):
+    parts = STOCK_PARTS[:4]
+    path = str(tmp_path / 'INVENT.DBF')
+    write_refresh_table(path, 1000, parts)
+    reader = lookup.DBFReader(path)
+    try:
+        index = lookup.PartIndex.build(reader)
+        assert reader.refresh() == ([], [], [])
+
+        # The first 1000 records stay as they were
+        write_refresh_table(path + '.new', 1100, parts)
+        with open(path + '.new', 'rb') as f:
+            data = bytearray(f.read())
+        record_len = 1 + sum(length for _, _, length in STOCK_FIELDS)
+        header_len = 32 + 32 * len(STOCK_FIELDS) + 1
+        data[header_len + 3 * record_len] = ord('*')
+        data[header_len + 49 * record_len] = ord(' ')
+        rewrite_in_place(path, data)
+
+        appended, deleted, recalled = reader.refresh()
+        assert appended == [recno for recno in range(1000, 1100) if recno % 50 != 49]
+        assert deleted == [3]
+        assert recalled == [49]
+        assert len(reader.records) == 1100 - 1100 // 50
+
+        index.update(reader, appended, deleted, recalled)
+        fresh = lookup.DBFReader(path)
+        try:
+            rebuilt = lookup.PartIndex.build(fresh)
+            for part in parts:
+                assert index.search(part) == rebuilt.search(part)
+            assert [dict(record) for record in reader.records] == [dict(record) for record in fresh.records]
+        finally:
+            fresh.close()
+    finally:
+        reader.close()
+
+def test_refresh_asks_for_a_reload_when_records_disappear(tmp_path):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_refresh_table(path, 500, ['AN3-4A'])
+    reader = lookup.DBFReader(path)
+    try:
+        write_refresh_table(path + '.new', 400, ['AN3-4A'])
+        with open(path + '.new', 'rb') as f:
+            data = f.read()
+        rewrite_in_place(path, data)
+        assert reader.refresh() is None
+    finally:
+        reader.close()
+
+
+# Near matches
+
+NEAR_PARTS = ['MS20995C32', 'MS20995C23', 'MS20995-C320', 'NAS1149F0363P', 'NAS1149F0368P',
+              'AN960-10L', 'AN960-IOL', 'MS21042L3', '123456-01', 'M520995C32']
+
+def test_near_equals_brute_force_edit_distance(tmp_path):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, STOCK_FIELDS, stock_rows(200, NEAR_PARTS))
+    reader = lookup.DBFReader(path)
+    try:
+        index = lookup.PartIndex.build(reader)
+        index.build_fuzzy()
+        keys = [(recno, lookup.normalize_part(record['PARTNO']))
+                for recno, record in zip(reader._recnos, reader.records)]
+        for query in ('MS20995C33', 'NAS1149F0365P', 'AN960-1OL', 'MS-21042-L4', 'QQ99999999'):
+            for fold in (False, True):
+                target = lookup.normalize_part(query, fold)
+                limit = lookup.default_max_distance(target)
+                expected = [recno for recno, key in keys
+                            if lookup.edit_distance(target, lookup.fold_part_key(key) if fold else key, limit) <= limit]
+                assert index.near(query, fold=fold) == expected, (query, fold)
+    finally:
+        reader.close()
+
+def test_find_matches_falls_back_to_near_matches(tmp_path):
+    data_dir = write_stock_dir(tmp_path, parts=NEAR_PARTS)
+    all_data = dict(lookup.load_sources(data_dir))
+    try:
+        results, near = lookup.find_matches(all_data, 'MS-20995-C32')
+        assert not near
+        assert {lookup.normalize_part(record['PARTNO']) for record in results[0]['matches']} == \
+            {'MS20995C32', 'MS20995C320'}
+        results, near = lookup.find_matches(all_data, 'NAS1149F0367P')
+        assert near
+        assert {record['PARTNO'] for record in results[0]['matches']} == {'NAS1149F0363P', 'NAS1149F0368P'}
+    finally:
+        close_readers(all_data)
+
+
+# Cancellation
+
+def test_cancelled_search_raises(tmp_path):
+    data_dir = write_stock_dir(tmp_path, count=20000)
+    all_data = dict(lookup.load_sources(data_dir))
+    try:
+        with pytest.raises(lookup.SearchCancelled):
+            lookup.find_matches(all_data, 'AN3', cancel=lambda: True)
+        # Cancelled while scanning the file, not only between files
+        polls = []
+        def cancel():
+            polls.append(None)
+            return len(polls) > 1
+        with pytest.raises(lookup.SearchCancelled):
+            lookup.find_matches(all_data, 'A', cancel=cancel)
+        assert len(polls) == 2
+        assert results_by_file(lookup.find_matches(all_data, 'AN3', cancel=lambda: False)[0]) == \
+            results_by_file(lookup.find_matches(all_data, 'AN3')[0])
+    finally:
+        close_readers(all_data)
+
+# Batch mode
+
+def run_batch(tmp_path, data_dir, lines, *options):
+    source = tmp_path / 'parts.txt'
+    source.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    output = tmp_path / 'out'
+    assert lookup.main(['--batch', str(source), '--output', str(output), '--data-dir', data_dir] + list(options)) == 0
+    return output.read_text(encoding='utf-8')
+
+def test_batch_csv_and_jsonl_output(tmp_path):
+    data_dir = write_stock_dir(tmp_path, count=12)
+    lines = ['an3-4a', '', 'NO-SUCH-PART,ignored']
+    rows = list(csv.reader(io.StringIO(run_batch(tmp_path, data_dir, lines, '--exact'))))
+    assert rows[0] == lookup.BATCH_COLUMNS
+    assert rows[1:] == [['AN3-4A', 'exact', 'INVENT.DBF', '', str(recno + 1), 'AN3-4A', f'PARTNO: AN3-4A; QTY: {recno % 7}']
+                        for recno in (0, 6)] + [['NO-SUCH-PART', 'none', '', '', '', '', '']]
+
+    records = [json.loads(line) for line in run_batch(tmp_path, data_dir, lines, '--format', 'jsonl').splitlines()]
+    assert records == [{'query': 'AN3-4A', 'match': 'match', 'file': 'INVENT.DBF', 'sheet': '', 'record': recno + 1,
+                        'part_number': 'AN3-4A', 'fields': {'PARTNO': 'AN3-4A', 'QTY': recno % 7}}
+                       for recno in (0, 6)] + [
+        {'query': 'NO-SUCH-PART', 'match': 'none', 'file': '', 'sheet': '', 'record': '', 'part_number': '', 'fields': {}}]
+
+def test_batch_reports_missing_input(tmp_path, capsys):
+    data_dir = write_stock_dir(tmp_path)
+    assert lookup.main(['--batch', str(tmp_path / 'missing.txt'), '--data-dir', data_dir]) == 2
+    assert 'cannot read' in capsys.readouterr().err
+
+# Alternates
+
+def write_alternates_dir(tmp_path, fields, pairs):
+    data_dir = write_stock_dir(tmp_path, count=60)
+    write_table(os.path.join(data_dir, 'ALTPART.DBF'), fields, pairs)
+    return data_dir
+
+def test_alternate_families_are_transitive(tmp_path):
+    pairs = [('AN3-4A', 'MS20995C32'), ('MS20995-C32', 'NAS1149F0363P'), ('123456-01', 'AN960-10L')]
+    data_dir = write_alternates_dir(tmp_path, [('PARTNO', 'C', 20), ('ALTPARTNO', 'C', 20), ('ATTRIBUTE', 'C', 4)],
+                                    [pair + ('',) for pair in pairs])
+    all_data = lookup.load_all(data_dir)
+    try:
+        family = ['AN3-4A', 'MS20995C32', 'NAS1149F0363P']
+        for part in family + ['nas-1149-f0363p']:
+            assert lookup.alternate_family(all_data, part) == family
+        assert lookup.alternate_family(all_data, '123456-01') == ['123456-01', 'AN960-10L']
+        assert lookup.alternate_family(all_data, 'MS21042L3') == []
+
+        results, _ = lookup.find_matches(all_data, 'AN3-4A', exact=True, alternates=True)
+        matched = {record['PARTNO'] for result in results if result['filename'] == 'INVENT.DBF'
+                   for record in result['matches']}
+        assert matched == set(family)
+    finally:
+        close_readers(all_data)
+
+def test_alternates_without_a_pair_of_columns(tmp_path, capsys):
+    data_dir = write_alternates_dir(tmp_path, [('PN', 'C', 20), ('QTY', 'N', 4)], [('AN3-4A', 1)])
+    all_data = lookup.load_all(data_dir)
+    try:
+        assert all_data['ALTPART.DBF']['alternates'].columns is None
+        assert 'no pair of part number columns' in capsys.readouterr().err
+        assert lookup.alternate_family(all_data, 'AN3-4A') == []
+    finally:
+        close_readers(all_data)
+
+# Workbooks
+
+def write_openpyxl_workbook(path):
+    # Workbook saved by openpyxl itself, with the value types exports hold
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'STOCK'
+    sheet.append(['PART NUMBER', 'DESCRIPTION', 'QTY', 'COST', 'RECEIVED', 'SERIAL'])
+    sheet.append(['AN3-4A', 'BOLT', 12, 1.5, datetime.datetime(2021, 3, 4), True])
+    sheet.append([None, None, None, None, None, None])
+    sheet.append(['MS20995C32', None, 0, 0.125, datetime.date(2019, 12, 31), 'SN 7'])
+    sheet.append([123456, 'SHORT ROW'])
+    quotes = workbook.create_sheet('QUOTES')
+    quotes.append(['PART NUMBER', None, 'PRICE'])
+    quotes.append(['NAS1149F0363P', 'ignored', 2.75])
+    workbook.create_sheet('EMPTY')
+    workbook.save(path)
+
+def openpyxl_rows(path):
+    assert lookup.import_openpyxl()
+    reader = lookup.ExcelReader(path, load=False)
+    reader.load_rows(reader._iter_openpyxl_rows())
+    return reader.fields, [dict(record) for record in reader.records]
+
+@pytest.mark.parametrize('kind', ['openpyxl', 'export'])
+def test_streaming_workbook_rows_equal_openpyxl(tmp_path, kind):
+    path = str(tmp_path / lookup.EXCEL_FILES[0])
+    if kind == 'openpyxl':
+        write_openpyxl_workbook(path)
+    else:
+        bench.write_xlsx(path, 500, STOCK_PARTS, sheets=3)
+    reader = lookup.ExcelReader(path)
+    fields, rows = openpyxl_rows(path)
+    assert rows
+    assert reader.fields == fields
+    assert [dict(record) for record in reader.records] == rows
+
+def test_workbook_sheets_read_in_the_pool(tmp_path, monkeypatch, capsys):
+    data_dir = tmp_path / 'AirDataDatabase'
+    data_dir.mkdir()
+    bench.write_xlsx(str(data_dir / lookup.EXCEL_FILES[0]), 3000, STOCK_PARTS, sheets=3)
+    monkeypatch.setattr(lookup, 'POOL_FILE_SECONDS', 0)
+    monkeypatch.setattr(lookup, 'POOL_MIN_SECONDS', 0)
+    pooled = dict(lookup.load_sources(str(data_dir), workers=2))[lookup.EXCEL_FILES[0]]
+    assert 'failed' not in capsys.readouterr().out
+    assert pooled['stats']['source'] == 'pool'
+    direct = lookup.ExcelReader(pooled['path'])
+    assert pooled['reader'].fields == direct.fields
+    assert [dict(record) for record in pooled['records']] == [dict(record) for record in direct.records]
+    assert pooled['index'].match('AN3') == lookup.PartIndex.build(direct).match('AN3')
+
+# Memo files
+
+MEMOS = ['First memo\r\nwith two lines', '', 'x' * 700 + ' long', 'Last one']
+# As DBFReader returns them, with CR LF line ends read as LF
+MEMO_TEXT = [memo.replace('\r\n', '\n') for memo in MEMOS]
+
+def write_memo_table(folder, kind):
+    # INVENT.DBF with a NOTES memo column holding MEMOS, in a dBase III or
+    # IV .DBT, a FoxPro .FPT or a Visual FoxPro .FPT with binary pointers
+    base = os.path.join(folder, 'INVENT')
+    pointers = []
+    if kind == 'dbt3':
+        block, data = 512, bytearray(struct.pack('<I', 1).ljust(512, b'\0'))
+    elif kind == 'dbt4':
+        block, data = 64, bytearray(512)
+        data[20:22] = struct.pack('<H', block)
+    else:
+        block, data = 64, bytearray(512)
+        data[6:8] = struct.pack('>H', block)
+    for memo in MEMOS:
+        if not memo:
+            pointers.append(0 if kind == 'vfp' else '')
+            continue
+        pointers.append(len(data) // block)
+        if kind == 'dbt3':
+            chunk = memo.encode('ascii') + b'\x1a\x1a'
+        elif kind == 'dbt4':
+            chunk = lookup.DBT4_BLOCK_START + struct.pack('<I', len(memo) + 8) + memo.encode('ascii')
+        else:
+            chunk = struct.pack('>II', 1, len(memo)) + memo.encode('ascii')
+        data += chunk + b'\0' * (-len(chunk) % block)
+    extension = '.DBT' if kind.startswith('dbt') else '.FPT'
+    with open(base + extension, 'wb') as f:
+        f.write(bytes(data))
+    version = {'dbt3': 0x83, 'dbt4': 0x8B, 'fpt': 0xF5, 'vfp': 0x30}[kind]
+    length = 4 if kind == 'vfp' else 10
+    rows = [(f'PN-{i}', f'Desc {i}', struct.pack('<I', pointer) if kind == 'vfp' else str(pointer))
+            for i, pointer in enumerate(pointers)]
+    write_table(base + '.DBF', [('PARTNO', 'C', 20), ('DESCRIP', 'C', 20), ('NOTES', 'M', length)], rows, version)
+    return base + '.DBF'
+
+@pytest.mark.parametrize('kind', ['dbt3', 'dbt4', 'fpt', 'vfp'])
+def test_memo_fields(tmp_path, kind):
+    reader = lookup.DBFReader(write_memo_table(str(tmp_path), kind))
+    try:
+        assert [record['NOTES'] for record in reader.records] == MEMO_TEXT
+        assert [values for _, values in reader.iter_records(columns=['PARTNO', 'NOTES'])] == \
+            [(f'PN-{i}', memo) for i, memo in enumerate(MEMO_TEXT)]
+        assert reader.text_values(0, ['NOTES']) == (MEMO_TEXT[0],)
+    finally:
+        reader.close()
+
+# Codepages
+
+@pytest.mark.parametrize('language, codepage, text', [
+    (0x03, 'cp1252', 'JUNTA TÓRICA Ø12'),
+    (0xC9, 'cp1251', 'ПРОКЛАДКА'),
+    (0x02, 'cp850', 'ARANDELA Ñ'),
+])
+def test_codepage_from_language_driver(tmp_path, language, codepage, text):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, [('PARTNO', 'C', 20), ('DESCRIP', 'C', 30)], [('AN3-4A', text.encode(codepage))],
+                language=language)
+    reader = lookup.DBFReader(path)
+    try:
+        assert reader.codepage == codepage
+        assert reader.records[0]['DESCRIP'] == text
+        assert reader.text_values(0, ['DESCRIP']) == (text,)
+    finally:
+        reader.close()
+
+def test_codepage_default_and_override(tmp_path, monkeypatch):
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, [('PARTNO', 'C', 20), ('DESCRIP', 'C', 30)], [('AN3-4A', 'ÉTANCHÉITÉ'.encode('cp850'))])
+    reader = lookup.DBFReader(path)
+    assert reader.codepage == 'cp437'
+    reader.close()
+    monkeypatch.setenv('PARTLOOKUP_CODEPAGE', 'cp850')
+    reader = lookup.DBFReader(path)
+    try:
+        assert reader.records[0]['DESCRIP'] == 'ÉTANCHÉITÉ'
+    finally:
+        reader.close()
+
+# Index files
+
+KEY_LENGTH = 20
+
+def _groups(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def write_ndx(path, keys, expression=b'UPPER(PARTNO)'):
+    # dBase III .NDX of sorted (key, 1-based recno) pairs; 512-byte pages
+    entry_size = 8 + KEY_LENGTH
+    per_page = (512 - 8) // entry_size
+    pages = []
+    level = []
+    for group in _groups(keys, per_page):
+        pages.append(struct.pack('<I', len(group)) + b''.join(struct.pack('<II', 0, recno) + key
+                                                            for key, recno in group))
+        level.append((group[-1][0], len(pages)))
+    while len(level) > 1:
+        upper = []
+        for group in _groups(level, per_page):
+            pages.append(struct.pack('<I', len(group) - 1)
+                         + b''.join(struct.pack('<II', child, 0) + key for key, child in group[:-1])
+                         + struct.pack('<I', group[-1][1]))
+            upper.append((group[-1][0], len(pages)))
+        level = upper
+    header = (struct.pack('<III', level[0][1], len(pages) + 1, 0)
+              + struct.pack('<HHHH', KEY_LENGTH, per_page, 0, entry_size) + b'\0' * 4 + expression)
+    with open(path, 'wb') as f:
+        f.write(header.ljust(512, b'\0'))
+        for page in pages:
+            f.write(page.ljust(512, b'\0'))
+
+def write_mdx(path, keys, expression=b'UPPER(PARTNO)', tag=b'PARTNO'):
+    # dBase IV .MDX with one tag; 1024-byte blocks numbered in 512-byte
+    # units from 4
+    block_size = 1024
+    entry_size = 4 + KEY_LENGTH
+    per_block = (block_size - 12) // entry_size
+    blocks = []
+
+    def add(block):
+        blocks.append(block)
+        return 4 + (len(blocks) - 1) * (block_size // 512)
+
+    level = [(group[-1][0], add(struct.pack('<II', len(group), 0)
+                                 + b''.join(struct.pack('<I', recno) + key for key, recno in group) + b'\0' * 4))
+             for group in _groups(keys, per_block)]
+    while len(level) > 1:
+        level = [(group[-1][0], add(struct.pack('<II', len(group) - 1, 0)
+                                     + b''.join(struct.pack('<I', child) + key for key, child in group[:-1])
+                                     + struct.pack('<I', group[-1][1])))
+                 for group in _groups(level, per_block)]
+    head = bytearray(2048)
+    head[0] = 2
+    head[4:20] = b'INVENT'.ljust(16, b'\0')
+    head[20:24] = struct.pack('<HH', 2, block_size)
+    head[24:27] = bytes((1, 48, 32))
+    head[28:30] = struct.pack('<H', 1)
+    head[544:548] = struct.pack('<I', 2)
+    head[548:548 + len(tag)] = tag
+    head[564] = ord('C')
+    tag_header = (struct.pack('<IIBcxxHHHH', level[0][1], 4 + len(blocks) * (block_size // 512), 0x10, b'C',
+                              KEY_LENGTH, per_block, 0, entry_size) + b'\0' * 4 + expression)
+    head[1024:1024 + len(tag_header)] = tag_header
+    with open(path, 'wb') as f:
+        f.write(bytes(head))
+        for block in blocks:
+            f.write(block.ljust(block_size, b'\0'))
+
+CDX_RECNO_BITS, CDX_DUP_BITS, CDX_TRAIL_BITS = 18, 7, 7
+
+def _cdx_leaf_nodes(entries, key_length):
+    # Split sorted (key, recno) entries into compressed leaf nodes of as
+    # many entries as fit: (entries, info bytes, key bytes)
+    def pack(group):
+        info = b''
+        data = b''
+        previous = b''
+        for key, recno in group:
+            stripped = key.rstrip(b' ')
+            dup = 0
+            while dup < min(len(previous), len(stripped)) and previous[dup] == stripped[dup]:
+                dup += 1
+            trail = key_length - len(stripped)
+            info += (recno | dup << CDX_RECNO_BITS | trail << (CDX_RECNO_BITS + CDX_DUP_BITS)).to_bytes(4, 'little')
+            data = stripped[dup:] + data
+            previous = key
+        return info, data
+
+    nodes = []
+    start = 0
+    while start < len(entries):
+        end = start + 1
+        best = None
+        while end <= len(entries):
+            info, data = pack(entries[start:end])
+            if 24 + len(info) + len(data) > 512:
+                break
+            best = (entries[start:end], info, data)
+            end += 1
+        nodes.append(best)
+        start += len(best[0])
+    return nodes
+
+def _cdx_tree(entries, key_length, base, nodes):
+    # Write the tree of entries into nodes from offset base; returns (root
+    # offset, next free offset)
+    leaves = _cdx_leaf_nodes(entries, key_length)
+    offsets = [base + i * 512 for i in range(len(leaves))]
+    free = base + len(leaves) * 512
+    level = []
+    for i, ((group, info, data), offset) in enumerate(zip(leaves, offsets)):
+        left = offsets[i - 1] if i else -1
+        right = offsets[i + 1] if i + 1 < len(offsets) else -1
+        body = struct.pack('<HHiiH', 3 if len(leaves) == 1 else 2, len(group), left, right,
+                           512 - 24 - len(info) - len(data))
+        body += struct.pack('<IBBBBBB', (1 << CDX_RECNO_BITS) - 1, (1 << CDX_DUP_BITS) - 1,
+                            (1 << CDX_TRAIL_BITS) - 1, CDX_RECNO_BITS, CDX_DUP_BITS, CDX_TRAIL_BITS, 4) + info
+        nodes[offset] = body + b'\0' * (512 - len(body) - len(data)) + data
+        level.append((group[-1][0], group[-1][1], offset))
+    while len(level) > 1:
+        groups = _groups(level, 500 // (key_length + 8))
+        offsets = [free + i * 512 for i in range(len(groups))]
+        free += len(groups) * 512
+        upper = []
+        for i, (group, offset) in enumerate(zip(groups, offsets)):
+            left = offsets[i - 1] if i else -1
+            right = offsets[i + 1] if i + 1 < len(offsets) else -1
+            body = struct.pack('<HHii', 1 if len(groups) == 1 else 0, len(group), left, right)
+            body += b''.join(key + struct.pack('>II', recno, child) for key, recno, child in group)
+            nodes[offset] = body.ljust(512, b'\0')
+            upper.append((group[-1][0], group[-1][1], offset))
+        level = upper
+    return level[0][2], free
+
+def _cdx_header(root, key_length, options, expression):
+    header = bytearray(1024)
+    header[0:8] = struct.pack('<Ii', root, -1)
+    header[12:14] = struct.pack('<H', key_length)
+    header[14:16] = bytes((options, 1))
+    header[510:512] = struct.pack('<H', len(expression) + 1)
+    header[512:512 + len(expression)] = expression
+    return bytes(header)
+
+def write_cdx(path, keys, expression=b'UPPER(PARTNO)', tag=b'PARTNO'):
+    # FoxPro .CDX with one tag: the tag directory at 0 and 1024, the tag
+    # header at 1536 and its tree after it
+    nodes = {}
+    root, end = _cdx_tree(keys, KEY_LENGTH, 2560, nodes)
+    _cdx_tree([(tag.ljust(10), 1536)], 10, 1024, nodes)
+    out = bytearray(end)
+    out[0:1024] = _cdx_header(1024, 10, 0x60, b'')
+    out[1536:2560] = _cdx_header(root, KEY_LENGTH, 0x20, expression)
+    for offset, node in nodes.items():
+        out[offset:offset + len(node)] = node
+    with open(path, 'wb') as f:
+        f.write(bytes(out))
+
+INDEX_WRITERS = {'ndx': ('INVPART.NDX', write_ndx), 'mdx': ('INVENT.MDX', write_mdx),
+                 'cdx': ('INVENT.CDX', write_cdx)}
+
+def _part_variant(rng, part):
+    # The part number as it may be typed into the ERP
+    choice = rng.randrange(8)
+    if choice == 0:
+        return part.replace('-', '')
+    if choice == 1:
+        return part.replace('-', ' ')
+    if choice == 2:
+        return '0' + part
+    if choice == 3:
+        return '00-' + part
+    if choice == 4:
+        return part.lower()
+    return part
+
+@pytest.fixture(params=sorted(INDEX_WRITERS))
+def indexed_table(request, tmp_path):
+    # INVENT.DBF with separator, leading zero and lower case variants of
+    # its part numbers, one record in 50 deleted, and an index on PARTNO
+    rng = random.Random(7)
+    base = [bench.part_number(rng) for _ in range(300)] + ['123', '0123', '1-23', 'A', '0', '0A0', '10', '010']
+    parts = [_part_variant(rng, rng.choice(base)) for _ in range(4000)]
+    path = str(tmp_path / 'INVENT.DBF')
+    write_table(path, [('PARTNO', 'C', KEY_LENGTH), ('QTY', 'N', 6)],
+                [(part, rng.randint(0, 99)) for part in parts], deleted=set(range(49, len(parts), 50)))
+    name, writer = INDEX_WRITERS[request.param]
+    writer(str(tmp_path / name), sorted((part.upper().encode('ascii').ljust(KEY_LENGTH), recno + 1)
+                                        for recno, part in enumerate(parts)))
+    return path, base, parts
+
+def test_index_tag_seek_matches_brute_force(indexed_table):
+    # Every record the tag holds, deleted ones included, with 1-based
+    # record numbers
+    path, base, parts = indexed_table
+    reader = lookup.DBFReader(path)
+    try:
+        tag = reader.index_tags()['PARTNO']
+        for key in sorted({part.upper() for part in parts})[::11] + ['AN', '0', 'NOPE']:
+            exact = [recno + 1 for recno, part in enumerate(parts) if part.upper() == key]
+            prefix = [recno + 1 for recno, part in enumerate(parts) if part.upper().startswith(key)]
+            assert sorted(tag.seek(key.encode('ascii'))) == exact, key
+            assert sorted(tag.seek(key.encode('ascii'), prefix=True)) == prefix, key
+    finally:
+        reader.close()
+
+def test_seek_index_matches_brute_force(indexed_table):
+    path, base, _ = indexed_table
+    reader, index = lookup.open_seek_index(path)
+    try:
+        values = list(reader.iter_records(columns=['PARTNO']))
+        queries = base[::7] + ['0123', '1 2 3', '00010', 'an', 'NOPE', '-']
+        for query in queries:
+            key = lookup.normalize_part(query)
+            exact = [recno for recno, (value,) in values if key and lookup.normalize_part(value) == key]
+            assert index.match(query, exact=True) == exact, query
+            prefix = [recno for recno, (value,) in values if value.upper().startswith(query.upper())]
+            assert index.match(query, prefix=True) == prefix, query
+        # Answered from the index file, without building the PartIndex
+        assert index.index is None
+    finally:
+        reader.close()
+
+def test_seek_index_falls_back_for_substring_search(indexed_table):
+    path, base, _ = indexed_table
+    reader, index = lookup.open_seek_index(path)
+    try:
+        expected = lookup.PartIndex.build(reader).match(base[0][2:6])
+        assert index.match(base[0][2:6]) == expected
+        assert index.index is not None
+    finally:
+        reader.close()
+
+# Snapshot
+
+def test_snapshot_results_equal_direct_loading(tmp_path):
+    data_dir, parts = make_data_dir(tmp_path)
+    direct = lookup.load_all(data_dir)
+    assert lookup.compile_snapshot(data_dir) > 0
+    compiled = lookup.load_all(data_dir)
+    try:
+        assert sorted(compiled) == sorted(direct)
+        for data in compiled.values():
+            assert isinstance(data['reader'], lookup.SnapshotReader)
+
+        queries = [(part, {}) for part in parts[:20]] + [
+            (parts[0], {'exact': True}), (parts[1][:4], {'prefix': True}), (parts[2][3:7], {}),
+            (lookup.normalize_part(parts[3]), {'exact': True}), ('AN3-4X9Z', {})]
+        for query, options in queries:
+            expected, expected_near = lookup.find_matches(direct, query, **options)
+            found, near = lookup.find_matches(compiled, query, **options)
+            assert near == expected_near, query
+            assert results_by_file(found) == results_by_file(expected), query
+
+        for query in ('QTY>400', f'{parts[0]} COST<2500', 'FILE=POITEM.DBF PODATE>=2020-06'):
+            assert results_by_file(lookup.run_query(compiled, query)) == \
+                results_by_file(lookup.run_query(direct, query)), query
+
+        for filename, data in direct.items():
+            reader = compiled[filename]['reader']
+            columns = lookup.reader_columns(data['reader'])
+            assert list(reader.iter_records(columns=columns)) == \
+                list(data['reader'].iter_records(columns=columns)), filename
+            assert list(reader.iter_records(100, 150)) == list(data['reader'].iter_records(100, 150))
+            assert reader.records[-1] == dict(data['reader'].records[-1])
+    finally:
+        close_readers(direct)
+        close_readers(compiled)
+
+def test_snapshot_is_bypassed_for_changed_files(tmp_path):
+    data_dir, parts = make_data_dir(tmp_path, records=500)
+    lookup.compile_snapshot(data_dir)
+    bench.write_dbf(os.path.join(data_dir, 'INVENT.DBF'), bench.TABLES['INVENT.DBF'], 600, parts, seed=9)
+    all_data = lookup.load_all(data_dir)
+    try:
+        assert isinstance(all_data['INVENT.DBF']['reader'], lookup.DBFReader)
+        assert isinstance(all_data['POITEM.DBF']['reader'], lookup.SnapshotReader)
+    finally:
+        close_readers(all_data)
+
+# Column schema
+
+def test_schema_key_display_and_drop_columns(tmp_path):
+    data_dir = write_stock_dir(tmp_path, count=0)
+    write_table(os.path.join(data_dir, 'INVENT.DBF'), [('PARTNO', 'C', 20), ('NSN', 'C', 16), ('NOTES', 'C', 20),
+                                                       ('QTY', 'N', 4)],
+                [('AN3-4A', '5306-00-151-1412', 'SEE MS20995C32', 3), ('MS21042L3', '', '', 1)])
+    write_table(os.path.join(data_dir, 'ALTPART.DBF'), [('PART_A', 'C', 20), ('PART_B', 'C', 20), ('PART_C', 'C', 20)],
+                [('AN3-4A', 'MS21042L3', 'NAS1149F0363P')])
+    with open(os.path.join(data_dir, lookup.SCHEMA_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'invent.dbf': {'key': ['PARTNO', 'NSN'], 'display': ['QTY', 'PARTNO'], 'drop': ['NOTES']},
+                   'ALTPART.DBF': {'key': ['PART_B', 'PART_C']}}, f)
+    all_data = lookup.load_all(data_dir)
+    try:
+        data = all_data['INVENT.DBF']
+        assert [field['name'] for field in data['fields']] == ['QTY', 'PARTNO']
+        assert 'NOTES' not in data['records'][0]
+        assert [list(result['matches'].recnos) for result in lookup.find_matches(all_data, '5306-00-151')[0]] == [[0]]
+        assert lookup.find_matches(all_data, 'MS20995C32', near=False) == ([], False)
+        assert all_data['ALTPART.DBF']['alternates'].columns == ['PART_B', 'PART_C']
+        assert lookup.alternate_family(all_data, 'MS21042L3') == ['MS21042L3', 'NAS1149F0363P']
+        assert lookup.alternate_family(all_data, 'AN3-4A') == []
+    finally:
+        close_readers(all_data)
+    # A compiled snapshot pairs the same columns
+    lookup.compile_snapshot(data_dir)
+    compiled = lookup.load_all(data_dir)
+    try:
+        assert isinstance(compiled['ALTPART.DBF']['reader'], lookup.SnapshotReader)
+        assert compiled['ALTPART.DBF']['alternates'].columns == ['PART_B', 'PART_C']
+    finally:
+        close_readers(compiled)
+
+# Field queries
+
+@pytest.fixture
+def loaded(tmp_path):
+    data_dir, parts = make_data_dir(tmp_path)
+    all_data = lookup.load_all(data_dir, rollups=True)
+    yield all_data, parts
+    close_readers(all_data)
+
+def live_records(data):
+    reader = data['reader']
+    return list(zip(reader._recnos, reader.records))
+
+def query_recnos_by_file(all_data, query):
+    return {result['filename']: list(result['matches'].recnos) for result in lookup.run_query(all_data, query)}
+
+def test_cancelled_query_raises(loaded):
+    all_data, parts = loaded
+    with pytest.raises(lookup.SearchCancelled):
+        lookup.run_query(all_data, 'QTY>0', cancel=lambda: True)
+    query = f'{parts[0][:3]} QTY>0'
+    assert results_by_file(lookup.run_query(all_data, query, cancel=lambda: False)) == \
+        results_by_file(lookup.run_query(all_data, query))
+
+def test_parse_query():
+    part_number, conditions, files = lookup.parse_query('an3-4a FILE=INV* "PART NUMBER"=MS2* QTY>=5')
+    assert part_number == 'AN3-4A'
+    assert files == ['INV*']
+    assert [(c.field, c.op, c.value) for c in conditions] == [('PART NUMBER', '=', 'MS2*'), ('QTY', '>=', '5')]
+    for query in ('', 'QTY>', 'FILE>POITEM.DBF', 'DESCRIP="O-RING'):
+        with pytest.raises(lookup.QueryError):
+            lookup.parse_query(query)
+
+def test_query_number_and_date_ranges(loaded):
+    all_data, _ = loaded
+    expected = [recno for recno, record in live_records(all_data['POITEM.DBF'])
+                if record['QTY'] >= 100 and record['PODATE'] >= datetime.date(2020, 6, 1)
+                and record['PODATE'] < datetime.date(2023, 1, 1)]
+    assert expected
+    assert query_recnos_by_file(all_data, 'FILE=POITEM.DBF QTY>=100 PODATE>=2020-06 PODATE<=2022') == \
+        {'POITEM.DBF': expected}
+
+def test_query_part_number_with_conditions(loaded):
+    all_data, parts = loaded
+    part = parts[5]
+    found = query_recnos_by_file(all_data, f'{part} COST<2500')
+    matches = {result['filename']: set(result['matches'].recnos) for result in lookup.find_matches(all_data, part)[0]}
+    for filename in ('INVENT.DBF', 'POITEM.DBF'):
+        expected = [recno for recno, record in live_records(all_data[filename])
+                    if recno in matches.get(filename, ()) and record['COST'] < 2500]
+        assert expected
+        assert found.get(filename, []) == expected
+    # BUYQUOTE.DBF has no COST column and the workbook none either
+    assert set(found) <= {'INVENT.DBF', 'POITEM.DBF'}
+
+def test_query_text_values_and_prefixes(loaded):
+    all_data, _ = loaded
+    expected = [recno for recno, record in live_records(all_data['INVENT.DBF'])
+                if record['VENDOR'].upper().startswith('V12') and record['DESCRIP'] == 'O-RING']
+    assert expected
+    assert query_recnos_by_file(all_data, 'FILE=INVENT.DBF vendor=v12* DESCRIP=o-ring') == {'INVENT.DBF': expected}
+    workbook = all_data[lookup.EXCEL_FILES[0]]
+    expected = [recno for recno, record in enumerate(workbook['reader'].records) if record['CONDITION'] == 'OH']
+    assert query_recnos_by_file(all_data, 'FILE=INVENTORIO* CONDITION=oh') == {lookup.EXCEL_FILES[0]: expected}
+
+# Rollups
+
+def test_part_summary_equals_record_totals(loaded):
+    all_data, parts = loaded
+    for part in parts[:10]:
+        key = lookup.normalize_part(part)
+        def records(filename):
+            return [record for _, record in live_records(all_data[filename])
+                    if lookup.normalize_part(record['PARTNO']) == key]
+        stock = records('INVENT.DBF')
+        workbook = [record for record in all_data[lookup.EXCEL_FILES[0]]['reader'].records
+                    if lookup.normalize_part(record['PART NUMBER']) == key]
+        orders = records('POITEM.DBF')
+        quotes = records('BUYQUOTE.DBF')
+
+        summary = lookup.part_summary(all_data, part)
+        assert summary['on_hand'] == sum(record['QTY'] for record in stock) + sum(int(record['QTY'])
+                                                                                for record in workbook)
+        assert summary['orders'] == len(orders)
+        costs = [record['COST'] for record in orders if record['COST'] > 0]
+        assert summary['min_cost'] == (min(costs) if costs else None)
+        if costs:
+            last = max((record for record in orders if record['COST'] > 0), key=lambda record: record['PODATE'])
+            assert summary['last_date'] == last['PODATE'].isoformat()
+        assert summary['quotes'] == len(quotes)
+        prices = [record['PRICE'] for record in quotes if record['PRICE'] > 0]
+        assert summary['best_quote'] == (min(prices) if prices else None)
+    assert lookup.part_summary(all_data, 'NO-SUCH-PART') is None
+
+def test_rollup_update_after_refresh(loaded):
+    all_data, parts = loaded
+    data = all_data['INVENT.DBF']
+    reader = data['reader']
+    path = reader.filename
+    with open(path, 'rb') as f:
+        contents = bytearray(f.read())
+    # Delete the first record and recall the first deleted one
+    contents[reader.header_len] = ord('*')
+    contents[reader.header_len + 49 * reader.record_len] = ord(' ')
+    rewrite_in_place(path, contents)
+
+    appended, deleted, recalled = reader.refresh()
+    assert (appended, deleted, recalled) == ([], [0], [49])
+    data['index'].update(reader, appended, deleted, recalled)
+    data['rollup'].update(reader, data['index'], appended, deleted, recalled)
+    rollup = data['rollup']
+    rebuilt = lookup.PartRollup.build(reader, 'stock', data['index'].columns)
+    assert rollup.parts == rebuilt.parts
+    assert {key: sorted(keys) for key, keys in rollup.folded.items()} == \
+        {key: sorted(keys) for key, keys in rebuilt.folded.items()}
+    for recno in (0, 49):
+        key = lookup.normalize_part(reader.text_values(recno, ['PARTNO'])[0])
+        assert len(rollup.lookup(key, fold=True)) == len(rebuilt.lookup(key, fold=True)) == 1
+        assert rollup.lookup(key, fold=True) == rebuilt.lookup(key, fold=True)
+        assert lookup.part_summary(all_data, key, fold=True) == lookup.part_summary(all_data, key)